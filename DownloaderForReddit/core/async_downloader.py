@@ -0,0 +1,284 @@
+import sys
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .downloader import Downloader
+from .disk_space import InsufficientDiskSpace, DownloadDoesNotFit
+from .circuit_breaker import CircuitOpen, REQUEST_FAILURES
+from .cancellation import Cancelled
+from ..database import Content
+
+
+class AsyncDownloader(Downloader):
+
+    """
+    A download engine that runs every transfer as a task on a single asyncio event loop instead of handing each
+    content item to a download thread.  Because the tasks only yield while waiting on the network, hundreds of
+    transfers can be kept in flight without the thread and memory overhead of an equally large thread pool.  The
+    download queue protocol (content ids, 'HOLD', 'RELEASE_HOLD' and None) is the same as the threaded Downloader, and
+    the error handling and finishing of downloads is shared with it.
+    """
+
+    def __init__(self, download_queue, download_session_id, stop_run):
+        super().__init__(download_queue, download_session_id, stop_run)
+        self.download_limit = self.settings_manager.async_download_limit
+        # a single thread is used to wait on the blocking download queue so that the event loop is never blocked
+        self.queue_executor = ThreadPoolExecutor(1)
+        # multi-part downloads block while their ranges are downloaded by the multi-part scheduler, so they are waited
+        # on from these threads
+        self.multi_part_executor = ThreadPoolExecutor(self.multi_part_scheduler.max_in_flight)
+        # the tasks that are waiting on a multi-part download, which is stopped by its own threads
+        self.multi_part_tasks = set()
+        # database queries and file operations block, so they are run on these threads to keep the event loop free for
+        # the transfers that are in flight
+        self.io_executor = ThreadPoolExecutor(self.settings_manager.download_thread_count)
+        self.loop = None
+        self.client_session = None
+
+    @classmethod
+    def available(cls):
+        """Returns True if the libraries needed for the async engine are installed."""
+        return aiohttp is not None
+
+    def run(self):
+        """
+        Creates the event loop for the download session and runs the download loop on it until the downloader is told
+        to stop.
+        """
+        self.logger.debug('Async downloader running')
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.run_loop())
+        except:
+            self.logger.error('Async downloader failed', exc_info=True)
+        finally:
+            self.loop.close()
+            self.queue_executor.shutdown(wait=False)
+            self.io_executor.shutdown(wait=True)
+            self.multi_part_executor.shutdown(wait=True)
+            self.multi_part_scheduler.shutdown()
+            self.finish_image_hashes()
+        self.logger.debug('Async downloader exiting')
+
+    async def run_loop(self):
+        """
+        Removes content from the download queue and starts a download task for each item until the end of the queue is
+        reached.  The number of tasks in progress at once is limited by the async download limit setting.
+        """
+        limit = asyncio.Semaphore(self.download_limit)
+        connector = aiohttp.TCPConnector(limit=self.download_limit, limit_per_host=self.connection_pool.pool_size)
+        timeout = aiohttp.ClientTimeout(sock_connect=10, sock_read=10)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as self.client_session:
+            with self.stop_run.on_cancel(lambda: self.loop.call_soon_threadsafe(self.cancel_tasks)):
+                while self.continue_run:
+                    # the limit is acquired before taking an item so that the queue's priority order applies to
+                    # everything that has not started
+                    await limit.acquire()
+                    item = await self.loop.run_in_executor(self.queue_executor, self.download_queue.get)
+                    if item is not None:
+                        if item == 'HOLD':
+                            self.hold = True
+                            limit.release()
+                        elif item == 'RELEASE_HOLD':
+                            self.hold = False
+                            limit.release()
+                        elif self.continue_run:
+                            task = self.loop.create_task(self.download_async(item))
+                            task.add_done_callback(lambda t: self.finish_task(t, limit))
+                            self.futures.append(task)
+                        else:
+                            limit.release()
+                    else:
+                        break
+                if self.futures:
+                    await asyncio.wait(list(self.futures))
+
+    def finish_task(self, task, limit):
+        self.futures.remove(task)
+        limit.release()
+
+    def cancel_tasks(self):
+        """
+        Cancels the download tasks when the download session is stopped, so that transfers and waits are interrupted
+        instead of running until their next check of the stop.
+        """
+        for task in self.futures:
+            if task not in self.multi_part_tasks:
+                task.cancel()
+
+    async def run_blocking(self, function, *args):
+        """
+        Runs a blocking call, such as a database query or a file operation, in the io executor and waits for its result.
+        The call can not be interrupted, so a task that is cancelled while waiting on it still waits for it to return
+        before the cancellation is raised, so that the task's cleanup does not run alongside the call.
+        """
+        future = self.loop.run_in_executor(self.io_executor, function, *args)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            await asyncio.wait([future])
+            raise
+
+    async def download_async(self, content_id: int):
+        """
+        Connects to the content url and downloads the content item to the file path specified by the content item.
+        Files over the multi-part threshold are handed off to the multi-part downloader in a worker thread.
+        :param content_id: The id of the content item which is to be queried from the database, then downloaded.
+        """
+        with self.db.get_scoped_session() as session:
+            content = None
+            try:
+                content = await self.run_blocking(session.query(Content).get, content_id)
+                reservation = await self.run_blocking(self.disk_space_monitor.reservation, content.directory_path)
+                try:
+                    await self.download_reserved_async(content, reservation)
+                except CircuitOpen as e:
+                    await self.run_blocking(self.handle_circuit_open, content, e)
+                except Cancelled:
+                    await self.run_blocking(self.handle_download_stopped, content)
+                except DownloadDoesNotFit:
+                    await self.run_blocking(self.handle_insufficient_disk_space, content, reservation)
+                finally:
+                    await self.run_blocking(reservation.release)
+            except asyncio.CancelledError:
+                # the session was stopped before the download started, so it is left to be downloaded again
+                pass
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError, ConnectionError):
+                # the error is logged from the io executor, so the exception being handled is passed to it to be logged
+                if content is not None:
+                    await self.run_blocking(self.handle_connection_error, content, sys.exc_info())
+            except:
+                if content is not None:
+                    await self.run_blocking(self.handle_unknown_error, content, sys.exc_info())
+                else:
+                    self.logger.error('Failed to load content for download', extra={'content_id': content_id},
+                                      exc_info=True)
+
+    async def download_reserved_async(self, content: Content, reservation):
+        """The async counterpart to Downloader.download_reserved."""
+        while await self.wait_for_disk_space(reservation):
+            host = await self.acquire_host(content.url)
+            if host is None:
+                return
+            try:
+                multi_part = await self.download_content_async(content, reservation)
+            except InsufficientDiskSpace:
+                continue
+            finally:
+                self.host_limiter.release(host)
+            if multi_part is not None:
+                task = asyncio.current_task()
+                self.multi_part_tasks.add(task)
+                try:
+                    await self.loop.run_in_executor(self.multi_part_executor, self.download_multi_part, content,
+                                                    multi_part)
+                finally:
+                    self.multi_part_tasks.discard(task)
+            return
+
+    async def wait_for_disk_space(self, reservation):
+        """
+        Waits for the volume of a disk space reservation to have room for the download without blocking the event loop.
+        :return: True if there is room, or False if the download was stopped while waiting.
+        :raises DownloadDoesNotFit: If the download would not fit on the volume even if no other download was in
+                                    progress, and space has not been freed for it within the oversized wait.
+        """
+        while self.continue_run:
+            if await self.run_blocking(reservation.check):
+                return True
+            await asyncio.sleep(self.disk_space_monitor.POLL_INTERVAL)
+        return False
+
+    async def acquire_host(self, url):
+        """
+        Waits for a request slot from the host limiter without blocking the event loop.
+        :return: The host key the slot was acquired for, or None if the download was stopped while waiting.
+        """
+        start = None
+        while self.continue_run:
+            host, wait = self.host_limiter.try_acquire(url)
+            if wait == 0:
+                self.host_limiter.record_wait(host, time.monotonic() - start if start is not None else 0)
+                return host
+            if start is None:
+                start = time.monotonic()
+            await asyncio.sleep(wait)
+        return None
+
+    async def download_content_async(self, content: Content, reservation=None):
+        """
+        The async counterpart to Downloader.download_content.
+        :return: The partial download if it is to be downloaded by the multi-part downloader, otherwise None.
+        :raises Cancelled: If the task is cancelled by a stop while the content is requested or written.
+        """
+        try:
+            return await self.transfer_async(content, reservation)
+        except asyncio.CancelledError:
+            raise Cancelled()
+
+    async def transfer_async(self, content: Content, reservation=None):
+        partial = await self.run_blocking(self.get_partial_download, content)
+        if partial is not None and partial.complete:
+            await self.run_blocking(self.finish_partial_download, content, partial)
+            return None
+        source = await self.run_blocking(self.get_validator_source, content) if partial is None else None
+        headers = self.get_request_headers(partial, source)
+        failures = REQUEST_FAILURES + (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+        with self.circuit_breaker.guard(content.url, failures) as circuit:
+            async with self.client_session.get(content.url, headers=headers) as response:
+                circuit.record_response(response.status)
+                if response.status == 304 and source is not None:
+                    await self.run_blocking(self.finish_not_modified, content, source)
+                    return None
+                partial = await self.run_blocking(self.start_partial_download, content, partial, response.status,
+                                                  response.headers)
+                if partial is None:
+                    return None
+                if reservation is not None:
+                    await self.run_blocking(reservation.reserve, partial)
+                if partial.multi_part:
+                    end = await self.run_blocking(self.get_first_range_end, content, partial)
+                    if end is not None:
+                        await self.write_response_async(response, partial, end)
+                    return partial
+                await self.write_response_async(response, partial)
+        await self.run_blocking(self.finish_partial_download, content, partial)
+        return None
+
+    async def write_response_async(self, response, partial, end=None):
+        """
+        The async counterpart to Downloader.write_response.  The part file is opened, which hashes the bytes already
+        received when a download is resumed, written to and closed in the io executor.
+        """
+        file = await self.run_blocking(partial.open)
+        try:
+            async for chunk in response.content.iter_chunked(self.settings_manager.download_buffer_size):
+                if self.hard_stop:
+                    break
+                if end is not None:
+                    chunk = chunk[:end - partial.bytes_received]
+                if self.bandwidth_limiter.limited:
+                    # the limiter blocks, so it is waited on in a worker thread to keep the loop running
+                    await self.loop.run_in_executor(None, self.bandwidth_limiter.consume, len(chunk), partial.path,
+                                                    self.stop_run)
+                await self.run_blocking(self.write_chunk, file, partial, chunk)
+                if end is not None and partial.bytes_received >= end:
+                    break
+        finally:
+            await self.run_blocking(self.close_part_file, file, partial)
+
+    @staticmethod
+    def write_chunk(file, partial, chunk):
+        file.write(chunk)
+        partial.add(chunk)
+
+    @staticmethod
+    def close_part_file(file, partial):
+        file.close()
+        partial.save()
@@ -0,0 +1,152 @@
+import heapq
+import logging
+from datetime import datetime, time as day_time
+from itertools import count
+from threading import Condition
+from time import perf_counter
+
+from ..utils import injector
+
+
+class BandwidthLimiter:
+
+    """
+    Limits the combined rate at which all downloads receive data.  Download loops call consume with the size of each
+    chunk they receive, which blocks until the chunk fits within the limit.  Chunks are split into small quanta and the
+    quanta of different flows (one flow per file being downloaded) are released using start time fair queueing: each
+    flow's quanta are tagged with the virtual time at which the flow's previous quantum finished and the quantum with
+    the lowest tag is always released next.  This shares the bandwidth evenly between the files being downloaded, so a
+    small image is not held up behind the large chunks of a multi-part video download, and all of the ranges of a
+    multi-part download share the one flow of their file.
+
+    The limit is read from the settings manager for every quantum, so changes made in the settings dialog take effect
+    for a download session that is already running.
+    """
+
+    # the largest amount of data released at once, and the amount of time a quantum takes at the current limit
+    MAX_QUANTUM = 64 * 1024
+    QUANTUM_SECONDS = 0.1
+    # the number of seconds of unused bandwidth that may be used in a burst after a pause
+    BURST_SECONDS = 0.25
+    # how often waiting downloads check whether the limit has been changed
+    POLL_INTERVAL = 0.5
+
+    def __init__(self):
+        self.logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
+        self.condition = Condition()
+        self.waiting = []
+        self.sequence = count()
+        self.virtual_time = 0
+        self.flow_finish_tags = {}
+        self.next_release = perf_counter()
+
+    @property
+    def settings_manager(self):
+        return injector.get_settings_manager()
+
+    def get_limit(self, now=None):
+        """
+        Returns the current limit in bytes per second, taking the time of day schedule into account.
+        :return: The limit, or 0 if downloads are not limited.
+        """
+        if not self.settings_manager.limit_download_bandwidth:
+            return 0
+        if self.settings_manager.bandwidth_schedule_enabled and self.in_schedule(now or datetime.now()):
+            return max(0, int(self.settings_manager.bandwidth_schedule_limit))
+        return max(0, int(self.settings_manager.bandwidth_limit))
+
+    def in_schedule(self, now):
+        """
+        Returns True if the supplied time is within the scheduled period.  The period runs past midnight if the end
+        time is before the start time.
+        """
+        start = self.parse_time(self.settings_manager.bandwidth_schedule_start)
+        end = self.parse_time(self.settings_manager.bandwidth_schedule_end)
+        if start is None or end is None:
+            return False
+        current = now.time()
+        if start <= end:
+            return start <= current < end
+        return current >= start or current < end
+
+    def parse_time(self, value):
+        try:
+            hour, minute = value.split(':')
+            return day_time(int(hour), int(minute))
+        except (AttributeError, ValueError):
+            self.logger.warning('Invalid bandwidth schedule time', extra={'time': value})
+            return None
+
+    @property
+    def limited(self):
+        return self.get_limit() > 0
+
+    def consume(self, byte_count, flow=None, cancel_token=None):
+        """
+        Blocks until the supplied number of bytes can be received without going over the bandwidth limit.  Returns
+        immediately if downloads are not limited.
+        :param byte_count: The number of bytes that have been, or are about to be, received.
+        :param flow: A key identifying the file the data belongs to.  Data of the same flow shares one fair share of
+                     the bandwidth.
+        :param cancel_token: Optional.  The cancellation token of the download session, which stops the wait when the
+                             session is stopped.
+        :raises Cancelled: If the cancellation token is cancelled while waiting.
+        """
+        if cancel_token is None:
+            self.consume_quanta(byte_count, flow, None)
+            return
+        with cancel_token.on_cancel(self.wake):
+            self.consume_quanta(byte_count, flow, cancel_token)
+
+    def consume_quanta(self, byte_count, flow, cancel_token):
+        while byte_count > 0:
+            limit = self.get_limit()
+            if limit <= 0:
+                return
+            quantum = min(byte_count, self.MAX_QUANTUM, max(1024, int(limit * self.QUANTUM_SECONDS)))
+            self.release(quantum, flow, cancel_token)
+            byte_count -= quantum
+
+    def wake(self):
+        """Wakes the waiting downloads so that they check whether they have been stopped."""
+        with self.condition:
+            self.condition.notify_all()
+
+    def release(self, quantum, flow, cancel_token=None):
+        """Queues a single quantum of a flow and waits for it to be released."""
+        with self.condition:
+            tag = max(self.virtual_time, self.flow_finish_tags.get(flow, 0))
+            self.flow_finish_tags[flow] = tag + quantum
+            entry = (tag, next(self.sequence))
+            heapq.heappush(self.waiting, entry)
+            try:
+                while True:
+                    if cancel_token is not None:
+                        cancel_token.check()
+                    limit = self.get_limit()
+                    now = perf_counter()
+                    if limit <= 0:
+                        return
+                    if self.waiting[0] == entry:
+                        self.next_release = max(self.next_release, now - self.BURST_SECONDS)
+                        if self.next_release <= now:
+                            self.next_release += quantum / limit
+                            self.virtual_time = tag
+                            return
+                        self.condition.wait(min(self.next_release - now, self.POLL_INTERVAL))
+                    else:
+                        self.condition.wait(self.POLL_INTERVAL)
+            finally:
+                self.waiting.remove(entry)
+                heapq.heapify(self.waiting)
+                self.prune_flows()
+                self.condition.notify_all()
+
+    def prune_flows(self):
+        """
+        Removes the finish tags of flows that are not ahead of the virtual time, which would be replaced by the virtual
+        time anyway.  Must be called while holding the condition.
+        """
+        if len(self.flow_finish_tags) > 1000:
+            self.flow_finish_tags = {flow: tag for flow, tag in self.flow_finish_tags.items()
+                                     if tag > self.virtual_time}
@@ -0,0 +1,142 @@
+import time
+import logging
+import weakref
+from functools import partial
+from threading import Event, Lock, Thread
+from contextlib import contextmanager
+
+
+class Cancelled(Exception):
+    """Raised by an operation that was interrupted because the download session was stopped."""
+
+
+class CancellationToken(Event):
+
+    """
+    The stop event of a download session, which is handed to every stage of the session so that a stop reaches work
+    that is in progress and not only work that has yet to start.  The token is an Event, so code that only checks or
+    waits on the stop is unchanged, but setting it also runs the callbacks that are registered by operations that block
+    on something other than the event: a request waiting on a socket has the socket shut down, and a call that cannot be
+    interrupted at all, such as a youtube_dl extraction, is abandoned.  The time at which the token was cancelled is
+    recorded so that the time the session took to stop can be logged.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
+        self.lock = Lock()
+        self.callbacks = {}
+        self.next_callback_id = 0
+        # objects that are interrupted when the token is cancelled, held weakly so that tracking an object does not
+        # keep it alive once it is finished with
+        self.tracked = weakref.WeakKeyDictionary()
+        self.cancelled_at = None
+
+    def set(self):
+        """Cancels the token and runs the registered callbacks from the calling thread."""
+        with self.lock:
+            if self.is_set():
+                return
+            self.cancelled_at = time.monotonic()
+            super().set()
+            callbacks = list(self.callbacks.values())
+            callbacks.extend(partial(interrupt, item) for item, interrupt in list(self.tracked.items()))
+            self.callbacks.clear()
+            self.tracked.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                self.logger.debug('Cancellation callback failed', exc_info=True)
+
+    cancel = set
+
+    @property
+    def latency(self):
+        """The number of seconds since the token was cancelled, or None if it has not been cancelled."""
+        if self.cancelled_at is None:
+            return None
+        return round(time.monotonic() - self.cancelled_at, 3)
+
+    def check(self):
+        """
+        :raises Cancelled: If the token has been cancelled.
+        """
+        if self.is_set():
+            raise Cancelled()
+
+    @contextmanager
+    def on_cancel(self, callback):
+        """
+        Calls the supplied callback if the token is cancelled while the context is open.  The callback is called
+        straight away if the token has already been cancelled.
+        """
+        with self.lock:
+            callback_id = None
+            if not self.is_set():
+                callback_id = self.next_callback_id
+                self.next_callback_id += 1
+                self.callbacks[callback_id] = callback
+        if callback_id is None:
+            callback()
+        try:
+            yield
+        finally:
+            if callback_id is not None:
+                with self.lock:
+                    self.callbacks.pop(callback_id, None)
+
+    def track(self, item, interrupt):
+        """
+        Calls interrupt(item) if the token is cancelled while the item is still alive.  Used for objects such as
+        streamed responses whose use outlives the call that created them.
+        """
+        with self.lock:
+            if not self.is_set():
+                self.tracked[item] = interrupt
+                return
+        interrupt(item)
+
+    @contextmanager
+    def interruptible(self):
+        """
+        Raises Cancelled in place of any error raised in the context after the token was cancelled, as an operation
+        that is interrupted by a cancellation callback fails with whatever error the interruption caused.
+        """
+        try:
+            yield
+        except Cancelled:
+            raise
+        except Exception as e:
+            if self.is_set():
+                raise Cancelled() from e
+            raise
+
+    def run(self, function, *args, **kwargs):
+        """
+        Calls a blocking function that cannot be interrupted in a separate thread and waits for it to return or for the
+        token to be cancelled.  If the token is cancelled first, Cancelled is raised straight away and the thread is
+        left to finish on its own with its result discarded.
+        :return: The return value of the function.
+        :raises Cancelled: If the token is cancelled before the function returns.
+        """
+        self.check()
+        result = {}
+        done = Event()
+
+        def call():
+            try:
+                result['value'] = function(*args, **kwargs)
+            except BaseException as e:
+                result['error'] = e
+            finally:
+                done.set()
+
+        Thread(target=call, daemon=True).start()
+        with self.on_cancel(done.set):
+            done.wait()
+        if 'error' in result:
+            raise result['error']
+        if 'value' not in result:
+            raise Cancelled()
+        return result['value']
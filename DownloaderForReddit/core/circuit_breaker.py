@@ -0,0 +1,233 @@
+import time
+import logging
+from threading import Lock
+from contextlib import contextmanager
+
+import requests
+
+from ..messaging.message import Message
+from ..utils import injector
+
+
+# the exceptions that count as a failure of the domain when they are raised by a guarded request
+REQUEST_FAILURES = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ConnectionError, TimeoutError)
+
+
+class CircuitOpen(Exception):
+
+    """Raised instead of making a request to a domain whose circuit is open."""
+
+    def __init__(self, domain, retry_after):
+        super().__init__(domain)
+        self.domain = domain
+        self.retry_after = retry_after
+
+
+class DomainCircuit:
+
+    """
+    Holds the state of the circuit for a single domain.  The circuit is closed while the domain is answering, opens
+    once the failure threshold is reached, and is half open while a single probe request is made to the domain after
+    the cool-down.
+    """
+
+    CLOSED = 'CLOSED'
+    OPEN = 'OPEN'
+    HALF_OPEN = 'HALF_OPEN'
+
+    def __init__(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+        self.open_count = 0
+        self.short_circuit_count = 0
+        self.probe_successes = 0
+        self.probe_failures = 0
+
+    def get_stats(self):
+        return {
+            'state': self.state,
+            'open_count': self.open_count,
+            'short_circuited_requests': self.short_circuit_count,
+            'probe_successes': self.probe_successes,
+            'probe_failures': self.probe_failures,
+        }
+
+
+class CircuitCall:
+
+    """A single request admitted by the circuit breaker, used to record the outcome of the request."""
+
+    def __init__(self, breaker, domain, probe):
+        self.breaker = breaker
+        self.domain = domain
+        self.probe = probe
+        self.recorded = False
+
+    def record_response(self, status_code):
+        """Records the outcome of a request from its status code.  Server errors are failures of the domain."""
+        if status_code >= 500:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def record_success(self):
+        if not self.recorded:
+            self.recorded = True
+            self.breaker.record_success(self.domain, self.probe)
+
+    def record_failure(self):
+        if not self.recorded:
+            self.recorded = True
+            self.breaker.record_failure(self.domain, self.probe)
+
+
+class CircuitBreaker:
+
+    """
+    A per-domain circuit breaker shared by the extractors and the downloaders, so that a host that is down or
+    overloaded does not cost every post and content item that points at it a request timeout and an error.  Domains
+    are keyed the same way as the host limiter, so a configured host also covers its subdomains.
+
+    Once the requests to a domain have failed the failure threshold number of times in a row, the domain's circuit
+    opens and requests to it raise CircuitOpen instead of being made, which the callers use to defer the item to the
+    retry scheduler rather than failing it.  After the cool-down a single probe request is let through: if it succeeds
+    the circuit closes and requests are made as normal, and if it fails the circuit opens for another cool-down.  A
+    connection error, timeout or server error counts as a failure, while any other response shows the domain is up.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
+        self.lock = Lock()
+        self.domains = {}
+
+    @property
+    def settings_manager(self):
+        return injector.get_settings_manager()
+
+    @property
+    def enabled(self):
+        return self.settings_manager.use_circuit_breaker
+
+    @property
+    def cooldown(self):
+        return max(1, self.settings_manager.circuit_breaker_cooldown)
+
+    def get_domain(self, url):
+        return injector.get_host_limiter().get_host(url)
+
+    def get_circuit(self, domain):
+        """Returns the circuit of the supplied domain.  Must be called while holding the lock."""
+        circuit = self.domains.get(domain, None)
+        if circuit is None:
+            circuit = DomainCircuit()
+            self.domains[domain] = circuit
+        return circuit
+
+    @contextmanager
+    def guard(self, url, failures=REQUEST_FAILURES):
+        """
+        Context manager that admits a request to the domain of the supplied url for the duration of the block.  The
+        block records the outcome of the request with the yielded call, and a failure exception raised by the block is
+        recorded as a failure of the domain.
+        :param url: The url that is about to be requested.
+        :param failures: The exceptions that count as a failure of the domain.
+        :raises CircuitOpen: If the domain's circuit is open, in which case the block is not run.
+        """
+        call = self.admit(url)
+        try:
+            yield call
+        except failures:
+            call.record_failure()
+            raise
+        finally:
+            if call.probe and not call.recorded:
+                self.release_probe(call.domain)
+
+    def admit(self, url):
+        """
+        Admits a request to the domain of the supplied url.
+        :return: The call that the outcome of the request is recorded with.
+        :raises CircuitOpen: If the domain's circuit is open.
+        """
+        domain = self.get_domain(url)
+        if not self.enabled:
+            return CircuitCall(self, domain, False)
+        with self.lock:
+            circuit = self.get_circuit(domain)
+            if circuit.state == DomainCircuit.CLOSED:
+                return CircuitCall(self, domain, False)
+            if circuit.state == DomainCircuit.OPEN:
+                remaining = self.cooldown - (time.monotonic() - circuit.opened_at)
+                if remaining <= 0:
+                    circuit.state = DomainCircuit.HALF_OPEN
+                    self.logger.info('Probing domain after circuit cool-down', extra={'domain': domain})
+                    return CircuitCall(self, domain, True)
+            else:
+                # a probe is already in flight, so the result will not be known for a while
+                remaining = self.cooldown
+            circuit.short_circuit_count += 1
+            raise CircuitOpen(domain, remaining)
+
+    def record_success(self, domain, probe):
+        if not self.enabled:
+            return
+        with self.lock:
+            circuit = self.get_circuit(domain)
+            if probe:
+                circuit.probe_successes += 1
+                circuit.state = DomainCircuit.CLOSED
+                self.logger.info('Domain circuit closed after successful probe', extra={'domain': domain})
+                Message.send_info(f'Requests to {domain} resumed')
+            if circuit.state == DomainCircuit.CLOSED:
+                circuit.failures = 0
+
+    def record_failure(self, domain, probe):
+        if not self.enabled:
+            return
+        with self.lock:
+            circuit = self.get_circuit(domain)
+            if probe:
+                circuit.probe_failures += 1
+                self.open(domain, circuit)
+                self.logger.warning('Domain probe failed', extra={'domain': domain})
+            elif circuit.state == DomainCircuit.CLOSED:
+                circuit.failures += 1
+                if circuit.failures >= self.settings_manager.circuit_breaker_failure_threshold:
+                    self.open(domain, circuit)
+                    self.logger.warning('Domain circuit opened', extra={'domain': domain,
+                                                                        'failures': circuit.failures})
+                    Message.send_warning(f'Requests to {domain} paused after {circuit.failures} failed requests in a '
+                                         f'row.  Items from {domain} will be retried later')
+
+    def open(self, domain, circuit):
+        """Opens the circuit of a domain for the cool-down.  Must be called while holding the lock."""
+        circuit.state = DomainCircuit.OPEN
+        circuit.opened_at = time.monotonic()
+        circuit.failures = 0
+        circuit.open_count += 1
+
+    def release_probe(self, domain):
+        """
+        Returns a probe that ended without an outcome, such as one stopped with the download session, so that the next
+        request to the domain is able to probe it.
+        """
+        with self.lock:
+            circuit = self.get_circuit(domain)
+            if circuit.state == DomainCircuit.HALF_OPEN:
+                circuit.state = DomainCircuit.OPEN
+
+    def reset(self):
+        """Closes every circuit and clears the statistics at the start of a download session."""
+        with self.lock:
+            self.domains.clear()
+
+    def get_stats(self):
+        with self.lock:
+            return {domain: circuit.get_stats() for domain, circuit in self.domains.items() if circuit.open_count > 0}
+
+    def log_stats(self):
+        stats = self.get_stats()
+        if stats:
+            self.logger.info('Domain circuit breaker outcomes', extra={'domain_circuits': stats})
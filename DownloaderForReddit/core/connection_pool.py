@@ -0,0 +1,353 @@
+import socket
+import logging
+import importlib.util
+from threading import local, Lock
+from contextlib import contextmanager
+from urllib.parse import urlparse
+import requests
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from ..utils import injector
+
+
+@contextmanager
+def translate_errors():
+    """
+    Raises httpx's transport errors as the equivalent requests exceptions, so that a failed HTTP/2 request is handled
+    by the callers the same way as a failed HTTP/1.1 request.
+    """
+    try:
+        yield
+    except httpx.TimeoutException as e:
+        raise requests.exceptions.Timeout(str(e)) from e
+    except httpx.TransportError as e:
+        raise requests.exceptions.ConnectionError(str(e)) from e
+
+
+def interrupt_socket(sock):
+    """
+    Shuts down a socket so that a thread blocked sending to or receiving from it returns straight away.  The base
+    socket's shutdown is called for SSL sockets as well, as the SSL socket's own shutdown also discards the SSL object
+    that the blocked thread is using.
+    """
+    if sock is None:
+        return
+    try:
+        socket.socket.shutdown(sock, socket.SHUT_RDWR)
+    except (OSError, TypeError):
+        pass
+
+
+def interrupt_response(response):
+    """
+    Shuts down the socket of a streamed HTTP/1.1 response whose body is still being read.  A response whose body has
+    been read and whose connection has been released to the pool is left alone.
+    """
+    raw = getattr(response, 'raw', None)
+    sock = getattr(getattr(raw, '_connection', None), 'sock', None)
+    if sock is None:
+        # a response that closes its connection when it ends is handed the connection's socket by http.client
+        sock = getattr(getattr(getattr(getattr(raw, '_fp', None), 'fp', None), 'raw', None), '_sock', None)
+    interrupt_socket(sock)
+
+
+class Http2Response:
+
+    """
+    Wraps an httpx response in the parts of the requests Response interface that are used by the downloaders and
+    extractors.
+    """
+
+    def __init__(self, response):
+        self.response = response
+
+    @property
+    def status_code(self):
+        return self.response.status_code
+
+    @property
+    def headers(self):
+        return self.response.headers
+
+    @property
+    def http_version(self):
+        return self.response.http_version
+
+    @property
+    def text(self):
+        with translate_errors():
+            self.response.read()
+        return self.response.text
+
+    def json(self):
+        with translate_errors():
+            self.response.read()
+        return self.response.json()
+
+    def iter_content(self, chunk_size=1):
+        with translate_errors():
+            yield from self.response.iter_bytes(chunk_size)
+
+    def close(self):
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CountingAdapter(HTTPAdapter):
+
+    """
+    A transport adapter whose connection pools report each request they make and each connection they open to the
+    connection pool, so that the share of requests that reused a kept-alive connection can be reported.  A request
+    made while the calling thread has a cancellation token has its connection's socket shut down if the token is
+    cancelled before the response arrives.
+    """
+
+    def __init__(self, connection_pool, **kwargs):
+        # set before the adapter is initialised, as that creates the pool manager
+        self.connection_pool = connection_pool
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pool_classes = self.poolmanager.pool_classes_by_scheme
+        self.poolmanager.pool_classes_by_scheme = \
+            {scheme: self.make_counting_pool_class(pool_class) for scheme, pool_class in pool_classes.items()}
+
+    def make_counting_pool_class(self, pool_class):
+        connection_pool = self.connection_pool
+
+        class CountingPool(pool_class):
+
+            def _new_conn(self):
+                connection_pool.record_connection()
+                return super()._new_conn()
+
+            def _make_request(self, conn, *args, **kwargs):
+                connection_pool.record_request()
+                cancel_token = getattr(connection_pool.local, 'cancel_token', None)
+                if cancel_token is None:
+                    return super()._make_request(conn, *args, **kwargs)
+                with cancel_token.on_cancel(lambda: interrupt_socket(conn.sock)):
+                    return super()._make_request(conn, *args, **kwargs)
+
+        return CountingPool
+
+
+class ConnectionPool:
+
+    """
+    A shared pool of keep-alive http connections that is reused by every download worker.  Each thread is handed its
+    own requests Session (sessions are not safe to share between threads), but all of the sessions are mounted with the
+    same transport adapter.  The adapter owns the underlying per-host connection pools, so a connection opened by one
+    worker to a host such as i.redd.it is returned to the pool when the response is closed and can then be picked up by
+    any other worker instead of a new TCP and TLS handshake being performed for every file.
+
+    If HTTP/2 is enabled and httpx is installed with HTTP/2 support, urls on the configured HTTP/2 hosts are instead
+    requested through an httpx client per host, which is limited to the HTTP/2 connection cap.  Each HTTP/2 connection
+    carries many requests at once, so the small file downloads and multi-part ranges for a host share one connection
+    instead of each needing their own.  A host that does not offer HTTP/2 is spoken to over HTTP/1.1 by the same
+    client, and a host whose HTTP/2 connection fails with a protocol error is requested through the HTTP/1.1 pool for
+    the rest of the download session.
+    """
+
+    # The number of distinct hosts for which connection pools are kept alive at one time.
+    HOST_POOL_COUNT = 20
+
+    def __init__(self):
+        self.logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
+        self.settings_manager = injector.get_settings_manager()
+        self.local = local()
+        self.lock = Lock()
+        self.pool_size = None
+        self.adapter = None
+        self.generation = 0
+        self.http2_clients = {}
+        # hosts whose HTTP/2 connection failed, which are requested over HTTP/1.1 instead
+        self.http1_hosts = set()
+        self.stats_lock = Lock()
+        self.request_count = 0
+        self.connection_count = 0
+        self.http2_request_count = 0
+        self.update_pool_size()
+
+    @classmethod
+    def http2_available(cls):
+        """Returns True if the libraries needed for the HTTP/2 transport are installed."""
+        return httpx is not None and importlib.util.find_spec('h2') is not None
+
+    def get_pool_size(self):
+        """
+        Returns the maximum number of connections that will be kept alive per host.  If the pool size is set to track
+        the thread counts, the size is the largest number of connections that the download workers can have open to a
+        single host at once: every download thread plus every multi-part range that the multi-part scheduler can have
+        in flight.
+        """
+        if self.settings_manager.match_connection_pool_to_thread_count:
+            download_count = self.settings_manager.download_thread_count
+            if self.settings_manager.use_multi_part_downloader:
+                range_count = download_count * max(1, self.settings_manager.multi_part_thread_count)
+                return download_count + min(range_count, max(1, self.settings_manager.multi_part_max_in_flight))
+            return download_count
+        return self.settings_manager.connection_pool_size
+
+    def update_pool_size(self):
+        """
+        Checks the pool size against the current settings and rebuilds the transport adapter if it has changed.  Thread
+        sessions mounted with the old adapter are replaced the next time they are requested.
+        """
+        pool_size = max(1, self.get_pool_size())
+        with self.lock:
+            if pool_size != self.pool_size:
+                old_adapter = self.adapter
+                self.adapter = CountingAdapter(self, pool_connections=self.HOST_POOL_COUNT,
+                                               pool_maxsize=pool_size)
+                self.pool_size = pool_size
+                self.generation += 1
+                if old_adapter is not None:
+                    old_adapter.close()
+                self.logger.debug('Connection pool size set', extra={'pool_size': pool_size})
+
+    @property
+    def session(self):
+        """Returns the requests Session belonging to the calling thread, creating it if necessary."""
+        session = getattr(self.local, 'session', None)
+        if session is None or self.local.generation != self.generation:
+            session = Session()
+            session.mount('http://', self.adapter)
+            session.mount('https://', self.adapter)
+            self.local.session = session
+            self.local.generation = self.generation
+        return session
+
+    def use_http2(self, url):
+        """Returns True if the supplied url is to be requested over the HTTP/2 transport."""
+        if not self.settings_manager.use_http2 or not self.http2_available():
+            return False
+        host = (urlparse(url).hostname or '').lower()
+        if host in self.http1_hosts:
+            return False
+        return any(host == x or host.endswith(f'.{x}') for x in self.settings_manager.http2_hosts)
+
+    def get_http2_client(self, url):
+        """Returns the httpx client for the origin of the supplied url, creating it if necessary."""
+        parsed = urlparse(url)
+        origin = f'{parsed.scheme}://{parsed.netloc}'.lower()
+        with self.lock:
+            client = self.http2_clients.get(origin, None)
+            if client is None:
+                max_connections = max(1, self.settings_manager.http2_max_connections_per_host)
+                limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+                client = httpx.Client(http2=True, limits=limits)
+                self.http2_clients[origin] = client
+            return client
+
+    def request_http2(self, method, url, headers=None, stream=False, timeout=None):
+        """
+        Makes a request through the HTTP/2 client of the url's host.  If the request fails with a protocol error, the
+        host is moved to the HTTP/1.1 pool and the request is made again through it.
+        :return: The response, with the requests Response interface.
+        """
+        client = self.get_http2_client(url)
+        with self.stats_lock:
+            self.http2_request_count += 1
+        request = client.build_request(method, url, headers=headers, timeout=timeout)
+        with translate_errors():
+            try:
+                # redirects are followed for the same methods as requests follows them for
+                response = client.send(request, stream=True, follow_redirects=method != 'HEAD')
+            except (httpx.LocalProtocolError, httpx.RemoteProtocolError):
+                host = (urlparse(url).hostname or '').lower()
+                self.http1_hosts.add(host)
+                self.logger.warning('HTTP/2 request failed, falling back to HTTP/1.1', extra={'host': host},
+                                    exc_info=True)
+                return self.session.request(method, url, headers=headers, stream=stream, timeout=timeout)
+            if not stream:
+                response.read()
+        return Http2Response(response)
+
+    def get(self, url, cancel_token=None, **kwargs):
+        return self.request('GET', url, cancel_token, **kwargs)
+
+    def head(self, url, cancel_token=None, **kwargs):
+        return self.request('HEAD', url, cancel_token, **kwargs)
+
+    def request(self, method, url, cancel_token=None, **kwargs):
+        """
+        Requests the supplied url over HTTP/2 or through the calling thread's session.  If a cancellation token is
+        supplied, an HTTP/1.1 request is interrupted when the token is cancelled by shutting down its connection's
+        socket, both while the request waits for the response and, for a streamed response, while the body is read.
+        An HTTP/2 connection is shared by many requests, so HTTP/2 requests are left to be stopped by their callers
+        between chunks.
+        :param cancel_token: Optional.  The cancellation token of the download session.
+        :raises Cancelled: If the token is cancelled before the response arrives.
+        """
+        if cancel_token is None:
+            return self.send(method, url, **kwargs)
+        cancel_token.check()
+        self.local.cancel_token = cancel_token
+        try:
+            with cancel_token.interruptible():
+                response = self.send(method, url, **kwargs)
+        finally:
+            self.local.cancel_token = None
+        if kwargs.get('stream', False):
+            cancel_token.track(response, interrupt_response)
+        return response
+
+    def send(self, method, url, **kwargs):
+        if self.use_http2(url):
+            return self.request_http2(method, url, **kwargs)
+        return getattr(self.session, method.lower())(url, **kwargs)
+
+    def record_request(self):
+        with self.stats_lock:
+            self.request_count += 1
+
+    def record_connection(self):
+        with self.stats_lock:
+            self.connection_count += 1
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.request_count = 0
+            self.connection_count = 0
+            self.http2_request_count = 0
+
+    def get_stats(self):
+        """
+        Returns the number of requests made over HTTP/1.1 and the number of connections opened for them, with the share
+        of the requests that reused a kept-alive connection instead of opening a new one.  Requests made over HTTP/2 are
+        counted separately, as they share their host's connections.
+        """
+        with self.stats_lock:
+            reused = max(0, self.request_count - self.connection_count)
+            return {
+                'requests': self.request_count,
+                'new_connections': self.connection_count,
+                'reuse_ratio': round(reused / self.request_count, 3) if self.request_count > 0 else 0,
+                'http2_requests': self.http2_request_count,
+            }
+
+    def reset_http1_hosts(self):
+        """Clears the hosts that fell back to HTTP/1.1 so that HTTP/2 is tried for them again in a new session."""
+        with self.lock:
+            self.http1_hosts.clear()
+
+    def close(self):
+        with self.lock:
+            if self.adapter is not None:
+                self.adapter.close()
+            for client in self.http2_clients.values():
+                client.close()
+            self.http2_clients.clear()
@@ -1,4 +1,5 @@
 import logging
+from threading import Semaphore
 from concurrent.futures import ThreadPoolExecutor
 from queue import Empty
 
@@ -23,6 +24,9 @@ class ContentRunner(Runner):
 
         self.thread_count = self.settings_manager.extraction_thread_count
         self.executor = ThreadPoolExecutor(max_workers=self.thread_count)
+        # an item is only taken from the submission queue when a thread is free to extract it, so that a backlog is
+        # held in the bounded submission queue, which slows the listing of submissions, instead of in the executor
+        self.extraction_slots = Semaphore(self.thread_count)
         self.futures = []
         self.hold = False
         self.submit_hold = False
@@ -36,15 +40,19 @@ class ContentRunner(Runner):
     def run(self):
         self.logger.debug('Content extractor running')
         while self.continue_run:
+            if not self.extraction_slots.acquire(timeout=2):
+                continue
             try:
                 item = self.submission_queue.get(timeout=2)
                 if item is not None:
                     if item == 'HOLD':
                         self.hold = True
                         self.submit_hold = True
+                        self.extraction_slots.release()
                     elif item == 'RELEASE_HOLD':
                         self.hold = False
                         self.download_queue.put('RELEASE_HOLD')
+                        self.extraction_slots.release()
                     else:
                         extraction_type, extraction_object, significant_id = item
                         if extraction_type == 'SUBMISSION':
@@ -52,11 +60,12 @@ class ContentRunner(Runner):
                                                           significant_id=significant_id)
                         else:
                             future = self.executor.submit(self.finish_post, post_id=extraction_object)
-                        future.add_done_callback(self.remove_future)
                         self.futures.append(future)
+                        future.add_done_callback(self.remove_future)
                 else:
                     break
             except Empty:
+                self.extraction_slots.release()
                 if self.submit_hold and not self.running:
                     self.download_queue.put('HOLD')
                     self.submit_hold = False
@@ -66,6 +75,7 @@ class ContentRunner(Runner):
 
     def remove_future(self, future):
         self.futures.remove(future)
+        self.extraction_slots.release()
 
     @verify_run
     def handle_submission(self, submission, significant_id):
@@ -0,0 +1,95 @@
+import os
+import logging
+from threading import Lock
+
+from .partial_download import PartialDownload
+from ..utils import system_util
+
+
+class DirectoryIndex:
+
+    """
+    An in-memory index of the file names in the directories that content is saved to, used to give each content item a
+    file name that does not conflict with an existing file.  Each directory is created if needed and listed once per
+    download session, and names are then reserved from the index instead of checking the file system for each
+    candidate name, which for a popular title in a directory of many thousands of files could otherwise take dozens of
+    stat calls per item.
+
+    Names are reserved while holding the index's lock, so two threads saving content with the same title to the same
+    directory are always given different names, even though neither file has been written yet.  A reserved name stays
+    in the index for the rest of the session, which keeps the index up to date with the files written by the session
+    without listing the directory again.  A name that is reserved by an unfinished partial download is not given to new
+    content.
+
+    The index is reset at the start of each download session so that files that have been moved or removed between
+    sessions are picked up.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
+        self.lock = Lock()
+        self.directories = {}
+        # the last number appended to a title in a directory, used as the starting point for the next conflicting name
+        self.unique_counts = {}
+
+    def reset(self):
+        with self.lock:
+            self.directories.clear()
+            self.unique_counts.clear()
+
+    @staticmethod
+    def get_key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def get_names(self, directory):
+        """
+        Returns the set of names in the supplied directory, creating and listing the directory the first time it is
+        used.  Must be called while holding the lock.
+        """
+        key = self.get_key(directory)
+        names = self.directories.get(key)
+        if names is None:
+            try:
+                system_util.create_directory(directory)
+            except PermissionError:
+                self.logger.error('Could not create directory path', extra={'directory_path': directory},
+                                  exc_info=True)
+            try:
+                names = {os.path.normcase(name) for name in os.listdir(directory)}
+            except OSError:
+                names = set()
+            self.directories[key] = names
+        return names
+
+    def reserve(self, directory, title, extension, check_partial=True):
+        """
+        Reserves a file name in the supplied directory that does not conflict with any existing or reserved name.  If
+        the title is taken, a number is incremented and appended to it until a free name is found.
+        :param directory: The directory the file is to be saved to.
+        :param title: The cleaned title the name is to be made from.
+        :param extension: The extension of the file.
+        :param check_partial: If True, names that are reserved by a partial download are treated as taken.
+        :return: The reserved title, without the extension.
+        """
+        with self.lock:
+            names = self.get_names(directory)
+            count_key = (self.get_key(directory), os.path.normcase(title), os.path.normcase(extension))
+            unique_count = self.unique_counts.get(count_key, 0)
+            download_title = title if unique_count == 0 else f'{title}({unique_count})'
+            while self.taken(directory, names, f'{download_title}.{extension}', check_partial):
+                unique_count += 1
+                download_title = f'{title}({unique_count})'
+            self.unique_counts[count_key] = unique_count
+            names.add(os.path.normcase(f'{download_title}.{extension}'))
+            return download_title
+
+    @staticmethod
+    def taken(directory, names, name, check_partial):
+        """
+        Returns True if a name is in the index.  A name that is free in the index is also checked for a partial download
+        on the disk, so that only the name that is about to be reserved costs a file system check.
+        """
+        if os.path.normcase(name) in names:
+            return True
+        return check_partial and PartialDownload.exists(system_util.join_path(directory, name))
+
@@ -0,0 +1,250 @@
+import os
+import shutil
+import logging
+from threading import Condition
+from time import monotonic
+
+from ..messaging.message import Message
+from ..utils import injector, system_util
+
+
+class InsufficientDiskSpace(Exception):
+
+    """Raised when a download can not be admitted because its volume does not have room for the announced size."""
+
+    pass
+
+
+class DownloadDoesNotFit(Exception):
+
+    """
+    Raised when a download is larger than the space its volume would have even if no other download was in progress,
+    and space has not been freed for it within the oversized wait.
+    """
+
+    pass
+
+
+class DiskSpaceMonitor:
+
+    """
+    Admits downloads to the volumes they are saved to based on the free space left on each volume, so that a download
+    session that fills the disk pauses instead of failing every remaining item.  Each download takes a reservation for
+    the volume its file is saved to, which first waits for the volume to be above the minimum free space and then,
+    once the response has announced the size of the file, reserves the bytes that are still to be written.  The bytes
+    reserved by downloads in progress are counted as used, so that a number of large downloads started at once can not
+    each see the same free space and together take the volume below the minimum.
+
+    A download that does not fit is not failed: its response is closed and it waits, without holding a download
+    slot's connection, until enough space has been freed on the volume, at which point it is requested again.  As
+    every download slot that takes an item for the volume ends up waiting, the download queue is effectively paused
+    until space is freed, and resumes on its own once it is.  A download that would not fit even if every other
+    download to the volume was released can only be admitted by the user freeing space, so it is warned about and
+    failed with a retryable error once it has waited for the oversized wait, which frees its download slot for the
+    rest of the queue.
+    """
+
+    # how long a free space reading of a volume is used before the volume is checked again
+    REFRESH_INTERVAL = 2
+    # how often waiting downloads check whether space has been freed
+    POLL_INTERVAL = 5
+    # how long a download that does not fit on its volume even with no other download in progress waits for the user
+    # to free space before it is failed
+    OVERSIZED_WAIT = 60
+
+    def __init__(self):
+        self.logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
+        self.condition = Condition()
+        # volumes are keyed by device id and hold a path on the volume, the last free space reading, when it was taken,
+        # the reservations in progress on the volume and whether downloads to the volume are paused
+        self.volumes = {}
+        self.directory_volumes = {}
+        self.pause_count = 0
+
+    @property
+    def settings_manager(self):
+        return injector.get_settings_manager()
+
+    @property
+    def enabled(self):
+        return self.settings_manager.pause_on_low_disk_space
+
+    @property
+    def minimum_free_space(self):
+        return max(0, int(self.settings_manager.minimum_free_disk_space))
+
+    def reservation(self, directory):
+        """Returns a new reservation for a download that is saved to the supplied directory."""
+        return Reservation(self, directory)
+
+    def get_volume(self, directory):
+        """
+        Returns the volume that the supplied directory is on.  The directory does not have to exist yet, in which case
+        the volume of its closest existing parent is used.  Must be called while holding the condition.
+        """
+        key = self.directory_volumes.get(directory)
+        if key is None:
+            path = os.path.abspath(directory)
+            while not os.path.exists(path) and os.path.dirname(path) != path:
+                path = os.path.dirname(path)
+            key = os.stat(path).st_dev
+            self.directory_volumes[directory] = key
+            if key not in self.volumes:
+                self.volumes[key] = {'path': path, 'free': 0, 'checked': None, 'reservations': set(), 'paused': False}
+        return self.volumes[key]
+
+    def get_free_space(self, volume):
+        """
+        Returns the free space of a volume less the bytes reserved on it.  Must be called while holding the condition.
+        """
+        now = monotonic()
+        if volume['checked'] is None or now - volume['checked'] >= self.REFRESH_INTERVAL:
+            try:
+                volume['free'] = shutil.disk_usage(volume['path']).free
+            except OSError:
+                self.logger.warning('Failed to check free disk space', extra={'path': volume['path']}, exc_info=True)
+                volume['free'] = 0
+            volume['checked'] = now
+        return volume['free'] - sum(reservation.remaining for reservation in volume['reservations'])
+
+    def has_space(self, reservation, size):
+        """
+        Returns True if the volume of the supplied reservation has room for the supplied number of bytes above the
+        minimum free space.  Downloads to the volume are paused while its free space is below the minimum, and resumed
+        once it is above it again.  Must be called while holding the condition.
+        """
+        if not self.enabled:
+            return True
+        volume = self.get_volume(reservation.directory)
+        free = self.get_free_space(volume) + (reservation.remaining if reservation in volume['reservations'] else 0)
+        if free < self.minimum_free_space and not volume['paused']:
+            volume['paused'] = True
+            self.pause_count += 1
+            self.logger.warning('Downloads paused for low disk space',
+                                extra={'path': volume['path'], 'free_space': free,
+                                       'minimum_free_space': self.minimum_free_space})
+            Message.send_warning(f'Downloads to {volume["path"]} paused: {system_util.format_size(max(0, free))} free. '
+                                 f'Downloads will resume when more space is available')
+        elif free >= self.minimum_free_space and volume['paused']:
+            volume['paused'] = False
+            self.logger.info('Downloads resumed after disk space was freed',
+                             extra={'path': volume['path'], 'free_space': free})
+            Message.send_info(f'Downloads to {volume["path"]} resumed')
+        return free - size >= self.minimum_free_space
+
+    def fits_volume(self, reservation, size):
+        """
+        Returns True if the volume of the supplied reservation would have room for the supplied number of bytes above
+        the minimum free space if no other download to the volume was in progress.  Must be called while holding the
+        condition.
+        """
+        volume = self.get_volume(reservation.directory)
+        self.get_free_space(volume)
+        return volume['free'] - size >= self.minimum_free_space
+
+    def wake(self):
+        """Wakes the downloads waiting for space so that they check the space, and whether they were stopped, again."""
+        with self.condition:
+            self.condition.notify_all()
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                'pause_count': self.pause_count,
+                'paused_volumes': [volume['path'] for volume in self.volumes.values() if volume['paused']],
+            }
+
+
+class Reservation:
+
+    """
+    The disk space reserved for a single download.  The reserved bytes that are still to be written are taken from the
+    size of the partial download less the bytes it has received, so the reservation shrinks as the file is written and
+    the bytes are not counted twice against the volume's free space.
+    """
+
+    def __init__(self, monitor, directory):
+        self.monitor = monitor
+        self.directory = directory
+        self.size = 0
+        self.partial = None
+        self.oversized_since = None
+
+    @property
+    def remaining(self):
+        if self.partial is None:
+            return 0
+        return max(0, self.size - self.partial.bytes_received)
+
+    def check(self):
+        """
+        Returns True if the volume has room for the size that was last requested by this reservation.
+        :raises DownloadDoesNotFit: If the size would not fit on the volume even if no other download was in progress,
+                                    and space has not been freed for it within the oversized wait.
+        """
+        with self.monitor.condition:
+            if self.monitor.has_space(self, self.remaining):
+                self.oversized_since = None
+                return True
+            self.check_oversized()
+            return False
+
+    def check_oversized(self):
+        """
+        Warns once when the size that was last requested by this reservation would not fit on the volume even if no
+        other download was in progress, and fails the reservation if space has not been freed for it within the
+        oversized wait.  Must be called while holding the condition.
+        :raises DownloadDoesNotFit: If the oversized wait has passed.
+        """
+        monitor = self.monitor
+        # a volume that is below the minimum free space with no download in progress is paused until space is freed,
+        # as every download to it would be failed otherwise
+        if not monitor.enabled or not monitor.fits_volume(self, 0) or monitor.fits_volume(self, self.remaining):
+            self.oversized_since = None
+            return
+        now = monotonic()
+        if self.oversized_since is None:
+            self.oversized_since = now
+            path = monitor.get_volume(self.directory)['path']
+            monitor.logger.warning('Download does not fit on its volume',
+                                   extra={'path': path, 'size': self.remaining,
+                                          'minimum_free_space': monitor.minimum_free_space})
+            Message.send_warning(f'A {system_util.format_size(self.remaining)} download does not fit on {path}.  It '
+                                 f'will be failed and retried later unless space is freed')
+        elif now - self.oversized_since >= monitor.OVERSIZED_WAIT:
+            raise DownloadDoesNotFit(self.directory)
+
+    def wait(self, stop_run):
+        """
+        Blocks until the volume has room for the size that was last requested by this reservation.
+        :return: True if there is room, or False if the download session was stopped while waiting.
+        :raises DownloadDoesNotFit: If the size would not fit on the volume even if no other download was in progress,
+                                    and space has not been freed for it within the oversized wait.
+        """
+        with self.monitor.condition:
+            while not stop_run.is_set():
+                if self.check():
+                    return True
+                self.monitor.condition.wait(self.monitor.POLL_INTERVAL)
+        return False
+
+    def reserve(self, partial):
+        """
+        Reserves the bytes of a partial download that are still to be written.  A partial download of unknown size
+        only needs the volume to be above the minimum free space.
+        :raises InsufficientDiskSpace: If the volume does not have room for the bytes.
+        """
+        with self.monitor.condition:
+            self.size = partial.size if partial.size is not None else 0
+            self.partial = partial
+            if not self.monitor.has_space(self, self.remaining):
+                raise InsufficientDiskSpace(self.directory)
+            if self.monitor.enabled:
+                self.monitor.get_volume(self.directory)['reservations'].add(self)
+
+    def release(self):
+        """Releases the reserved bytes once the download has finished or failed."""
+        with self.monitor.condition:
+            for volume in self.monitor.volumes.values():
+                volume['reservations'].discard(self)
+            self.monitor.condition.notify_all()
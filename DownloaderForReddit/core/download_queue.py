@@ -0,0 +1,175 @@
+import heapq
+from collections import deque
+from itertools import count
+from time import monotonic
+
+from .stage_queue import StageQueue
+from ..database.models import Content
+from ..utils import injector
+
+
+class DownloadQueue(StageQueue):
+
+    """
+    The queue of content ids that connects the content extractor to the downloader.  Content is returned in the order
+    set by the download priority policies in the settings manager instead of the order it was added, so that a large
+    album of videos does not hold up every image that is queued behind it.  Content with the same priority is
+    returned in the order it was added.
+
+    The control items of the download queue protocol keep their meaning: 'RELEASE_HOLD' is returned ahead of any
+    queued content, while 'HOLD' and None are only returned once there is no queued content left, so that the
+    downloader does not stop before the content ahead of them is downloaded.  A 'HOLD' that has not been taken yet is
+    cancelled by a following 'RELEASE_HOLD'.
+
+    The downloaders only take an item from the queue when they are able to start downloading it, so the priority
+    order is applied to everything that has not started.
+
+    Content is extracted in the order it was posted, so consecutive items usually come from different hosts, and a
+    connection kept alive to a host has often been closed, or pushed out of the connection pool by other hosts, by the
+    time the next item for that host is downloaded.  If grouping by host is enabled, content with the same priority is
+    instead handed out in batches per host: once an item for a host is returned, the following items for that host are
+    returned ahead of older items for other hosts, so that the download workers pick up the connections that the
+    batch's earlier downloads have just returned to the shared connection pool.  An item is only moved ahead of items
+    that were queued at most the batch window before it, and a batch ends after the batch size, at which point the
+    oldest item for another host starts the next batch, so that no host is starved by a host with a large backlog.
+    """
+
+    def __init__(self, high_watermark=0, low_watermark=0, stop_run=None):
+        super().__init__('download', high_watermark, low_watermark, stop_run)
+        self.settings_manager = injector.get_settings_manager()
+        # queued content ids by priority and host, with the priorities that have content kept in a heap
+        self.content = {}
+        self.priorities = []
+        self.batch_host = None
+        self.batch_count = 0
+        self.host_batch_count = 0
+        self.controls = deque()
+        self.release_count = 0
+        self.sequence = count()
+        self.added_reddit_object_ids = set()
+
+    def put(self, item, priority=(), host=None):
+        """
+        Adds an item to the queue.
+        :param item: The id of a content item to be downloaded, or one of the download queue control items.
+        :param priority: The priority of a content item.  Items with a lower priority are returned first.
+        :param host: The host that a content item is downloaded from, used to group the content by host.
+        """
+        super().put(item if item in self.CONTROL_ITEMS else (priority, host, item))
+
+    def put_content(self, content: Content):
+        """Adds a content item to the queue with the priority given to it by the download priority policies."""
+        self.put(content.id, self.get_priority(content), injector.get_host_limiter().get_host(content.url))
+
+    def push(self, item):
+        """Stores a control item, or a tuple of the priority and id of a content item."""
+        if item == 'RELEASE_HOLD':
+            if self.controls and self.controls[-1] == 'HOLD':
+                self.controls.pop()
+            else:
+                self.release_count += 1
+        elif item in self.CONTROL_ITEMS:
+            self.controls.append(item)
+        else:
+            priority, host, content_id = item
+            hosts = self.content.get(priority, None)
+            if hosts is None:
+                hosts = {}
+                self.content[priority] = hosts
+                heapq.heappush(self.priorities, priority)
+            hosts.setdefault(host, deque()).append((next(self.sequence), monotonic(), content_id))
+
+    def pop(self):
+        if self.release_count > 0:
+            self.release_count -= 1
+            return True, 'RELEASE_HOLD'
+        if self.priorities:
+            priority = self.priorities[0]
+            hosts = self.content[priority]
+            host = self.select_host(hosts)
+            content_id = hosts[host].popleft()[2]
+            if not hosts[host]:
+                del hosts[host]
+                if not hosts:
+                    del self.content[priority]
+                    heapq.heappop(self.priorities)
+            return True, content_id
+        if self.controls:
+            return True, self.controls.popleft()
+        return False, None
+
+    def select_host(self, hosts):
+        """
+        Returns the host whose next item is to be returned from the supplied hosts, which all have content queued with
+        the highest priority.  Without grouping by host, this is the host of the oldest item.
+        """
+        oldest = min(hosts, key=lambda x: hosts[x][0][0])
+        if not self.settings_manager.group_downloads_by_host:
+            return oldest
+        batch = hosts.get(self.batch_host, None)
+        if batch is not None and self.batch_count < self.settings_manager.host_batch_size and \
+                batch[0][1] - hosts[oldest][0][1] <= self.settings_manager.host_batch_window:
+            host = self.batch_host
+        else:
+            # a host that has used up its batch only starts the next batch if no other host has content waiting
+            others = [x for x in hosts if x != self.batch_host] or list(hosts)
+            host = min(others, key=lambda x: hosts[x][0][0])
+            self.batch_host = host
+            self.batch_count = 0
+            self.host_batch_count += 1
+        self.batch_count += 1
+        return host
+
+    def get_stats(self):
+        stats = super().get_stats()
+        with self.condition:
+            stats['host_batches'] = self.host_batch_count
+        return stats
+
+    def add_reddit_object(self, reddit_object_id):
+        """
+        Records a reddit object that was added to the download session after it started.  Content extracted for it is
+        given priority by the 'added_objects_first' policy.
+        """
+        with self.condition:
+            self.added_reddit_object_ids.add(reddit_object_id)
+
+    def get_priority(self, content: Content):
+        """
+        Returns the priority of a content item, which is made up of the class the item falls into for each of the
+        download priority policies, in the order the policies are listed in the settings manager.
+        """
+        priority = []
+        for policy in self.settings_manager.download_priority_order:
+            method = getattr(self, f'priority_{policy}', None)
+            if method is None:
+                self.logger.warning('Unknown download priority policy', extra={'policy': policy})
+                continue
+            priority.append(method(content))
+        return tuple(priority)
+
+    def priority_retries_last(self, content):
+        return 1 if content.retry_attempts else 0
+
+    def priority_added_objects_first(self, content):
+        post = self.get_post(content)
+        return 0 if post is not None and post.significant_reddit_object_id in self.added_reddit_object_ids else 1
+
+    def priority_significant_first(self, content):
+        post = self.get_post(content)
+        significant = post is not None and post.significant_reddit_object is not None and \
+            post.significant_reddit_object.significant
+        return 0 if significant else 1
+
+    def priority_small_first(self, content):
+        """Orders content by the size it is likely to be from its type, as the size is not known before download."""
+        if content.is_image:
+            return 0
+        if content.is_video:
+            return 2
+        return 1
+
+    def get_post(self, content):
+        if content.post is not None:
+            return content.post
+        return content.comment.post if content.comment is not None else None
@@ -1,19 +1,25 @@
+import time
 import prawcore
 import logging
 from PyQt5.QtCore import QObject, pyqtSignal
 from queue import Queue, Empty
-from threading import Thread, Event
+from threading import Thread
 from datetime import datetime
 from collections import namedtuple
 from praw.models import Redditor
 
 from .downloader import Downloader
+from .async_downloader import AsyncDownloader
+from .download_queue import DownloadQueue
+from .stage_queue import StageQueue
 from .content_runner import ContentRunner
 from .submission_filter import SubmissionFilter
 from .runner import verify_run
-from .errors import NON_DOWNLOADABLE
+from .retry_scheduler import RetryScheduler
+from .connection_pool import ConnectionPool
+from .cancellation import CancellationToken
 from ..database.models import DownloadSession, RedditObject, User, Subreddit, Post, Content
-from ..utils import injector, reddit_utils, video_merger
+from ..utils import injector, reddit_utils, video_merger, system_util
 from ..messaging.message import Message
 
 
@@ -23,6 +29,9 @@ RunPair = namedtuple('RunPair', 'reddit_object_id praw_object')
 
 class DownloadRunner(QObject):
 
+    # the number of seconds after a stop within which each stage of the session is expected to have stopped
+    SLOW_STOP_LATENCY = 1
+
     remove_invalid_object = pyqtSignal(int)
     remove_forbidden_object = pyqtSignal(int)
     finished = pyqtSignal()
@@ -55,21 +64,35 @@ class DownloadRunner(QObject):
         self.run_undownloaded = kwargs.get('run_undownloaded', False)
         self.undownloaded_id_list = kwargs.get('undownloaded_id_list', None)
         self.run_new = kwargs.get('run_new', True)
+        self.run_due_retries = kwargs.get('run_due_retries', False)
 
-        self.stop_run = Event()
+        self.stop_run = CancellationToken()
         self.continue_run = True
         self.stopped = False
+        # the number of seconds after the stop at which each stage of the session had stopped
+        self.stop_latency = {}
         self.filter_subreddits = False
         self.validated_subreddits = []
 
-        self.submission_queue = Queue(maxsize=-1)
+        self.submission_queue = StageQueue('submission', self.settings_manager.submission_queue_high_watermark,
+                                           self.settings_manager.submission_queue_low_watermark, self.stop_run)
         self.extractor = None
         self.extraction_thread = None
-        self.download_queue = Queue(maxsize=-1)
+        self.download_queue = DownloadQueue(self.settings_manager.download_queue_high_watermark,
+                                            self.settings_manager.download_queue_low_watermark, self.stop_run)
         self.downloader = None
         self.download_thread = None
 
         self.perpetual_download = self.settings_manager.perpetual_download
+        if self.perpetual_download and self.settings_manager.retry_due_items_automatically:
+            self.run_due_retries = True
+        # the next retry time of each post and content item queued for a retry in this session, so that an item is only
+        # queued again once it has failed again and become due for another retry
+        self.queued_retries = {}
+        self.last_retry_check = None
+        # the perpetual queue is filled and emptied by this runner's own thread and the reddit object queue is filled
+        # from the gui thread, so neither can be bounded without blocking their producer, and both hold no more than
+        # one item per reddit object
         self.perpetual_queue = Queue(maxsize=-1)
         self.failed_connection_attempts = 0
         self.download_session_id = None
@@ -139,35 +162,94 @@ class DownloadRunner(QObject):
                           exc_info=True)
 
     def run_unextracted_posts(self):
+        """
+        Queues the posts selected to be extracted again, or if none were selected, the failed posts that are due for a
+        retry.
+        """
         self.logger.debug('Running unextracted posts')
         post_id_list = self.unextracted_id_list
         if post_id_list is None:
-            with self.db.get_scoped_session() as session:
-                post_id_list = session.query(Post.id)\
-                    .filter(Post.extracted == False) \
-                    .filter(Post.retry_attempts <= 3) \
-                    .filter(Post.extraction_error.notin_(NON_DOWNLOADABLE))
-        self.logger.debug(f'{post_id_list.count()} unfinished posts to download')
-        for post_id, in post_id_list.all():  # comma used to unpack result tuple
-            extraction_set = ExtractionSet(extraction_type='POST', extraction_object=post_id, significant_id=None)
-            self.submission_queue.put(extraction_set)
+            self.queue_due_posts()
+        else:
+            self.logger.debug(f'{post_id_list.count()} unfinished posts to download')
+            for post_id, in post_id_list.all():  # comma used to unpack result tuple
+                self.queue_post(post_id)
         self.logger.debug('Finished unextracted posts')
 
     def run_undownloaded_content(self):
+        """
+        Queues the content selected to be downloaded again, or if none was selected, the failed content that is due for
+        a retry.  The content is selected by a list of content ids, such as the ids of the content whose files failed
+        verification.
+        """
         self.logger.debug('Running undownloaded content')
         content_id_list = self.undownloaded_id_list
         if content_id_list is None:
+            self.queue_due_content()
+        else:
             with self.db.get_scoped_session() as session:
-                content_id_list = session.query(Content)\
-                    .filter(Content.downloaded == False) \
-                    .filter(Content.retry_attempts <= 3) \
-                    .filter(Content.download_error.notin_(NON_DOWNLOADABLE))
-        self.logger.debug(f'{content_id_list.count()} unfinished content items to download')
-        for content in content_id_list.all():
-            self.download_queue.put(content.id)
+                content_list = session.query(Content).filter(Content.id.in_(content_id_list)).all()
+                self.logger.debug(f'{len(content_list)} unfinished content items to download')
+                for content in content_list:
+                    self.download_queue.put_content(content)
         self.logger.debug('Finished undownloaded content')
 
+    def queue_post(self, post_id):
+        extraction_set = ExtractionSet(extraction_type='POST', extraction_object=post_id, significant_id=None)
+        self.submission_queue.put(extraction_set)
+
+    def queue_due_posts(self):
+        """Queues the failed posts that are due for a retry and have not already been queued for it in this session."""
+        with self.db.get_scoped_session() as session:
+            due_posts = RetryScheduler.due(session.query(Post.id, Post.next_retry_at).filter(Post.extracted == False),
+                                           Post.next_retry_at)
+            count = 0
+            for post_id, next_retry_at in due_posts.all():
+                if self.queued_retries.get(('POST', post_id), None) != next_retry_at:
+                    self.queued_retries[('POST', post_id)] = next_retry_at
+                    self.queue_post(post_id)
+                    count += 1
+        self.logger.debug(f'{count} posts due for retry')
+
+    def queue_due_content(self):
+        """Queues the failed content that is due for a retry and has not already been queued for it in this session."""
+        with self.db.get_scoped_session() as session:
+            due_content = RetryScheduler.due(session.query(Content).filter(Content.downloaded == False),
+                                             Content.next_retry_at)
+            count = 0
+            for content in due_content.all():
+                if self.queued_retries.get(('CONTENT', content.id), None) != content.next_retry_at:
+                    self.queued_retries[('CONTENT', content.id)] = content.next_retry_at
+                    self.download_queue.put_content(content)
+                    count += 1
+        self.logger.debug(f'{count} content items due for retry')
+
+    def queue_due_retries(self):
+        """
+        Queues the posts and content that have become due for a retry.  Called at the start of scheduled sessions and
+        every retry check interval during perpetual sessions, so that failed items are retried without the user having
+        to start a session for them.
+        """
+        self.last_retry_check = time.monotonic()
+        self.queue_due_posts()
+        self.queue_due_content()
+
+    def check_due_retries(self):
+        """Queues the items that are due for a retry if the retry check interval has passed since the last check."""
+        if not self.run_due_retries:
+            return
+        interval = self.settings_manager.retry_check_interval
+        if self.last_retry_check is None or time.monotonic() - self.last_retry_check >= interval:
+            self.queue_due_retries()
+
     def run(self):
+        injector.get_file_sync_batcher().recover()
+        injector.get_directory_index().reset()
+        injector.get_host_limiter().reset()
+        injector.get_circuit_breaker().reset()
+        injector.get_connection_pool().reset_http1_hosts()
+        injector.get_connection_pool().reset_stats()
+        injector.get_range_sizer().reset_stats()
         self.create_download_session()
         self.start_extractor()
         self.start_downloader()
@@ -175,6 +257,8 @@ class DownloadRunner(QObject):
             self.run_unextracted_posts()
         if self.run_undownloaded:
             self.run_undownloaded_content()
+        if self.run_due_retries:
+            self.queue_due_retries()
         if self.run_new:
             self.run_download()
         if self.perpetual_download:
@@ -191,10 +275,15 @@ class DownloadRunner(QObject):
             'last_update': self.settings_manager.last_update,
             'extraction_thread_count': self.settings_manager.extraction_thread_count,
             'download_thread_count': self.settings_manager.download_thread_count,
+            'download_engine': self.settings_manager.download_engine,
             'multi_part_threshold': self.settings_manager.multi_part_threshold,
+            'connection_pool_size': injector.get_connection_pool().pool_size,
+            'use_http2': self.settings_manager.use_http2,
             'finish_incomplete_extractions': self.settings_manager.finish_incomplete_extractions_at_session_start,
             'finish_incomplete_downloads': self.settings_manager.finish_incomplete_downloads_at_session_start,
         })
+        if self.settings_manager.use_http2 and not ConnectionPool.http2_available():
+            self.logger.warning('HTTP/2 selected but httpx with HTTP/2 support is not installed.  Using HTTP/1.1')
 
     def create_download_session(self):
         with self.db.get_scoped_session() as session:
@@ -214,10 +303,22 @@ class DownloadRunner(QObject):
         self.extraction_thread.start()
 
     def start_downloader(self):
-        self.downloader = Downloader(self.download_queue, self.download_session_id, self.stop_run)
+        downloader_class = self.get_downloader_class()
+        self.downloader = downloader_class(self.download_queue, self.download_session_id, self.stop_run)
         self.download_thread = Thread(target=self.downloader.run)
         self.download_thread.start()
 
+    def get_downloader_class(self):
+        """
+        Returns the downloader class for the download engine selected in the settings manager.  The threaded downloader
+        is used if the async engine is selected but the libraries it depends on are not installed.
+        """
+        if self.settings_manager.download_engine == 'ASYNC':
+            if AsyncDownloader.available():
+                return AsyncDownloader
+            self.logger.warning('Async download engine selected but aiohttp is not installed.  Using threaded engine')
+        return Downloader
+
     def run_download(self):
         if self.reddit_object_id_list is not None:
             for ro_id in self.reddit_object_id_list:
@@ -368,6 +469,7 @@ class DownloadRunner(QObject):
         while self.continue_run:
             self.run_next_perpetual_pair()
             self.check_added_object_queue(block=False)
+            self.check_due_retries()
         self.finish_download()
 
     def run_next_perpetual_pair(self):
@@ -406,6 +508,7 @@ class DownloadRunner(QObject):
         try:
             reddit_object_id = self.reddit_object_queue.get(timeout=1, block=block)
             if reddit_object_id is not None:
+                self.download_queue.add_reddit_object(reddit_object_id)
                 self.submission_queue.put('RELEASE_HOLD')
                 self.get_reddit_object_submissions(reddit_object_id)
                 self.submission_queue.put('HOLD')  # reapply holds after new submissions added to queue
@@ -421,16 +524,23 @@ class DownloadRunner(QObject):
         self.submission_queue.put(None)
         try:
             self.extraction_thread.join()
+            self.record_stop_latency('extraction')
         except AttributeError:
             pass
         try:
             self.download_thread.join()
+            self.record_stop_latency('download')
         except AttributeError:
             pass
+        injector.get_file_sync_batcher().flush()
         video_merger.merge_videos()
         with self.db.get_scoped_session() as session:
             dl_session = self.finish_download_session(session)
             self.finish_messages(dl_session)
+        self.publish_host_wait_times()
+        self.publish_circuit_breakers()
+        self.publish_range_sizes()
+        self.publish_queue_stats()
         self.download_session_signal.emit(self.download_session_id)
         self.finished.emit()
 
@@ -473,15 +583,99 @@ class DownloadRunner(QObject):
                   f'Post Count: {extracted_post_count}\n' \
                   f'Comment Count: {extracted_comment_count}\n' \
                   f'Download Count: {downloaded_content_count}'
+        connection_stats = injector.get_connection_pool().get_stats()
+        extra.update(connection_stats=connection_stats)
+        if connection_stats['requests'] > 0:
+            message += f'\nConnection Reuse: {connection_stats["reuse_ratio"]:.0%} ' \
+                       f'({connection_stats["new_connections"]} connections for {connection_stats["requests"]} ' \
+                       f'requests)'
         if self.stopped:
-            extra.update(download_stopped=True)
+            extra.update(download_stopped=True, stop_latency=self.stop_latency)
             message = f'\nDownload stopped{message}'
+            if 'download' in self.stop_latency:
+                message += f'\nStop Time: {self.stop_latency["download"]:.2f}s'
         self.logger.info('Download complete', extra=extra)
         Message.send_info(message)
 
+    def get_queue_depths(self):
+        """Returns the number of items waiting in each of the download session's stage queues."""
+        return {'extraction': self.submission_queue.qsize(), 'download': self.download_queue.qsize()}
+
+    def publish_queue_stats(self):
+        """
+        Logs the depth and backpressure statistics of the stage queues, and outputs the stages that were held up by a
+        full queue so that the queue watermarks can be tuned.
+        """
+        stats = {queue.name: queue.get_stats() for queue in (self.submission_queue, self.download_queue)}
+        self.logger.info('Stage queue stats', extra={'stage_queues': stats})
+        for name, queue_stats in stats.items():
+            if queue_stats['blocked_count'] > 0:
+                Message.send_debug(f'Stage queue: {name}: max depth {queue_stats["max_depth"]}, filling stage waited '
+                                   f'{queue_stats["blocked_count"]} times ({queue_stats["blocked_time"]}s)')
+
+    def publish_host_wait_times(self):
+        """
+        Logs the time that requests spent waiting on the host limiter during the session, and outputs the hosts that
+        requests had to wait on so that the host limits can be tuned.
+        """
+        host_limiter = injector.get_host_limiter()
+        host_limiter.log_stats()
+        for host, stats in host_limiter.get_stats().items():
+            if stats['waited_requests'] > 0:
+                Message.send_debug(f'Host limit wait: {host}: {stats["waited_requests"]}/{stats["requests"]} requests '
+                                   f'waited (avg: {stats["average_wait"]}s, max: {stats["max_wait"]}s)')
+
+    def publish_circuit_breakers(self):
+        """
+        Logs and outputs the domains whose circuit was opened during the session, with the number of requests that
+        were short-circuited and the outcome of the probes made to them.
+        """
+        circuit_breaker = injector.get_circuit_breaker()
+        circuit_breaker.log_stats()
+        for domain, stats in circuit_breaker.get_stats().items():
+            Message.send_info(f'Domain circuit: {domain}: opened {stats["open_count"]} times, '
+                              f'{stats["short_circuited_requests"]} requests deferred, probes: '
+                              f'{stats["probe_successes"]} succeeded, {stats["probe_failures"]} failed '
+                              f'(now {stats["state"].lower().replace("_", " ")})')
+
+    def publish_range_sizes(self):
+        """
+        Logs and outputs the multi-part range sizes that were chosen for each host during the session so that the
+        adaptive range sizing can be checked.
+        """
+        range_sizer = injector.get_range_sizer()
+        range_sizer.log_stats()
+        for host, stats in range_sizer.get_stats().items():
+            Message.send_debug(f'Multi-part ranges: {host}: {stats["ranges"]} ranges '
+                               f'(avg: {system_util.format_size(stats["average_size"])}, '
+                               f'min: {system_util.format_size(stats["min_size"])}, '
+                               f'max: {system_util.format_size(stats["max_size"])}, '
+                               f'next: {system_util.format_size(stats["next_size"])})')
+
+    def record_stop_latency(self, stage):
+        """
+        Records and logs the time that a stage of the download session took to stop after the session was stopped, so
+        that work that does not respond to the stop can be found.
+        """
+        latency = self.stop_run.latency
+        if latency is None:
+            return
+        self.stop_latency[stage] = latency
+        level = logging.WARNING if latency > self.SLOW_STOP_LATENCY else logging.INFO
+        self.logger.log(level, 'Download stage stopped', extra={'stage': stage, 'stop_latency': latency})
+
     def stop_download(self, hard_stop=False):
+        """
+        Stops the download session.  The session's cancellation token interrupts the requests, transfers and extractions
+        that are in progress, which are left to be finished the next time they are run.
+        :param hard_stop: True if the downloads in progress are to stop before writing their next chunk.
+        """
         self.stopped = True
         self.continue_run = False
-        self.stop_run.set()
         self.downloader.hard_stop = hard_stop
+        self.stop_run.set()
+        # wakes the runner if it is waiting for a reddit object to be added to the session
+        self.reddit_object_queue.put(None)
+        self.perpetual_queue.put(None)
+        self.logger.info('Download session stopping', extra={'hard_stop': hard_stop})
         Message.send_warning('\nStopped\n')
@@ -1,10 +1,21 @@
 import os
-import requests
+import math
+import shutil
 import logging
+from threading import Semaphore
 from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import or_
 
 from .runner import Runner, verify_run
 from .multipart_downloader import MultipartDownloader
+from .multipart_scheduler import MultipartScheduler
+from .image_hash import ImageHasher
+from .partial_download import PartialDownload
+from .disk_space import InsufficientDiskSpace, DownloadDoesNotFit
+from .circuit_breaker import CircuitOpen
+from .cancellation import Cancelled
+from .file_verifier import FileStatus
+from . import file_verifier, const
 from .errors import Error
 from ..utils import injector, system_util, general_utils
 from ..database import Content
@@ -30,10 +41,21 @@ class Downloader(Runner):
         self.output_queue = injector.get_message_queue()
         self.db = injector.get_database_handler()
         self.settings_manager = injector.get_settings_manager()
+        self.connection_pool = injector.get_connection_pool()
+        self.connection_pool.update_pool_size()
+        self.host_limiter = injector.get_host_limiter()
+        self.circuit_breaker = injector.get_circuit_breaker()
 
         self.thread_count = self.settings_manager.download_thread_count
         self.executor = ThreadPoolExecutor(self.thread_count)
-        self.multi_part_executor = ThreadPoolExecutor(8)
+        # an item is only taken from the download queue when a thread is free to download it, so that the queue's
+        # priority order applies to everything that has not started
+        self.download_slots = Semaphore(self.thread_count)
+        self.multi_part_scheduler = MultipartScheduler(self.stop_run)
+        self.image_hasher = ImageHasher()
+        self.bandwidth_limiter = injector.get_bandwidth_limiter()
+        self.receive_buffer = injector.get_receive_buffer()
+        self.disk_space_monitor = injector.get_disk_space_monitor()
         self.futures = []
         self.hold = False
         self.hard_stop = False
@@ -51,23 +73,35 @@ class Downloader(Runner):
         """
         self.logger.debug('Downloader running')
         while self.continue_run:
+            self.download_slots.acquire()
             item = self.download_queue.get()
             if item is not None:
                 if item == 'HOLD':
                     self.hold = True
+                    self.download_slots.release()
                 elif item == 'RELEASE_HOLD':
                     self.hold = False
+                    self.download_slots.release()
                 else:
                     future = self.executor.submit(self.download, content_id=item)
-                    future.add_done_callback(self.remove_future)
                     self.futures.append(future)
+                    future.add_done_callback(self.remove_future)
             else:
                 break
         self.executor.shutdown(wait=True)
+        self.multi_part_scheduler.shutdown()
+        self.finish_image_hashes()
         self.logger.debug('Downloader exiting')
 
+    def finish_image_hashes(self):
+        """Waits for the downloaded images to be hashed and reports any near duplicate images that were dropped."""
+        self.image_hasher.shutdown()
+        if self.image_hasher.dropped_count > 0:
+            Message.send_info(f'Dropped {self.image_hasher.dropped_count} near duplicate images')
+
     def remove_future(self, future):
         self.futures.remove(future)
+        self.download_slots.release()
 
     @verify_run
     def download(self, content_id: int):
@@ -75,33 +109,290 @@ class Downloader(Runner):
         Connects to the content url and downloads the content item to the file path specified by the content item.
         :param content_id: The id of the content item which is to be queried from the database, then downloaded.
         """
-        try:
-            with self.db.get_scoped_session() as session:
-                content = session.query(Content).get(content_id)
-                response = requests.get(content.url, stream=True, timeout=10)
-                if response.status_code == 200:
-                    file_size = int(response.headers['Content-Length'])
-                    content.download_title = general_utils.check_file_path(content)
-                    file_path = content.get_full_file_path()
-                    if self.settings_manager.use_multi_part_downloader and \
-                            file_size > self.settings_manager.multi_part_threshold:
-                        multi_part_downloader = MultipartDownloader(self.stop_run)
-                        multi_part_downloader.run(content.url, file_path, file_size)
-                        self.finish_multi_part_download(content, multi_part_downloader)
+        with self.db.get_scoped_session() as session:
+            content = session.query(Content).get(content_id)
+            # the errors are handled while the session is open so that the content is able to load its post
+            try:
+                reservation = self.disk_space_monitor.reservation(content.directory_path)
+                try:
+                    self.download_reserved(content, reservation)
+                except CircuitOpen as e:
+                    self.handle_circuit_open(content, e)
+                except Cancelled:
+                    self.handle_download_stopped(content)
+                except DownloadDoesNotFit:
+                    self.handle_insufficient_disk_space(content, reservation)
+                finally:
+                    reservation.release()
+            except ConnectionError:
+                self.handle_connection_error(content)
+            except:
+                self.handle_unknown_error(content)
+
+    def download_reserved(self, content: Content, reservation):
+        """
+        Downloads a content item once the volume it is saved to has room for it.  If the volume does not have room for
+        the size announced by the response, the response is closed and the content is requested again once space has
+        been freed, so that a full disk pauses downloads instead of failing them.
+        :param reservation: The disk space reservation for the content's download.
+        """
+        while self.wait_for_reservation(reservation):
+            try:
+                with self.host_limiter.limit(content.url, self.stop_run) as acquired:
+                    if not acquired:
+                        return
+                    multi_part = self.download_content(content, reservation)
+            except InsufficientDiskSpace:
+                continue
+            # the host slot is released before a multi-part download so that the parts are able to acquire it
+            if multi_part is not None:
+                self.download_multi_part(content, multi_part)
+            return
+
+    def wait_for_reservation(self, reservation):
+        """
+        Waits for the volume of a disk space reservation to have room for the download.  The reservation only checks
+        for a stop between its polls of the volume, so it is woken as soon as the download session is stopped.
+        :return: True if there is room, or False if the download session was stopped while waiting.
+        :raises DownloadDoesNotFit: If the download would not fit on the volume even if no other download was in
+                                    progress, and space has not been freed for it within the oversized wait.
+        """
+        with self.stop_run.on_cancel(self.disk_space_monitor.wake):
+            return reservation.wait(self.stop_run)
+
+    def download_content(self, content: Content, reservation=None):
+        """
+        Requests the content url and writes the response to the content's file path.  If a previous attempt to
+        download the content left a partial download behind, only the remaining bytes are requested.  If the file is
+        large enough to be downloaded by the multi-part downloader, only the first range of the file is read from the
+        response and the partial download is returned so that the rest of the file can be downloaded by the multi-part
+        downloader once the request slot for the host has been released.
+
+        If the content, or other content from the same url, has already been downloaded, the request is made
+        conditional on the file having changed, and the content is finished without downloading anything if the server
+        responds that it has not.
+        :param content: The content item that is to be downloaded.
+        :param reservation: Optional.  The disk space reservation that the size of the file is reserved from.
+        :return: The partial download if it is to be downloaded by the multi-part downloader, otherwise None.
+        :raises InsufficientDiskSpace: If the reservation's volume does not have room for the file.
+        :raises CircuitOpen: If the circuit of the content url's domain is open.
+        """
+        partial = self.get_partial_download(content)
+        if partial is not None and partial.complete:
+            self.finish_partial_download(content, partial)
+            return None
+        source = self.get_validator_source(content) if partial is None else None
+        headers = self.get_request_headers(partial, source)
+        with self.circuit_breaker.guard(content.url) as circuit, \
+                self.connection_pool.get(content.url, headers=headers, stream=True, timeout=10,
+                                         cancel_token=self.stop_run) as response:
+            circuit.record_response(response.status_code)
+            if response.status_code == 304 and source is not None:
+                self.finish_not_modified(content, source)
+                return None
+            partial = self.start_partial_download(content, partial, response.status_code, response.headers)
+            if partial is None:
+                return None
+            if reservation is not None:
+                reservation.reserve(partial)
+            if partial.multi_part:
+                end = self.get_first_range_end(content, partial)
+                if end is not None:
+                    self.write_response(response, partial, end)
+                return partial
+            self.write_response(response, partial)
+        self.finish_partial_download(content, partial)
+        return None
+
+    def write_response(self, response, partial: PartialDownload, end=None):
+        """
+        Writes the body of a response to a partial download.  The response is read through the thread's receive buffer,
+        so each chunk is written before the next one is read.
+        :param end: The offset in the file at which to stop writing.  If None the whole response is written.
+        :raises Cancelled: If the download session is stopped before the response has been written.  The bytes that
+                           were written are kept so that the download can be resumed.
+        """
+        with partial.open() as file:
+            try:
+                # a stop shuts down the response's socket, which ends the body early or fails the read
+                with self.stop_run.interruptible():
+                    for chunk in self.receive_buffer.iter_response(response):
+                        if self.hard_stop:
+                            break
+                        self.stop_run.check()
+                        if end is not None:
+                            chunk = chunk[:end - partial.bytes_received]
+                        self.bandwidth_limiter.consume(len(chunk), partial.path, self.stop_run)
+                        file.write(chunk)
+                        partial.add(chunk)
+                        if end is not None and partial.bytes_received >= end:
+                            break
                     else:
-                        with open(file_path, 'wb') as file:
-                            for chunk in response.iter_content(1024 * 1024):
-                                if not self.hard_stop:
-                                    file.write(chunk)
-                                else:
-                                    break
-                        self.finish_download(content)
-                else:
-                    self.handle_unsuccessful_response(content, response.status_code)
-        except ConnectionError:
-            self.handle_connection_error(content)
-        except:
-            self.handle_unknown_error(content)
+                        self.stop_run.check()
+            finally:
+                partial.save()
+
+    def get_first_range_end(self, content: Content, partial: PartialDownload):
+        """
+        Returns the offset up to which a multi-part download is written from the response of the request that found
+        the file's size, so that the response is used as the first range of the file instead of being requested again
+        by the multi-part downloader.
+        The first range stops at the start of any range that has already been completed by the multi-part downloader.
+        :return: The end offset of the first range, or None if the multi-part download will use temp file parts, which
+                 the response is not written to, or if the bytes after the received bytes have already been completed.
+        """
+        if not MultipartDownloader.use_preallocation(partial.path):
+            return None
+        if self.settings_manager.multi_part_adaptive_range_size:
+            length = injector.get_range_sizer().get_range_size(content.url)
+        else:
+            length = self.settings_manager.multi_part_chunk_size
+        end = min(partial.size, partial.bytes_received + length)
+        next_range_start = partial.get_next_range_start(partial.bytes_received)
+        if next_range_start is not None:
+            end = min(end, next_range_start)
+        return end if end > partial.bytes_received else None
+
+    def get_partial_download(self, content: Content):
+        """
+        Returns the partial download left by a previous attempt to download the supplied content, or None if the
+        content has not been downloaded before or there is nothing to resume.
+        """
+        if content.download_title is None:
+            return None
+        return PartialDownload.load(content.get_full_file_path(), content.url)
+
+    def get_request_headers(self, partial, source=None):
+        """
+        Returns the headers for a download request.  Responses are requested without content encoding so that the
+        bytes written to a partial download line up with the byte ranges used to resume it.
+        :param partial: The partial download that is being resumed, if any.
+        :param source: The downloaded content item whose validators make the request conditional, if any.
+        """
+        headers = {'Accept-Encoding': 'identity'}
+        if partial is not None:
+            headers.update(partial.get_resume_headers() or {})
+        if source is not None:
+            if source.etag is not None:
+                headers['If-None-Match'] = source.etag
+            if source.last_modified is not None:
+                headers['If-Modified-Since'] = source.last_modified
+        return headers
+
+    def get_validator_source(self, content: Content):
+        """
+        Returns the downloaded content item whose validators are to be sent with the request for the supplied content,
+        so that the server can respond that the file has not changed instead of sending it again.  The content itself
+        is used if it has already been downloaded, otherwise the most recently downloaded content from the same url.
+        Only content whose file is still on disk at the size it was downloaded at is used.
+        :return: The content item to take the validators from, or None if the request is not to be conditional.
+        """
+        candidates = [content] if content.downloaded else []
+        with self.db.get_scoped_session() as session:
+            candidates.extend(
+                session.query(Content)
+                .filter(Content.url == content.url)
+                .filter(Content.downloaded.is_(True))
+                .filter(Content.id != content.id)
+                .filter(or_(Content.etag.isnot(None), Content.last_modified.isnot(None)))
+                .order_by(Content.id.desc())
+                .limit(5)
+            )
+        for candidate in candidates:
+            if (candidate.etag is not None or candidate.last_modified is not None) and self.file_unchanged(candidate):
+                return candidate
+        return None
+
+    def file_unchanged(self, content: Content):
+        """Returns True if the file of a downloaded content item is on disk and has the size it was downloaded at."""
+        try:
+            size = os.path.getsize(content.get_full_file_path())
+        except (OSError, TypeError):
+            return False
+        return content.file_size is None or size == content.file_size
+
+    def finish_not_modified(self, content: Content, source: Content):
+        """
+        Finishes a content item that the server has responded has not changed since the source content item was
+        downloaded.  If the source is a different content item, its file is linked (or copied if linking duplicate
+        content is disabled or the file can not be linked) to the content's file path.  A copy is written to a temp file
+        that is moved to the content's file path once complete, like the file of a download.
+        """
+        if source is not content:
+            content.download_title = general_utils.check_file_path(content)
+            source_path = source.get_full_file_path()
+            path = content.get_full_file_path()
+            linked = self.settings_manager.link_duplicate_content and \
+                system_util.link_duplicate_file(source_path, path)
+            if not linked:
+                temp_path = path + PartialDownload.PART_SUFFIX
+                shutil.copy2(source_path, temp_path)
+                injector.get_file_sync_batcher().finalise(temp_path, path)
+            content.etag = source.etag
+            content.last_modified = source.last_modified
+            content.file_size = source.file_size
+            content.content_hash = source.content_hash
+        content.set_downloaded(self.download_session_id)
+        self.download_count += 1
+        Message.send_debug(f'Not modified: {content.get_full_file_path()}')
+
+    def record_validators(self, content: Content, headers):
+        """Records the validators of a response for the file that it is downloaded to."""
+        content.etag = headers.get('ETag', None)
+        content.last_modified = headers.get('Last-Modified', None)
+
+    def start_partial_download(self, content: Content, partial, status_code, headers):
+        """
+        Checks the response to a download request and returns the partial download that the response is to be written
+        to.  If the response resumes the supplied partial download, the partial download is returned unchanged.
+        Otherwise any partial download is discarded and, if the response contains the full file, the content is given
+        a file path and a new partial download is started.
+        :return: The partial download to write the response to, or None if the response was unsuccessful.
+        """
+        if partial is not None:
+            if partial.check_resume_response(status_code, headers):
+                self.record_validators(content, headers)
+                return partial
+            partial.discard()
+        if status_code != 200:
+            self.handle_unsuccessful_response(content, status_code)
+            return None
+        self.record_validators(content, headers)
+        # a changed file for content that has already been downloaded replaces the old file once it is complete
+        if not (content.downloaded and os.path.isfile(content.get_full_file_path())):
+            content.download_title = general_utils.check_file_path(content)
+        partial = PartialDownload.from_response(content.get_full_file_path(), content.url, headers)
+        # a file is only downloaded in parts if the server has said how large it is and that it accepts range requests
+        partial.multi_part = self.settings_manager.use_multi_part_downloader and partial.size is not None and \
+            partial.size > self.settings_manager.multi_part_threshold and \
+            headers.get('Accept-Ranges', '').lower() == 'bytes'
+        partial.save()
+        return partial
+
+    def finish_partial_download(self, content: Content, partial: PartialDownload):
+        """
+        Moves a completed partial download to the content's file path and finishes the download.  A download that ended
+        before all bytes were received is left in place so that it can be resumed.  If the server did not send the size
+        of the file, the download is complete once the response has ended.
+        """
+        if partial.size is None and not self.hard_stop:
+            partial.size = partial.bytes_received
+        if partial.complete:
+            partial.finish()
+            content.expected_size = partial.size
+            content_hash = partial.content_hash or system_util.hash_file(content.get_full_file_path())
+            content.content_hash = content_hash.hexdigest()
+            self.finish_download(content)
+        elif self.hard_stop:
+            self.finish_download(content)
+        else:
+            raise ConnectionError('Connection closed before the download was complete')
+
+    def download_multi_part(self, content: Content, partial: PartialDownload):
+        multi_part_downloader = MultipartDownloader(self.stop_run, self.multi_part_scheduler)
+        multi_part_downloader.run(content.url, content.get_full_file_path(), partial.size, partial.bytes_received,
+                                  partial)
+        self.finish_multi_part_download(content, multi_part_downloader, partial)
 
     def finish_download(self, content: Content):
         """
@@ -110,48 +401,145 @@ class Downloader(Runner):
         :param content: The content item that has been downloaded and needs to be finished.
         """
         if not self.hard_stop:
-            if self.settings_manager.match_file_modified_to_post_date:
+            path = content.get_full_file_path()
+            content.file_size = os.path.getsize(path)
+            content.file_signature = file_verifier.read_signature(path)
+            status, problem = file_verifier.check_file(path, content.expected_size,
+                                                       media=content.extension in const.ALL_EXT)
+            if status == FileStatus.NO_TRAILER:
+                self.logger.warning('Downloaded file does not hold the end of its format',
+                                    extra={'url': content.url, 'path': path, 'problem': problem})
+            elif status != FileStatus.OK:
+                self.handle_integrity_failure(content, problem)
+                return
+            linked = content.content_hash is not None and self.settings_manager.link_duplicate_content and \
+                self.link_duplicate(content)
+            # a linked file is the file of the earlier download, whose date modified is kept
+            if self.settings_manager.match_file_modified_to_post_date and not linked:
                 system_util.set_file_modify_time(content.get_full_file_path(), content.post.date_posted.timestamp())
             content.set_downloaded(self.download_session_id)
             self.download_count += 1
+            if content.is_image and self.image_hasher.enabled:
+                self.image_hasher.submit(content)
             if self.settings_manager.output_saved_content_full_path:
                 Message.send_debug(f'Saved: {content.get_full_file_path()}')
             else:
                 Message.send_debug(f'Saved: {content.user.name}: {content.title}')
         else:
-            message = 'Download was stopped before finished'
-            content.set_download_error(Error.DOWNLOAD_STOPPED, message)
-            Message.send_download_error(f'{message}. File at path: "{content.get_full_file_path()}" may be corrupted')
+            self.handle_download_stopped(content)
+
+    def link_duplicate(self, content: Content):
+        """
+        Checks for a previously downloaded file with the same content hash as the supplied content.  If one is found,
+        the newly downloaded file is replaced with a link to the existing file so that the same file that has been
+        downloaded from a different url is not stored twice.
+        :param content: The content item that has been downloaded.
+        :return: True if the downloaded file was replaced with a link to an existing file.
+        """
+        path = content.get_full_file_path()
+        with self.db.get_scoped_session() as session:
+            duplicates = session.query(Content) \
+                .filter(Content.content_hash == content.content_hash) \
+                .filter(Content.downloaded.is_(True)) \
+                .filter(Content.id != content.id) \
+                .order_by(Content.id) \
+                .all()
+            for duplicate in duplicates:
+                duplicate_path = duplicate.get_full_file_path()
+                if os.path.isfile(duplicate_path) and not os.path.samefile(duplicate_path, path) and \
+                        os.path.getsize(duplicate_path) == os.path.getsize(path):
+                    if system_util.link_duplicate_file(duplicate_path, path):
+                        self.logger.debug('Linked duplicate content',
+                                          extra={'path': path, 'duplicate_path': duplicate_path})
+                        return True
+                    return False
+        return False
 
-    def finish_multi_part_download(self, content: Content, multipart_downloader: MultipartDownloader):
-        parts = multipart_downloader.part_count
+    def finish_multi_part_download(self, content: Content, multipart_downloader: MultipartDownloader,
+                                   partial: PartialDownload):
         failed = multipart_downloader.failed_parts
-        if failed > 0:
-            failed_percent = round((failed / parts) * 100)
+        if failed > 0 and (self.hard_stop or self.stop_run.is_set()):
+            self.handle_download_stopped(content)
+        elif failed > 0:
+            # the completed ranges are kept in the partial download's completion map so that only the missing ranges
+            # are downloaded when the content is retried
+            missing_percent = math.ceil((multipart_downloader.missing_bytes / partial.size) * 100)
             content.set_download_error(Error.MULTIPART_FAILURE,
-                                       f'{failed_percent}% of multi-part download parts failed to download')
+                                       f'{failed} multi-part download ranges ({missing_percent}% of the file) failed '
+                                       f'to download')
         else:
+            partial.finish()
+            content.expected_size = partial.size
+            # the parts of a multi-part download are written out of order, so the file is hashed while it is verified
+            content.content_hash = multipart_downloader.content_hash.hexdigest()
             self.finish_download(content)
 
+    def handle_download_stopped(self, content: Content):
+        """
+        Fails a download that was stopped before it finished with an error that makes it due again straight away.  The
+        bytes that were downloaded are kept so that the download is resumed the next time it is downloaded.
+        """
+        message = 'Download was stopped before finished'
+        self.logger.debug('Download stopped', extra={'url': content.url, 'stop_latency': self.stop_run.latency})
+        content.set_download_error(Error.DOWNLOAD_STOPPED, message)
+        Message.send_download_error(f'{message}. Download of "{content.get_full_file_path()}" will be resumed '
+                                    f'the next time it is downloaded')
+
+    def handle_insufficient_disk_space(self, content: Content, reservation):
+        """
+        Fails a download that does not fit on its volume with a retryable error, so that its download slot is freed
+        for the rest of the queue.  The bytes that were downloaded are kept so that the download is resumed once space
+        has been freed.
+        """
+        message = 'Failed Download: Not enough disk space for the file'
+        self.logger.warning(message, extra={'url': content.url, 'size': reservation.size,
+                                            'save_path': content.get_full_file_path()})
+        self.output_error(content, message)
+        content.set_download_error(Error.INSUFFICIENT_DISK_SPACE, f'{message}: {reservation.size} bytes')
+
+    def handle_integrity_failure(self, content: Content, problem):
+        """
+        Fails the download of content whose file did not pass verification once it was written, such as an error page
+        sent in place of an image.  The file is removed so that it is not mistaken for the content.
+        """
+        message = 'Failed Download: Downloaded file failed verification'
+        self.log_errors(content, message, problem=problem)
+        self.output_error(content, message)
+        try:
+            os.remove(content.get_full_file_path())
+        except OSError:
+            pass
+        content.set_download_error(Error.INTEGRITY_FAILURE, f'{message}: {problem}')
+
     def handle_unsuccessful_response(self, content: Content, status_code):
         message = 'Failed Download: Unsuccessful response from server'
         self.log_errors(content, message, status_code=status_code)
         self.output_error(content, message)
         content.set_download_error(Error.UNSUCCESSFUL_RESPONSE, f'{message}: status_code: {status_code}')
 
-    def handle_connection_error(self, content: Content):
+    def handle_circuit_open(self, content: Content, circuit_open: CircuitOpen):
+        """
+        Defers the download of content whose domain's circuit is open to the retry scheduler instead of failing it, as
+        the content has not been requested.
+        """
+        content.set_download_deferred(circuit_open.retry_after)
+        self.logger.debug('Download deferred while domain circuit is open',
+                          extra={'url': content.url, 'domain': circuit_open.domain})
+        Message.send_debug(f'Deferred: {content.url}: requests to {circuit_open.domain} are paused')
+
+    def handle_connection_error(self, content: Content, exc_info=True):
         message = 'Failed Download: Failed to establish download connection'
-        self.log_errors(content, message)
+        self.log_errors(content, message, exc_info=exc_info)
         self.output_error(content, message)
         content.set_download_error(Error.CONNECTION_ERROR, message)
 
-    def handle_unknown_error(self, content: Content):
+    def handle_unknown_error(self, content: Content, exc_info=True):
         message = 'An unknown error occurred during download'
-        self.log_errors(content, message)
+        self.log_errors(content, message, exc_info=exc_info)
         self.output_error(content, message)
         content.set_download_error(Error.UNKNOWN_ERROR, message)
 
-    def log_errors(self, content: Content, message, **kwargs):
+    def log_errors(self, content: Content, message, exc_info=True, **kwargs):
         extra = {
             'url': content.url,
             'title': content.title,
@@ -161,7 +549,7 @@ class Downloader(Runner):
             'save_path': content.get_full_file_path(),
             **kwargs
         }
-        self.logger.error(message, extra=extra, exc_info=True)
+        self.logger.error(message, extra=extra, exc_info=exc_info)
 
     def output_error(self, content, message):
         output_append = f'\nPost: {content.post.title}\nUrl: {content.url}\nUser: {content.user}\n' \
@@ -21,6 +21,8 @@ class Error(Enum):
     UNRECOGNIZED_EXTENSION = 16
     RATE_LIMIT_ERROR = 17
     CREDIT_ERROR = 18
+    INTEGRITY_FAILURE = 19
+    INSUFFICIENT_DISK_SPACE = 20
 
 
 # list of errors that should not be retried
@@ -0,0 +1,208 @@
+import os
+import json
+import logging
+from datetime import datetime
+from threading import Lock
+from time import monotonic
+
+from .errors import Error
+from ..database.models import Content
+from ..utils import injector, system_util
+
+
+class FileSyncBatcher:
+
+    """
+    Moves completed downloads from their temp files to their final paths and makes them durable.  Files are written to a
+    temp name in the same directory as the final path and renamed over it once they are complete, so a file at the
+    final path is never one that was partly written by a download that was stopped or crashed.  The rename alone does
+    not make the file durable though: until the file's data and its directory entry have been flushed to the disk, a
+    power loss or system crash can still leave the file empty or truncated.
+
+    Flushing every file as it is finished would cost a disk sync per file, so files are flushed in batches per
+    directory.  The first file finalised in a directory opens a batch, and the batch is synced once it has been open
+    for the sync interval: the data of every file in the batch is flushed, followed by the directory itself.  Open
+    batches are recorded in a small journal in the data directory, which is the only thing synced when a batch is
+    opened.  If the application stops before a batch is synced, the journal names the directories that may hold files
+    that were not made durable and the time their batch was opened, so that on the next start only the content
+    downloaded to those directories since then has to be checked, instead of every file that has been downloaded.
+    """
+
+    JOURNAL_NAME = 'pending_file_sync.json'
+
+    def __init__(self, journal_path=None):
+        self.logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
+        self.lock = Lock()
+        # batches are keyed by directory and hold the time the batch was opened, the monotonic time it is due to be
+        # synced and the paths of the files in it
+        self.batches = {}
+        # batches that have been taken to be synced, kept in the journal until the sync is complete
+        self.syncing = {}
+        self._journal_path = journal_path
+
+    @property
+    def settings_manager(self):
+        return injector.get_settings_manager()
+
+    @property
+    def journal_path(self):
+        if self._journal_path is None:
+            self._journal_path = os.path.join(system_util.get_data_directory(), self.JOURNAL_NAME)
+        return self._journal_path
+
+    @property
+    def enabled(self):
+        return self.settings_manager.sync_downloaded_files
+
+    def finalise(self, temp_path, path):
+        """
+        Atomically moves a completed temp file to its final path and adds the file to the sync batch of its directory.
+        Batches that are due to be synced are synced by the calling thread.
+        :param temp_path: The path of the temp file that the data was written to.
+        :param path: The final path of the file.
+        """
+        if not self.enabled:
+            os.replace(temp_path, path)
+            return
+        directory = os.path.dirname(os.path.abspath(path))
+        with self.lock:
+            batch = self.batches.get(directory)
+            if batch is None:
+                batch = {
+                    'opened': datetime.now(),
+                    'due': monotonic() + self.settings_manager.file_sync_interval,
+                    'paths': set(),
+                }
+                self.batches[directory] = batch
+                # the journal must record the batch before any file in it could be lost
+                self.write_journal(durable=True)
+            os.replace(temp_path, path)
+            batch['paths'].add(path)
+        self.sync_due()
+
+    def sync_due(self):
+        """Syncs the batches that have been open for at least the sync interval."""
+        now = monotonic()
+        self.sync_batches(lambda batch: batch['due'] <= now)
+
+    def flush(self):
+        """Syncs every open batch.  Called at the end of a download session."""
+        self.sync_batches(lambda batch: True)
+
+    def sync_batches(self, select):
+        with self.lock:
+            batches = {directory: batch for directory, batch in self.batches.items() if select(batch)}
+            for directory in batches:
+                del self.batches[directory]
+            self.syncing.update(batches)
+        if not batches:
+            return
+        for directory, batch in batches.items():
+            self.sync_batch(directory, batch['paths'])
+        with self.lock:
+            for directory, batch in batches.items():
+                if self.syncing.get(directory) is batch:
+                    del self.syncing[directory]
+            self.write_journal()
+
+    def sync_batch(self, directory, paths):
+        for path in paths:
+            try:
+                system_util.sync_file(path)
+            except FileNotFoundError:
+                # the file has been removed since it was finalised, such as a dropped near duplicate image
+                pass
+            except OSError:
+                self.logger.warning('Failed to sync downloaded file', extra={'path': path}, exc_info=True)
+        try:
+            system_util.sync_directory(directory)
+        except OSError:
+            self.logger.warning('Failed to sync download directory', extra={'directory': directory}, exc_info=True)
+        self.logger.debug('Synced download directory', extra={'directory': directory, 'file_count': len(paths)})
+
+    def write_journal(self, durable=False):
+        """
+        Writes the open and syncing batches to the journal, or removes the journal if there are none.  Must be called
+        while holding the lock.
+        :param durable: If True, the journal is synced to the disk before this returns.
+        """
+        batches = {**self.batches, **self.syncing}
+        try:
+            if not batches:
+                system_util.delete_file(self.journal_path)
+                return
+            data = {directory: batch['opened'].isoformat() for directory, batch in batches.items()}
+            temp_path = self.journal_path + '.tmp'
+            with open(temp_path, 'w') as file:
+                json.dump(data, file)
+                if durable:
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.replace(temp_path, self.journal_path)
+            if durable:
+                system_util.sync_directory(os.path.dirname(os.path.abspath(self.journal_path)))
+        except OSError:
+            self.logger.warning('Failed to write file sync journal', exc_info=True)
+
+    def recover(self):
+        """
+        Checks the content that was downloaded to the directories of the batches that had not been synced when the
+        application last stopped.  Content whose file is missing, or is not the size it was downloaded at, is failed
+        with an integrity failure, which the retry scheduler makes due straight away, so that it will be downloaded
+        again, and its broken file is removed so that the new download is not given a different file name.  Text posts
+        are written from the post's text rather than downloaded, so they are only reported.
+        :return: The number of content items that were marked as not downloaded.
+        """
+        try:
+            with open(self.journal_path, 'r') as file:
+                journal = json.load(file)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError):
+            self.logger.warning('Failed to load file sync journal', exc_info=True)
+            journal = {}
+        directories = {directory: datetime.fromisoformat(opened) for directory, opened in journal.items()}
+        reset_count = 0
+        if directories:
+            with injector.get_database_handler().get_scoped_session() as session:
+                content_list = session.query(Content) \
+                    .filter(Content.downloaded.is_(True)) \
+                    .filter(Content.download_date >= min(directories.values())) \
+                    .all()
+                for content in content_list:
+                    path = content.get_full_file_path()
+                    opened = directories.get(os.path.dirname(os.path.abspath(path)))
+                    if opened is None or content.download_date < opened or self.file_intact(content):
+                        continue
+                    if content.is_text:
+                        self.logger.warning('Text post file was not synced before the application stopped',
+                                            extra={'path': path})
+                        continue
+                    try:
+                        system_util.delete_file(path)
+                    except OSError:
+                        pass
+                    content.download_date = None
+                    content.etag = None
+                    content.last_modified = None
+                    content.file_size = None
+                    content.set_download_error(Error.INTEGRITY_FAILURE,
+                                               'File was not synced to the disk before the application stopped')
+                    reset_count += 1
+        try:
+            system_util.delete_file(self.journal_path)
+        except OSError:
+            self.logger.warning('Failed to remove file sync journal', exc_info=True)
+        if reset_count > 0:
+            self.logger.warning('Content files were not synced before the application stopped and will be downloaded '
+                                'again', extra={'content_count': reset_count})
+        return reset_count
+
+    @staticmethod
+    def file_intact(content):
+        """Returns True if the content's file exists and is the size that it was downloaded at."""
+        try:
+            size = os.path.getsize(content.get_full_file_path())
+        except OSError:
+            return False
+        return content.file_size is None or size == content.file_size
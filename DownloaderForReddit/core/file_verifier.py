@@ -0,0 +1,117 @@
+import os
+import mmap
+from enum import Enum
+
+
+# the number of bytes at the start of a file recorded as its signature
+SIGNATURE_LENGTH = 16
+# the number of bytes at the end of a file that are searched for the format's trailer
+TRAILER_LENGTH = 32
+
+# format name: the (offset, magic bytes) pairs that the start of a file of the format may hold
+MAGIC_BYTES = {
+    'jpeg': [(0, b'\xff\xd8\xff')],
+    'png': [(0, b'\x89PNG\r\n\x1a\n')],
+    'gif': [(0, b'GIF87a'), (0, b'GIF89a')],
+    'webp': [(8, b'WEBP')],
+    'avi': [(8, b'AVI ')],
+    'mp4': [(4, b'ftyp')],
+    'webm': [(0, b'\x1a\x45\xdf\xa3')],
+    'mpg': [(0, b'\x00\x00\x01\xba'), (0, b'\x00\x00\x01\xb3')],
+    'wmv': [(0, b'\x30\x26\xb2\x75\x8e\x66\xcf\x11')],
+}
+
+# the bytes that the last bytes of a complete file of the format contain
+TRAILERS = {
+    'jpeg': b'\xff\xd9',
+    'png': b'IEND\xae\x42\x60\x82',
+    'gif': b'\x3b',
+}
+
+# the first bytes of a text response, such as an error page, saved in place of a media file
+TEXT_PREFIXES = (b'<', b'{', b'[')
+
+
+class FileStatus(Enum):
+
+    OK = 1
+    MISSING = 2
+    TRUNCATED = 3
+    CORRUPT = 4
+    # the file is the expected size but does not hold the trailer of its format.  This is not enough to remove the file
+    # for, as the size of the file may not have been known and some writers leave the trailer out, so it is reported
+    NO_TRAILER = 5
+
+
+def get_format(header):
+    """Returns the name of the media format that the supplied header bytes belong to, or None if it is not known."""
+    for name, signatures in MAGIC_BYTES.items():
+        if any(header[offset:offset + len(magic)] == magic for offset, magic in signatures):
+            return name
+    return None
+
+
+def read_signature(path):
+    """Returns the signature of the file at the supplied path, which is the hex of its first bytes."""
+    with open(path, 'rb') as file:
+        return file.read(SIGNATURE_LENGTH).hex()
+
+
+def check_header(header):
+    """
+    Checks that the first bytes of a downloaded media file are not the start of a text response or bytes that were
+    never written, which are what is saved when a server answers with an error page or a download stops part way into
+    a preallocated file.  Formats that are not known are accepted.
+    """
+    if not header or header.count(0) == len(header):
+        return False
+    return get_format(header) is not None or not header.lstrip().startswith(TEXT_PREFIXES)
+
+
+def check_file(path, expected_size=None, signature=None, media=True):
+    """
+    Checks a downloaded file against the size and signature recorded when it was downloaded and, for the formats with
+    a known trailer, that the file holds the trailer.  Only the header and the last bytes are read, through a memory
+    map of the file, unless the trailer is not in the last bytes.  Only a file that is shorter than its expected size
+    is truncated: a file whose trailer can not be found is reported as having no trailer, as data after the end of the
+    format, such as the video of a motion photo, is valid.  This is a module level function so that it can be run in a
+    process pool.
+    :param path: The path of the file.
+    :param expected_size: The size of the file on the server when it was downloaded, if known.
+    :param signature: The signature recorded when the file was downloaded, if any.
+    :param media: True if the file is expected to be a media file, whose header is checked.
+    :return: The status of the file and a description of the problem, if any.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return FileStatus.MISSING, 'File not found'
+    if expected_size is not None and size < expected_size:
+        return FileStatus.TRUNCATED, f'{size} of {expected_size} bytes on disk'
+    if expected_size is not None and size != expected_size:
+        return FileStatus.CORRUPT, f'{size} bytes on disk, {expected_size} bytes expected'
+    if size == 0:
+        return (FileStatus.TRUNCATED, 'Empty file') if expected_size is None else (FileStatus.OK, None)
+    try:
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            header = view[:SIGNATURE_LENGTH]
+            if signature is not None and header.hex() != signature:
+                return FileStatus.CORRUPT, 'File header does not match the downloaded file'
+            if media and not check_header(header):
+                return FileStatus.CORRUPT, 'File is not a media file'
+            trailer_bytes = TRAILERS.get(get_format(header), None)
+            if trailer_bytes is not None and trailer_bytes not in view[-TRAILER_LENGTH:] and \
+                    view.rfind(trailer_bytes, len(header)) == -1:
+                return FileStatus.NO_TRAILER, 'File does not hold the end of its format'
+    except (OSError, ValueError) as e:
+        return FileStatus.MISSING, f'File could not be read: {e}'
+    return FileStatus.OK, None
+
+
+def check_items(items):
+    """
+    Checks the files of a batch of content items for the verification scan.  Each item is a tuple of the content id
+    followed by the check_file arguments.
+    :return: A list of (content id, (status, problem)) tuples.
+    """
+    return [(content_id, check_file(*args)) for content_id, *args in items]
@@ -0,0 +1,197 @@
+import time
+import logging
+from threading import Lock, Condition
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from urllib.parse import urlparse
+
+from ..utils import injector
+
+
+class HostState:
+
+    """
+    Holds the connection count and request token bucket for a single host.  The bucket holds at most one second worth
+    of requests so that a host that has been idle cannot be sent a large burst of requests at once.
+    """
+
+    def __init__(self, max_connections, requests_per_second):
+        self.max_connections = max_connections
+        self.requests_per_second = requests_per_second
+        self.capacity = max(1.0, float(requests_per_second))
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.active = 0
+        self.condition = Condition(Lock())
+
+        self.request_count = 0
+        self.waited_count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.requests_per_second)
+        self.last_refill = now
+
+    def try_acquire(self):
+        """
+        Takes a connection slot and a request token if both are available.  Must be called while holding the condition
+        lock.
+        :return: 0 if the slot was acquired, otherwise the number of seconds to wait before trying again.
+        """
+        self.refill()
+        if self.active >= self.max_connections:
+            return HostLimiter.POLL_INTERVAL
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.requests_per_second
+        self.tokens -= 1
+        self.active += 1
+        return 0
+
+    def record_wait(self, wait):
+        self.request_count += 1
+        if wait > 0:
+            self.waited_count += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def get_stats(self):
+        return {
+            'requests': self.request_count,
+            'waited_requests': self.waited_count,
+            'average_wait': round(self.total_wait / self.request_count, 3) if self.request_count > 0 else 0,
+            'max_wait': round(self.max_wait, 3),
+            'total_wait': round(self.total_wait, 3),
+        }
+
+
+class HostLimiter:
+
+    """
+    A central limiter that coordinates every request made to a host by the extractors, the downloader and the
+    multi-part downloader.  Each host is limited to a maximum number of simultaneous connections and a requests per
+    second budget.  Limits for specific hosts are set in the settings manager's host_limits dict, and any host not
+    found there uses the host_limit_defaults.  A configured host also applies to its subdomains, so limits set for
+    'imgur.com' apply to 'i.imgur.com'.
+
+    The time each request spends waiting on the limiter is recorded per host so that the limits can be tuned.
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self):
+        self.logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
+        self.hosts = {}
+        self.lock = Lock()
+
+    def get_host(self, url):
+        """
+        Returns the key that the supplied url is limited under.  This is the most specific configured host that the
+        url's host name falls under, or the url's host name if no configured host matches.
+        """
+        try:
+            host = (urlparse(url).hostname or '').lower()
+        except (AttributeError, TypeError, ValueError):
+            host = ''
+        parts = host.split('.')
+        for x in range(len(parts) - 1):
+            key = '.'.join(parts[x:])
+            if key in injector.get_settings_manager().host_limits:
+                return key
+        return host
+
+    def get_state(self, host):
+        with self.lock:
+            state = self.hosts.get(host, None)
+            if state is None:
+                settings_manager = injector.get_settings_manager()
+                limits = {**settings_manager.host_limit_defaults, **settings_manager.host_limits.get(host, {})}
+                state = HostState(max(1, limits['max_connections']), max(0.1, limits['requests_per_second']))
+                self.hosts[host] = state
+            return state
+
+    def try_acquire(self, url):
+        """
+        Attempts to acquire a request slot for the host of the supplied url without blocking.  Used by callers that
+        cannot block a thread while waiting, such as the async download engine.
+        :return: A tuple of the host key and 0 if the slot was acquired, or the number of seconds to wait before
+                 trying again.
+        """
+        host = self.get_host(url)
+        state = self.get_state(host)
+        with state.condition:
+            return host, state.try_acquire()
+
+    def acquire(self, url, stop_event=None):
+        """
+        Blocks until a request slot is available for the host of the supplied url.
+        :param url: The url that is about to be requested.
+        :param stop_event: An optional cancellation token which, if cancelled while waiting, stops the wait.
+        :return: The host key that the slot was acquired for, or None if the wait was stopped before a slot was
+                 acquired.
+        """
+        host = self.get_host(url)
+        state = self.get_state(host)
+        start = None
+        # a host at its connection limit is only waited on until a slot is released, so a stop wakes the wait as well.
+        # The callback is registered before the condition is held as it is called straight away if already cancelled
+        wake = stop_event.on_cancel(partial(self.wake, state)) if stop_event is not None else nullcontext()
+        with wake, state.condition:
+            while True:
+                wait = state.try_acquire()
+                if wait == 0:
+                    state.record_wait(time.monotonic() - start if start is not None else 0)
+                    return host
+                if stop_event is not None and stop_event.is_set():
+                    return None
+                if start is None:
+                    start = time.monotonic()
+                state.condition.wait(wait)
+
+    @staticmethod
+    def wake(state):
+        """Wakes the requests waiting for a slot for a host so that they check whether they were stopped."""
+        with state.condition:
+            state.condition.notify_all()
+
+    def record_wait(self, host, wait):
+        """Records the wait time of a slot that was acquired with try_acquire."""
+        state = self.get_state(host)
+        with state.condition:
+            state.record_wait(wait)
+
+    def release(self, host):
+        state = self.get_state(host)
+        with state.condition:
+            state.active = max(0, state.active - 1)
+            state.condition.notify()
+
+    @contextmanager
+    def limit(self, url, stop_event=None):
+        """
+        Context manager that holds a request slot for the host of the supplied url for the duration of the block.  The
+        value yielded is False if the wait was stopped before a slot could be acquired, in which case the request
+        should not be made.
+        """
+        host = self.acquire(url, stop_event=stop_event)
+        try:
+            yield host is not None
+        finally:
+            if host is not None:
+                self.release(host)
+
+    def reset(self):
+        """Clears the host states so that new limits from the settings manager and fresh statistics are used."""
+        with self.lock:
+            self.hosts.clear()
+
+    def get_stats(self):
+        with self.lock:
+            hosts = list(self.hosts.items())
+        return {host: state.get_stats() for host, state in hosts if state.request_count > 0}
+
+    def log_stats(self):
+        stats = self.get_stats()
+        if stats:
+            self.logger.info('Host limiter wait times', extra={'host_wait_times': stats})
@@ -0,0 +1,240 @@
+import os
+import logging
+from threading import Lock
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from .errors import Error
+from ..database.models import Content, ImageHash
+from ..utils import injector
+
+
+logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
+
+HASH_BITS = 64
+
+
+def get_dhash(path):
+    """
+    Computes the 64 bit difference hash of the image at the supplied path.  The image is reduced to a 9x8 grayscale
+    image and each bit of the hash records whether a pixel is brighter than the pixel to its right.  Because only the
+    relative brightness of neighbouring pixels is used, the hash is the same or very close for copies of an image that
+    have been resized or recompressed.  This runs in a worker process, so it is a module level function.
+    :param path: The path of the image file to hash.
+    :return: The hash as an unsigned 64 bit integer.
+    """
+    with Image.open(path) as image:
+        image.draft('L', (64, 64))  # lets jpeg images be decoded at a reduced size
+        pixels = image.convert('L').resize((9, 8), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            right = pixels[row * 9 + column + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def to_signed(value):
+    """Converts an unsigned 64 bit hash to the signed value that can be stored in an sqlite integer column."""
+    return value - (1 << HASH_BITS) if value >= (1 << (HASH_BITS - 1)) else value
+
+
+def to_unsigned(value):
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+def hamming_distance(first, second):
+    return bin(first ^ second).count('1')
+
+
+class ImageHashIndex:
+
+    """
+    An in memory multi-index of the perceptual hashes of every downloaded image, used to find images that are within a
+    hamming distance of a new image.  Each hash is split into distance + 1 bands and each band is indexed separately.
+    By the pigeonhole principle, two hashes that differ in no more than the distance bits must have at least one band
+    that is identical, so only the hashes that share a band with the searched hash have to be compared.  This keeps a
+    lookup to a handful of dict lookups and comparisons even with millions of stored hashes.
+
+    The index is loaded from the image hash table the first time it is used and is rebuilt if the distance setting is
+    changed.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.hashes = None
+        self.distance = None
+        self.bands = []
+
+    def get_band_keys(self, value):
+        """Returns the value of each band of the supplied hash, in the order of the index bands."""
+        band_count = len(self.bands)
+        keys = []
+        start = 0
+        for band in range(band_count):
+            width = HASH_BITS // band_count + (1 if band < HASH_BITS % band_count else 0)
+            keys.append((value >> start) & ((1 << width) - 1))
+            start += width
+        return keys
+
+    def load(self, distance):
+        """
+        Builds the index for the supplied distance from the image hashes of downloaded content stored in the database.
+        Must be called while holding the lock.
+        """
+        if self.hashes is None:
+            db = injector.get_database_handler()
+            with db.get_scoped_session() as session:
+                query = session.query(ImageHash.content_id, ImageHash.value) \
+                    .join(Content, Content.id == ImageHash.content_id) \
+                    .filter(Content.downloaded.is_(True))
+                self.hashes = {content_id: to_unsigned(value) for content_id, value in query}
+        if self.distance != distance:
+            self.distance = distance
+            self.bands = [{} for _ in range(min(HASH_BITS, distance + 1))]
+            for content_id, value in self.hashes.items():
+                self.index(content_id, value)
+
+    def index(self, content_id, value):
+        for band, key in zip(self.bands, self.get_band_keys(value)):
+            band.setdefault(key, []).append(content_id)
+
+    def remove(self, content_id):
+        """Removes the hash of a content item from the index.  Must be called while holding the lock."""
+        value = self.hashes.pop(content_id, None)
+        if value is None:
+            return
+        for band, key in zip(self.bands, self.get_band_keys(value)):
+            content_ids = band.get(key, [])
+            if content_id in content_ids:
+                content_ids.remove(content_id)
+
+    def find(self, value, distance):
+        """
+        Returns the id of the content whose image hash is closest to the supplied hash within the supplied distance.
+        :return: A tuple of the content id and hamming distance of the closest match, or None if no stored image is
+                 within the distance.
+        """
+        with self.lock:
+            self.load(distance)
+            return self.find_loaded(value)
+
+    def find_loaded(self, value):
+        match = None
+        for band, key in zip(self.bands, self.get_band_keys(value)):
+            for content_id in band.get(key, ()):
+                distance = hamming_distance(value, self.hashes[content_id])
+                if distance <= self.distance and (match is None or distance < match[1]):
+                    match = (content_id, distance)
+        return match
+
+    def add(self, content_id, value, distance, check=True):
+        """
+        Adds the hash of a content item's image to the index.  If check is True the hash is only added if the index
+        does not already hold an image within the supplied distance.  The check and the add are done together so that
+        two near duplicates that finish hashing at the same time cannot both be added.  A content item that is already
+        in the index, such as content that has been downloaded again, has its old hash replaced.
+        :return: The (content id, distance) of the closest existing match if one was found, otherwise None.
+        """
+        with self.lock:
+            self.load(distance)
+            self.remove(content_id)
+            match = self.find_loaded(value) if check else None
+            if match is None:
+                self.hashes[content_id] = value
+                self.index(content_id, value)
+            return match
+
+    def reset(self):
+        with self.lock:
+            self.hashes = None
+            self.distance = None
+            self.bands = []
+
+
+class ImageHasher:
+
+    """
+    Computes perceptual hashes for downloaded images in a pool of worker processes so that the image decoding does not
+    hold up the download threads.  Each hash is stored in the image hash table and added to the image hash index.  If
+    the drop near duplicate images setting is enabled, a downloaded image that is within the near duplicate distance of
+    an image that has already been downloaded is deleted and its content is marked as duplicate content.
+    """
+
+    def __init__(self):
+        self.settings_manager = injector.get_settings_manager()
+        self.db = injector.get_database_handler()
+        self.executor = None
+        self.lock = Lock()
+        self.dropped_count = 0
+
+    @classmethod
+    def available(cls):
+        """Returns True if the libraries needed to hash images are installed."""
+        return Image is not None
+
+    @property
+    def enabled(self):
+        return self.available() and (self.settings_manager.compute_image_hashes or
+                                     self.settings_manager.drop_near_duplicate_images)
+
+    def submit(self, content: Content):
+        """Starts hashing the image file of the supplied content item in the process pool."""
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max(1, self.settings_manager.image_hash_process_count))
+            path = content.get_full_file_path()
+            future = self.executor.submit(get_dhash, path)
+        future.add_done_callback(partial(self.finish_hash, content.id, path))
+
+    def finish_hash(self, content_id, path, future):
+        try:
+            value = future.result()
+        except Exception:
+            logger.warning('Failed to compute image hash', extra={'path': path}, exc_info=True)
+            return
+        try:
+            drop = self.settings_manager.drop_near_duplicate_images
+            match = injector.get_image_hash_index().add(content_id, value,
+                                                        self.settings_manager.near_duplicate_distance, check=drop)
+            with self.db.get_scoped_update_session() as session:
+                # content that is downloaded again already has a hash, which is replaced
+                image_hash = session.query(ImageHash).filter(ImageHash.content_id == content_id).first()
+                if image_hash is None:
+                    session.add(ImageHash(content_id=content_id, value=to_signed(value)))
+                else:
+                    image_hash.value = to_signed(value)
+                if drop and match is not None and match[0] != content_id:
+                    self.drop_near_duplicate(session.query(Content).get(content_id), path, match)
+        except Exception:
+            logger.error('Failed to save image hash', extra={'content_id': content_id, 'path': path}, exc_info=True)
+
+    def drop_near_duplicate(self, content, path, match):
+        match_id, distance = match
+        try:
+            os.remove(path)
+        except OSError:
+            logger.warning('Failed to remove near duplicate image', extra={'path': path}, exc_info=True)
+            return
+        content.downloaded = False
+        content.download_session_id = None
+        content.download_error = Error.DUPLICATE_CONTENT
+        content.error_message = f'Near duplicate of content id {match_id} (distance: {distance})'
+        with self.lock:
+            self.dropped_count += 1
+        logger.debug('Dropped near duplicate image', extra={'path': path, 'duplicate_of': match_id,
+                                                            'distance': distance})
+
+    def shutdown(self):
+        """Waits for the images that have been submitted to be hashed and stops the worker processes."""
+        with self.lock:
+            executor = self.executor
+            self.executor = None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -1,79 +1,396 @@
 import os
+import glob
+import time
 import requests
-import asyncio
 import logging
-from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Lock
 
 from .runner import Runner, verify_run
-from ..utils import injector
+from .partial_download import PartialDownload
+from .cancellation import Cancelled
+from ..utils import injector, system_util
 
 
 class MultipartDownloader(Runner):
 
-    def __init__(self, stop_run):
+    """
+    Downloads a large file as byte ranges that are requested in parallel by the session's multi-part scheduler.
+
+    The ranges that have been completed are kept in a completion map, which is the completion map of the partial
+    download if one is supplied so that it is saved with the partial download's sidecar as each range completes.  Each
+    range is checked to have received exactly the bytes that were requested, and a hash of its bytes is recorded with
+    it.  Ranges that fail are requested again once the other ranges are finished, and a range that is still missing
+    when the download gives up stays missing in the completion map, so a retried download only requests the missing
+    ranges.  Once every range is complete the assembled file is checked to be the size of the file on the server, and
+    each range is read back and checked against its recorded hash while the content hash of the file is computed.  A
+    range whose bytes do not match is removed from the completion map and downloaded again.
+    """
+
+    # the number of times the ranges that are missing once the other ranges are finished are requested again
+    MISSING_RANGE_RETRIES = 2
+
+    def __init__(self, stop_run, scheduler):
         super().__init__(stop_run)
         self.logger = logging.getLogger(__name__)
         self.settings_manager = injector.get_settings_manager()
-        self.executor = ThreadPoolExecutor(self.settings_manager.multi_part_thread_count)
+        self.connection_pool = injector.get_connection_pool()
+        self.host_limiter = injector.get_host_limiter()
+        self.range_sizer = injector.get_range_sizer()
+        self.bandwidth_limiter = injector.get_bandwidth_limiter()
+        self.file_sync_batcher = injector.get_file_sync_batcher()
+        self.receive_buffer = injector.get_receive_buffer()
+        self.scheduler = scheduler
         self.chunk_size = self.settings_manager.multi_part_chunk_size
         self.part_count = 0
         self.failed_parts = 0
+        self.missing_bytes = 0
+        self.logged_errors = 0
+        self.lock = Lock()
+        self.partial = None
+        self.completed_ranges = {}
+        self.ranges = []
+        # the hash of the assembled file, computed while the file is verified
+        self.content_hash = None
 
-    def run(self, url, path, size):
-        loop = asyncio.new_event_loop()
+    def run(self, url, path, size, first_range_end=0, partial=None):
+        """
+        :param first_range_end: The number of bytes at the start of the preallocated file that have already been
+                                written from the response that found the file's size.
+        :param partial: Optional.  The partial download whose completion map the completed ranges are recorded in.
+        """
+        self.partial = partial
+        if partial is not None:
+            self.completed_ranges = partial.completed_ranges
+        self.part_count = len(range(0, size, self.chunk_size))
+        # every part is counted as failed until the download has checked that the parts are complete
+        self.failed_parts = self.part_count
+        self.missing_bytes = size
         try:
-            loop.run_until_complete(self.download(url, path, size))
+            self.download(url, path, size, first_range_end)
         except:
             self.logger.error('Multi-part download failed', extra={'url': url, 'path': path}, exc_info=True)
-        finally:
-            loop.close()
 
     @verify_run
-    async def download(self, url, path, file_size):
-        loop = asyncio.get_event_loop()
-        chunks = range(0, file_size, self.chunk_size)
-        self.part_count = len(chunks)
-        tasks = [
-            loop.run_in_executor(
-                self.executor,
-                self.download_part,
-                url,
-                start,
-                start + self.chunk_size - 1,
-                f'{path}.part{x}'
-            )
-            for x, start in enumerate(chunks)
-        ]
-        await asyncio.wait(tasks)
-
-        with open(path, 'wb') as file:
-            for x in range(self.part_count):
-                try:
-                    chunk_path = f'{path}.part{x}'
-                    with open(chunk_path, 'rb') as part_file:
-                        file.write(part_file.read())
-                    os.remove(chunk_path)
-                except FileNotFoundError:
-                    self.logger.error('Failed to join multi-download part into complete file',
-                                      extra={'chunk_path': chunk_path}, exc_info=True)
+    def download(self, url, path, file_size, first_range_end=0):
+        """
+        Downloads each part of the file and assembles the complete file once every part has been downloaded.
+
+        If preallocation is enabled, the output file is created at its full size and each part is written directly to
+        its own offset in the file, so nothing has to be copied once the parts are complete.  Otherwise, or if the file
+        system does not support preallocation, each part is written to its own temp file and the temp files are joined
+        once every part has been downloaded.  Parts that were completed by a previous attempt are not downloaded again,
+        and if any part fails the completed parts are left in place so that the download can be resumed.
+
+        The parts are downloaded by the session's multi-part scheduler, and the calling thread waits until they are
+        finished.  Parts of a preallocated file are created as the scheduler is ready to download them, which allows
+        the size of each part to be chosen by the range sizer from the throughput of the parts before it.  Temp file
+        parts always use the multi-part chunk size so that their part numbers line up between attempts.
+
+        The first range of a preallocated file has usually already been written from the response that found the size
+        of the file, in which case the ranges start from the end of it.
+        """
+        keep = first_range_end > 0 or bool(self.completed_ranges)
+        preallocated = self.use_preallocation(path) and self.preallocate(path, file_size, keep)
+        if not preallocated:
+            parts = [(x, start, min(start + self.chunk_size, file_size) - start)
+                     for x, start in enumerate(range(0, file_size, self.chunk_size))]
+        attempt = 0
+        while self.continue_run:
+            if preallocated:
+                missing = self.get_missing_spans(file_size, first_range_end)
+                if attempt == 0:
+                    ranges = self.generate_ranges(url, path, missing)
+                else:
+                    ranges = [partial(self.download_part, url, start, length, path, None)
+                              for span_start, span_end in missing
+                              for start, length in self.split_span(span_start, span_end)]
+            else:
+                missing = [part for part in parts if not self.part_complete(path, *part)]
+                ranges = [partial(self.download_part, url, start, length, path, x) for x, start, length in missing]
+            if missing:
+                if attempt > self.MISSING_RANGE_RETRIES:
+                    break
+                if attempt > 0:
+                    self.logger.info('Retrying missing ranges of multi-part download',
+                                     extra={'url': url, 'missing_ranges': len(missing), 'attempt': attempt})
+                attempt += 1
+                self.scheduler.submit(ranges).wait()
+                continue
+            if preallocated:
+                verified = self.verify_preallocated(url, path, file_size)
+            else:
+                verified = self.join_parts(url, path, parts, file_size)
+            if verified:
+                break
+            # the ranges that failed verification have been removed from the completion map and are now missing
+            attempt = max(attempt, 1)
+
+        if self.content_hash is not None:
+            self.failed_parts = 0
+            self.missing_bytes = 0
+        else:
+            if preallocated:
+                missing = [end - start for start, end in self.get_missing_spans(file_size, first_range_end)]
+            else:
+                missing = [part[2] for part in parts if not self.part_complete(path, *part)]
+            # a download that was stopped before the file was verified has failed even if no range is missing
+            self.failed_parts = max(1, len(missing))
+            self.missing_bytes = sum(missing)
+            self.save_progress()
+        if preallocated:
+            self.part_count = len(self.ranges)
+
+    def get_missing_spans(self, file_size, first_range_end=0):
+        """
+        Returns the (start, end) spans of a preallocated file that are not covered by the first range or the
+        completion map, in the order of the file.
+        """
+        spans = []
+        position = first_range_end
+        with self.lock:
+            ranges = sorted((start, length) for start, (length, _) in self.completed_ranges.items())
+        for start, length in ranges:
+            if start > position:
+                spans.append((position, start))
+            position = max(position, start + length)
+        if position < file_size:
+            spans.append((position, file_size))
+        return spans
+
+    def split_span(self, start, end):
+        """Splits a missing span of a preallocated file into ranges of at most the multi-part chunk size."""
+        return [(x, min(x + self.chunk_size, end) - x) for x in range(start, end, self.chunk_size)]
+
+    def generate_ranges(self, url, path, spans):
+        """
+        Yields the range downloads for the supplied missing spans of a preallocated file.  The size of each range is
+        taken when the range is generated so that it reflects the throughput measured for the ranges that have already
+        been downloaded.
+        """
+        for start, end in spans:
+            while start < end and self.continue_run:
+                if self.settings_manager.multi_part_adaptive_range_size:
+                    length = self.range_sizer.get_range_size(url)
+                else:
+                    length = self.chunk_size
+                length = min(length, end - start)
+                self.ranges.append((start, length))
+                yield partial(self.download_part, url, start, length, path, None)
+                start += length
+
+    def get_part_path(self, path, index):
+        return f'{path}.part{index}'
+
+    def get_preallocated_path(self, path):
+        return path + PartialDownload.PART_SUFFIX
+
+    @staticmethod
+    def use_preallocation(path):
+        """
+        Returns True if the file should be written with positional writes to a preallocated file.  A download that was
+        started with temp file parts continues to use them so that the completed parts are not downloaded again.
+        """
+        return injector.get_settings_manager().multi_part_preallocate and \
+            not glob.glob(glob.escape(path) + PartialDownload.PART_SUFFIX + '[0-9]*')
+
+    def preallocate(self, path, size, keep=False):
+        """
+        Creates the file that the parts are written to at its final size.
+        :param keep: If True, the contents of an existing file are kept, as it holds ranges that have been completed.
+        :return: True if the file was preallocated, False if the file system does not support it.
+        """
+        preallocated_path = self.get_preallocated_path(path)
+        mode = 'r+b' if keep and os.path.exists(preallocated_path) else 'wb'
+        try:
+            with open(preallocated_path, mode) as file:
+                file.truncate(size)
+                if hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(file.fileno(), 0, size)
+            return True
+        except OSError:
+            self.logger.warning('Failed to preallocate multi-part download file, falling back to temp file parts',
+                                extra={'path': path, 'size': size}, exc_info=True)
+            try:
+                os.remove(self.get_preallocated_path(path))
+            except OSError:
+                pass
+            return False
+
+    def part_complete(self, path, index, start, length):
+        """Returns True if the temp file part has been completed, which is when it is the length of its range."""
+        try:
+            return os.path.getsize(self.get_part_path(path, index)) == length
+        except OSError:
+            return False
+
+    def record_range(self, start, length, digest):
+        """Records a completed range in the completion map and saves it with the partial download's sidecar."""
+        with self.lock:
+            self.completed_ranges[start] = (length, digest)
+            if self.partial is not None:
+                self.partial.save()
+
+    def remove_range(self, url, start):
+        """Removes a range whose bytes on the disk do not match the bytes received for it from the completion map."""
+        self.logger.warning('Multi-part download range failed verification', extra={'url': url, 'range_start': start})
+        with self.lock:
+            self.completed_ranges.pop(start, None)
+
+    def save_progress(self):
+        if self.partial is not None:
+            with self.lock:
+                self.partial.save()
+
+    def check_range(self, url, start, data_hash, verified):
+        """
+        Checks the hash of the bytes of a range read back from the disk against the hash of the bytes that were
+        received for it.  A range completed before its hash was recorded is accepted.
+        :return: True if the range matches, False if it was removed from the completion map.
+        """
+        _, digest = self.completed_ranges.get(start, (None, None))
+        if digest is None or not verified or data_hash.hexdigest() == digest:
+            return True
+        self.remove_range(url, start)
+        return False
+
+    def verify_preallocated(self, url, path, file_size):
+        """
+        Checks that the assembled preallocated file is the size of the file on the server and that each completed range
+        holds the bytes received for it, computing the content hash of the file in the same pass.  The file is moved to
+        the final path if it passes.
+        :return: True if the file passed verification, False if any range was removed from the completion map.
+        """
+        preallocated_path = self.get_preallocated_path(path)
+        actual_size = os.path.getsize(preallocated_path)
+        if actual_size != file_size:
+            self.logger.error('Multi-part download is not the size of the file on the server',
+                              extra={'url': url, 'size': actual_size, 'expected_size': file_size})
+            with self.lock:
+                self.completed_ranges.clear()
+            return False
+        content_hash = system_util.new_content_hash()
+        passed = True
+        position = 0
+        with self.lock:
+            ranges = sorted((start, length) for start, (length, _) in self.completed_ranges.items())
+        with open(preallocated_path, 'rb') as file:
+            for start, length in ranges:
+                if start > position:
+                    system_util.hash_file_object(file, start - position, content_hash)
+                    position = start
+                # a range that overlaps the bytes before it can not be read back on its own, so it is not checked
+                verified = start == position
+                range_hash = system_util.new_content_hash()
+                for chunk in system_util.read_file_object(file, start + length - position):
+                    content_hash.update(chunk)
+                    range_hash.update(chunk)
+                position = max(position, start + length)
+                passed = self.check_range(url, start, range_hash, verified) and passed
+            system_util.hash_file_object(file, None, content_hash)
+        if not passed:
+            return False
+        self.content_hash = content_hash
+        self.file_sync_batcher.finalise(preallocated_path, path)
+        return True
+
+    def join_parts(self, url, path, parts, file_size):
+        """
+        Joins the temp file parts into the file at the preallocated path, which is moved to the final path once it is
+        complete so that a join that is interrupted does not leave a truncated file at the final path.  Each part is
+        checked against the hash of the bytes received for it as it is copied, and a part that does not match is
+        removed so that it is downloaded again.
+        :return: True if the parts passed verification and were joined, otherwise False.
+        """
+        joined_path = self.get_preallocated_path(path)
+        content_hash = system_util.new_content_hash()
+        passed = True
+        with open(joined_path, 'wb') as file:
+            for x, start, _ in parts:
+                part_hash = system_util.new_content_hash()
+                with open(self.get_part_path(path, x), 'rb') as part_file:
+                    for chunk in system_util.read_file_object(part_file):
+                        part_hash.update(chunk)
+                        content_hash.update(chunk)
+                        file.write(chunk)
+                if not self.check_range(url, start, part_hash, True):
+                    os.remove(self.get_part_path(path, x))
+                    passed = False
+        if passed and os.path.getsize(joined_path) != file_size:
+            self.logger.error('Joined multi-part download is not the size of the file on the server',
+                              extra={'url': url, 'size': os.path.getsize(joined_path), 'expected_size': file_size})
+            for x, start, _ in parts:
+                self.remove_range(url, start)
+                os.remove(self.get_part_path(path, x))
+            passed = False
+        if not passed:
+            os.remove(joined_path)
+            return False
+        self.content_hash = content_hash
+        self.file_sync_batcher.finalise(joined_path, path)
+        for x, _, _ in parts:
+            os.remove(self.get_part_path(path, x))
+        return True
+
+    def open_part(self, path, start, index):
+        """
+        Opens the file that a part is written to.  Parts of a preallocated file (index is None) each open their own
+        handle to the shared file and seek to their offset, so the parts can be written from separate threads.
+        """
+        if index is not None:
+            return open(self.get_part_path(path, index), 'wb')
+        file = open(self.get_preallocated_path(path), 'r+b')
+        file.seek(start)
+        return file
 
     @verify_run
-    def download_part(self, url, start, end, path):
+    def download_part(self, url, start, length, path, index):
         retry = True
         tries = 0
+        end = start + length - 1
 
         def download():
-            headers = {'Range': f'bytes={start}-{end}'}
-            response = requests.get(url, headers=headers, stream=True, timeout=10)
-            if response.status_code == 206:
-                with open(path, 'wb') as file:
-                    for chunk in response.iter_content(self.chunk_size):
-                        file.write(chunk)
-                return True
-            else:
-                self.log_part_error('Failed to download chunk of muli-part download - bad response',
-                                    extra={'status_code': response.status_code}, exc_info=False)
-                return False
+            headers = {'Range': f'bytes={start}-{end}', 'Accept-Encoding': 'identity'}
+            with self.host_limiter.limit(url, self.stop_run) as acquired:
+                if not acquired:
+                    return False
+                request_start = time.monotonic()
+                with self.connection_pool.get(url, headers=headers, stream=True, timeout=10,
+                                              cancel_token=self.stop_run) as response:
+                    if response.status_code == 206:
+                        if not self.check_content_range(response.headers, start, end):
+                            self.log_part_error('Multi-part download chunk response is for a different range',
+                                                extra={'url': url, 'range': f'{start} - {end}',
+                                                       'content_range': response.headers.get('Content-Range')},
+                                                exc_info=False, log=tries >= 3)
+                            return False
+                        transfer_start = time.monotonic()
+                        written = 0
+                        range_hash = system_util.new_content_hash()
+                        with self.open_part(path, start, index) as file, self.stop_run.interruptible():
+                            for chunk in self.receive_buffer.iter_response(response):
+                                self.stop_run.check()
+                                # bytes past the end of the range would overwrite the start of the next range
+                                chunk = chunk[:length - written]
+                                self.bandwidth_limiter.consume(len(chunk), path, self.stop_run)
+                                file.write(chunk)
+                                range_hash.update(chunk)
+                                written += len(chunk)
+                                if written >= length:
+                                    break
+                        if written != length:
+                            self.log_part_error('Multi-part download chunk ended before it was complete',
+                                                extra={'url': url, 'range': f'{start} - {end}', 'written': written},
+                                                exc_info=False, log=tries >= 3)
+                            return False
+                        self.record_range(start, length, range_hash.hexdigest())
+                        self.range_sizer.record(url, length, transfer_start - request_start,
+                                                time.monotonic() - transfer_start)
+                        return True
+                    else:
+                        self.log_part_error('Failed to download chunk of muli-part download - bad response',
+                                            extra={'status_code': response.status_code}, exc_info=False)
+                        return False
 
         while self.continue_run and retry and tries < 3:
             tries += 1
@@ -81,6 +398,9 @@ class MultipartDownloader(Runner):
                 success = download()
                 if success:
                     retry = False
+            except Cancelled:
+                # the range is left out of the completion map, so it is downloaded again when the download is resumed
+                return
             except requests.exceptions.ConnectTimeout:
                 self.log_part_error('Operation timed out before establishing a connection to the server',
                                     extra={'url': url, 'range': f'{start} - {end}'}, log=tries >= 3)
@@ -94,10 +414,22 @@ class MultipartDownloader(Runner):
                 self.log_part_error('Unknown error occurred', extra={'url': url, 'range': f'{start} - {end}'},
                                     log=tries >= 3)
 
+    @staticmethod
+    def check_content_range(headers, start, end):
+        """Returns True if the Content-Range of a partial response is the requested range, or was not sent."""
+        content_range = headers.get('Content-Range', None)  # format: 'bytes start-end/total'
+        if content_range is None:
+            return True
+        try:
+            range_start, range_end = content_range.split()[1].split('/')[0].split('-')
+            return int(range_start) == start and int(range_end) == end
+        except (IndexError, ValueError):
+            return False
+
     def log_part_error(self, message, extra=None, exc_info=True, log=True):
         if log:
-            self.failed_parts += 1
-            if self.failed_parts <= 3:
+            self.logged_errors += 1
+            if self.logged_errors <= 3:
                 self.logger.error(message, extra=extra, exc_info=exc_info)
             else:
                 self.logger.error('Failed to download multiple chunks of multi-part download.  '
@@ -0,0 +1,150 @@
+import logging
+from collections import deque
+from threading import Thread, Condition, Event
+
+from ..utils import injector
+
+
+class MultipartJob:
+
+    """
+    The ranges of a single file that have been submitted to the multi-part scheduler.  Each range is a callable that
+    downloads one part of the file.  The ranges may be supplied by a generator, in which case each range is only
+    created when a worker is ready to download it.
+    """
+
+    def __init__(self, ranges):
+        self.ranges = iter(ranges)
+        self.active = 0
+        self.exhausted = False
+        self.finished = Event()
+
+    def take(self):
+        """Returns the next range of the job, or None if there are no ranges left."""
+        if not self.exhausted:
+            try:
+                return next(self.ranges)
+            except StopIteration:
+                self.exhausted = True
+        return None
+
+    def cancel(self):
+        self.exhausted = True
+        self.check_finished()
+
+    def check_finished(self):
+        if self.exhausted and self.active == 0:
+            self.finished.set()
+
+    def wait(self):
+        """Blocks until every range of the job has been downloaded, has failed, or was cancelled."""
+        self.finished.wait()
+
+
+class MultipartScheduler:
+
+    """
+    Downloads the ranges of every multi-part download in a download session on one bounded set of worker threads.
+    Ranges are taken from the submitted files in turn, so several large files progress together instead of one file
+    holding every worker until it is finished.  No single file has more ranges in progress than the multi-part thread
+    count, and as there is one worker per range that may be in progress, no more than the multi-part max in flight
+    setting are in progress across all files.
+
+    The worker threads are started when the first job is submitted and are stopped by shutdown at the end of the
+    download session.
+    """
+
+    # how often waiting workers check whether the download session has been stopped
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, stop_run):
+        self.logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
+        self.settings_manager = injector.get_settings_manager()
+        self.stop_run = stop_run
+        self.max_in_flight = max(1, self.settings_manager.multi_part_max_in_flight)
+        self.ranges_per_file = max(1, self.settings_manager.multi_part_thread_count)
+        self.jobs = deque()
+        self.condition = Condition()
+        self.workers = []
+        self.closed = False
+
+    def submit(self, ranges):
+        """
+        Adds the ranges of a file to the scheduler.
+        :param ranges: An iterable of callables that each download one range of the file.
+        :return: The MultipartJob that can be waited on for the ranges to finish.
+        """
+        job = MultipartJob(ranges)
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('Multi-part scheduler has been shut down')
+            self.jobs.append(job)
+            self.start_workers()
+            self.condition.notify_all()
+        return job
+
+    def start_workers(self):
+        """Starts the worker threads if they are not already running.  Must be called while holding the condition."""
+        while len(self.workers) < self.max_in_flight:
+            worker = Thread(target=self.work, name=f'MultipartWorker-{len(self.workers)}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def next_range(self):
+        """
+        Blocks until a range is available and returns it along with the job it belongs to.  Jobs are rotated after each
+        range is taken so that ranges are interleaved between files.
+        :return: A tuple of the job and the range callable, or (None, None) if the scheduler has been shut down and no
+                 ranges remain.
+        """
+        with self.condition:
+            while True:
+                if self.stop_run.is_set():
+                    self.cancel_pending()
+                for _ in range(len(self.jobs)):
+                    job = self.jobs[0]
+                    self.jobs.rotate(-1)
+                    if job.active < self.ranges_per_file:
+                        download_range = job.take()
+                        if download_range is None:
+                            self.jobs.remove(job)
+                            job.check_finished()
+                            continue
+                        job.active += 1
+                        return job, download_range
+                if self.closed and not self.jobs:
+                    return None, None
+                self.condition.wait(self.POLL_INTERVAL)
+
+    def finish_range(self, job):
+        with self.condition:
+            job.active -= 1
+            job.check_finished()
+            self.condition.notify_all()
+
+    def cancel_pending(self):
+        """Drops the ranges that have not been started.  Must be called while holding the condition."""
+        for job in self.jobs:
+            job.cancel()
+        self.jobs.clear()
+
+    def work(self):
+        while True:
+            job, download_range = self.next_range()
+            if job is None:
+                break
+            try:
+                download_range()
+            except:
+                self.logger.error('Multi-part range failed', exc_info=True)
+            finally:
+                self.finish_range(job)
+
+    def shutdown(self, wait=True):
+        """Stops the worker threads once the ranges that have been submitted are finished."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if wait:
+            for worker in self.workers:
+                worker.join()
@@ -0,0 +1,216 @@
+import os
+import glob
+import json
+import logging
+
+from ..utils import injector, system_util
+
+
+logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
+
+
+class PartialDownload:
+
+    """
+    Tracks a download that has not yet been completed so that it can be resumed instead of restarted.  Data for the
+    file is written to a '.part' file next to the final file path, and a small json sidecar records the url, the
+    validator (ETag or Last-Modified) sent by the server and the number of bytes received.  When the download is
+    retried the sidecar is loaded and a Range request is made with an If-Range header, so the server will only send the
+    remaining bytes if the file has not changed since the partial download was started.
+
+    Multi-part downloads use the same sidecar.  The first range of a multi-part download is written from the response
+    of the request that found the file's size, so the bytes received of a multi-part download are the bytes at the
+    start of the preallocated '.part' file that this response and any resumed response have written.  The rest of the
+    file is written by the multi-part downloader, either to the preallocated '.part' file or to numbered part files.
+    The ranges that the multi-part downloader has completed are recorded in the sidecar's completion map along with a
+    hash of the bytes received for each range, so that a retried download only requests the ranges that are missing
+    and the ranges can be checked against the file on the disk once the download is complete.
+    """
+
+    PART_SUFFIX = '.part'
+    SIDECAR_SUFFIX = '.part.json'
+    # how often (in bytes received) the sidecar is updated while data is being written
+    CHECKPOINT_INTERVAL = 8 * 1024 * 1024
+
+    def __init__(self, path, url, size=None, validator=None, bytes_received=0, multi_part=False,
+                 completed_ranges=None):
+        self.path = path
+        self.url = url
+        self.size = size
+        self.validator = validator
+        self.bytes_received = bytes_received
+        self.multi_part = multi_part
+        # the ranges completed by the multi-part downloader as start offset: (length, hex digest of the range's bytes)
+        self.completed_ranges = completed_ranges or {}
+        self.last_checkpoint = bytes_received
+        # hash of the bytes written to the part file, created when the part file is opened
+        self.content_hash = None
+
+    @property
+    def part_path(self):
+        return self.path + self.PART_SUFFIX
+
+    @property
+    def sidecar_path(self):
+        return self.path + self.SIDECAR_SUFFIX
+
+    @property
+    def complete(self):
+        return not self.multi_part and self.size is not None and self.bytes_received >= self.size
+
+    @property
+    def resumable(self):
+        return self.validator is not None and (self.multi_part or self.bytes_received > 0)
+
+    @classmethod
+    def exists(cls, path):
+        return os.path.exists(path + cls.SIDECAR_SUFFIX)
+
+    @classmethod
+    def load(cls, path, url):
+        """
+        Loads the partial download for the supplied file path if one exists and it was started from the supplied url.
+        A partial download for a different url is discarded.
+        :return: The loaded PartialDownload, or None if there is no usable partial download for the path.
+        """
+        try:
+            with open(path + cls.SIDECAR_SUFFIX, 'r') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            logger.warning('Failed to load partial download sidecar', extra={'path': path}, exc_info=True)
+            return None
+        completed_ranges = {start: (length, digest) for start, length, digest in data.get('completed_ranges', [])}
+        partial = cls(path, data.get('url'), data.get('size'), data.get('validator'), data.get('bytes_received', 0),
+                      data.get('multi_part', False), completed_ranges)
+        if partial.url != url:
+            partial.discard()
+            return None
+        try:
+            part_size = os.path.getsize(partial.part_path)
+        except OSError:
+            part_size = 0
+        partial.bytes_received = min(partial.bytes_received, part_size)
+        if not glob.glob(glob.escape(path) + cls.PART_SUFFIX + '[0-9]*'):
+            # ranges of a preallocated file that lie past the end of the part file were lost with the rest of the file
+            partial.completed_ranges = {start: value for start, value in completed_ranges.items()
+                                        if start + value[0] <= part_size}
+        return partial
+
+    @classmethod
+    def from_response(cls, path, url, headers):
+        """
+        Creates a new partial download from the headers of a full (status 200) response.  The size is left as None if
+        the server did not send the length of the file.
+        """
+        try:
+            size = int(headers['Content-Length'])
+        except (KeyError, ValueError):
+            size = None
+        return cls(path, url, size=size, validator=cls.get_validator(headers))
+
+    @staticmethod
+    def get_validator(headers):
+        """
+        Returns the validator that can be sent in an If-Range header to make sure the file on the server has not
+        changed.  Weak ETags are not allowed in If-Range, so Last-Modified is used in their place.
+        """
+        etag = headers.get('ETag', None)
+        if etag is not None and not etag.startswith('W/'):
+            return etag
+        return headers.get('Last-Modified', None)
+
+    def get_resume_headers(self):
+        """Returns the request headers needed to resume this download, or None if it cannot be resumed."""
+        if not self.resumable:
+            return None
+        return {'Range': f'bytes={self.bytes_received}-', 'If-Range': self.validator}
+
+    def check_resume_response(self, status_code, headers):
+        """
+        Checks that the response to a resume request is a partial response that starts where this download left off.
+        """
+        if status_code != 206:
+            return False
+        try:
+            content_range = headers['Content-Range']  # format: 'bytes start-end/total'
+            range_start = int(content_range.split()[1].split('-')[0])
+            total = content_range.split('/')[1]
+            if total != '*':
+                self.size = int(total)
+            return range_start == self.bytes_received
+        except (KeyError, IndexError, ValueError):
+            return False
+
+    def open(self):
+        """
+        Opens the part file for writing, positioned at the end of the bytes that have been received.  The content hash
+        is started from the bytes already in the part file so that it covers the whole file once the download is
+        complete.
+        """
+        if self.bytes_received > 0:
+            self.content_hash = system_util.hash_file(self.part_path, self.bytes_received)
+            file = open(self.part_path, 'r+b')
+            if not self.multi_part:
+                # the preallocated file of a multi-part download holds the completed ranges past the received bytes
+                file.truncate(self.bytes_received)
+            file.seek(self.bytes_received)
+            return file
+        self.content_hash = system_util.new_content_hash()
+        return open(self.part_path, 'wb')
+
+    def add(self, chunk):
+        """Records a chunk written to the part file, updating the sidecar every checkpoint interval."""
+        self.content_hash.update(chunk)
+        self.bytes_received += len(chunk)
+        if self.bytes_received - self.last_checkpoint >= self.CHECKPOINT_INTERVAL:
+            self.save()
+
+    def save(self):
+        data = {
+            'url': self.url,
+            'size': self.size,
+            'validator': self.validator,
+            'bytes_received': self.bytes_received,
+            'multi_part': self.multi_part,
+            'completed_ranges': [[start, length, digest] for start, (length, digest) in
+                                 sorted(self.completed_ranges.items())],
+        }
+        try:
+            with open(self.sidecar_path, 'w') as file:
+                json.dump(data, file)
+            self.last_checkpoint = self.bytes_received
+        except OSError:
+            logger.warning('Failed to save partial download sidecar', extra={'path': self.path}, exc_info=True)
+
+    def get_next_range_start(self, offset):
+        """Returns the start of the first completed range at or after the supplied offset, or None if there is none."""
+        return min((start for start in self.completed_ranges if start >= offset), default=None)
+
+    def finish(self):
+        """
+        Moves the completed part file to the final file path and removes the sidecar.  The part file of a multi-part
+        download is moved by the multi-part downloader once all of its parts are complete.
+        """
+        if not self.multi_part:
+            injector.get_file_sync_batcher().finalise(self.part_path, self.path)
+        self.remove_sidecar()
+
+    def discard(self):
+        """Removes the part files and sidecar of a partial download that can not be resumed."""
+        paths = [self.part_path]
+        if self.multi_part:
+            paths.extend(glob.glob(glob.escape(self.path) + self.PART_SUFFIX + '[0-9]*'))
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.remove_sidecar()
+
+    def remove_sidecar(self):
+        try:
+            os.remove(self.sidecar_path)
+        except OSError:
+            pass
@@ -0,0 +1,135 @@
+import logging
+from threading import Lock
+
+from ..utils import injector
+
+
+class HostRangeHistory:
+
+    """
+    The measured range throughput and latency for a single host along with the range size that the next range
+    requested from the host will use.  The size statistics cover the current download session only.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.throughput = None
+        self.latency = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.range_count = 0
+        self.total_size = 0
+        self.min_size = None
+        self.max_size = None
+
+    def record_size(self, size):
+        self.range_count += 1
+        self.total_size += size
+        self.min_size = size if self.min_size is None else min(self.min_size, size)
+        self.max_size = size if self.max_size is None else max(self.max_size, size)
+
+    def get_stats(self):
+        return {
+            'ranges': self.range_count,
+            'average_size': self.total_size // self.range_count if self.range_count > 0 else 0,
+            'min_size': self.min_size,
+            'max_size': self.max_size,
+            'next_size': self.size,
+            'throughput': round(self.throughput) if self.throughput is not None else None,
+            'latency': round(self.latency, 3) if self.latency is not None else None,
+        }
+
+
+class RangeSizer:
+
+    """
+    Chooses the size of the ranges requested by the multi-part downloader.  Ranges start at the multi-part chunk size
+    and are grown or shrunk between the minimum and maximum chunk sizes after each completed range so that a single
+    range request takes about the target range duration: the size is the measured per-connection throughput multiplied
+    by the part of the target that is not spent waiting on the server to respond.  The size can at most double or
+    halve after each range so that a single unusually fast or slow range does not swing the size too far.
+
+    Measurements are kept per host for the life of the application, so that later files from a host start from the
+    size that was reached by earlier files instead of starting small again.
+    """
+
+    # weight given to the most recent measurement when updating the throughput and latency estimates
+    SMOOTHING = 0.3
+
+    def __init__(self):
+        self.logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
+        self.hosts = {}
+        self.lock = Lock()
+
+    @property
+    def start_size(self):
+        return max(1, injector.get_settings_manager().multi_part_chunk_size)
+
+    @property
+    def min_size(self):
+        return max(1, min(self.start_size, injector.get_settings_manager().multi_part_min_chunk_size))
+
+    @property
+    def max_size(self):
+        return max(self.start_size, injector.get_settings_manager().multi_part_max_chunk_size)
+
+    def get_history(self, host):
+        history = self.hosts.get(host, None)
+        if history is None:
+            history = HostRangeHistory(self.start_size)
+            self.hosts[host] = history
+        return history
+
+    def get_range_size(self, url):
+        """Returns the size of the next range to request from the host of the supplied url."""
+        host = injector.get_host_limiter().get_host(url)
+        with self.lock:
+            history = self.get_history(host)
+            size = min(self.max_size, max(self.min_size, history.size))
+            history.record_size(size)
+            return size
+
+    def record(self, url, byte_count, latency, transfer_time):
+        """
+        Records the measurements of a completed range and updates the size of the next range for the url's host.
+        :param url: The url the range was requested from.
+        :param byte_count: The number of bytes in the range.
+        :param latency: The number of seconds between sending the request and receiving the response headers.
+        :param transfer_time: The number of seconds spent receiving the range data.
+        """
+        if byte_count <= 0:
+            return
+        host = injector.get_host_limiter().get_host(url)
+        target = injector.get_settings_manager().multi_part_target_range_seconds
+        throughput = byte_count / max(transfer_time, 0.001)
+        with self.lock:
+            history = self.get_history(host)
+            history.throughput = self.smooth(history.throughput, throughput)
+            history.latency = self.smooth(history.latency, latency)
+            # at least a quarter of the target is always spent transferring data so that a high latency host is still
+            # given ranges large enough to be worth the request
+            transfer_target = max(target - history.latency, target * 0.25)
+            size = int(history.throughput * transfer_target)
+            size = min(history.size * 2, max(history.size // 2, size))
+            history.size = min(self.max_size, max(self.min_size, size))
+
+    def smooth(self, current, measured):
+        if current is None:
+            return measured
+        return current + self.SMOOTHING * (measured - current)
+
+    def reset_stats(self):
+        """Clears the session size statistics.  The measured throughput and range sizes are kept."""
+        with self.lock:
+            for history in self.hosts.values():
+                history.reset_stats()
+
+    def get_stats(self):
+        with self.lock:
+            return {host: history.get_stats() for host, history in self.hosts.items() if history.range_count > 0}
+
+    def log_stats(self):
+        stats = self.get_stats()
+        if stats:
+            self.logger.info('Multi-part range sizes', extra={'range_sizes': stats})
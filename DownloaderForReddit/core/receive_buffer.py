@@ -0,0 +1,103 @@
+import socket
+from http.client import HTTPException
+from threading import local
+from contextlib import contextmanager
+
+import requests
+
+from ..utils import injector
+
+
+@contextmanager
+def translate_errors():
+    """
+    Raises the errors of reading a response's socket stream as the requests exceptions that iter_content raises for the
+    same failures, so that the callers handle both receive paths the same way.
+    """
+    try:
+        yield
+    except socket.timeout as e:
+        raise requests.exceptions.ConnectionError(str(e)) from e
+    except (HTTPException, OSError) as e:
+        raise requests.exceptions.ChunkedEncodingError(str(e)) from e
+
+
+class ReceiveBuffer:
+
+    """
+    Reads the bodies of download responses into a buffer that each download thread reuses for every response it reads.
+    Reading a response with iter_content allocates a new bytes object for every chunk, so with many download threads
+    each receiving a megabyte at a time a large share of the time is spent allocating, copying and freeing chunks.  The
+    receive buffer instead reads the response's socket stream straight into the thread's buffer with readinto and hands
+    out memoryview slices of the buffer, which are written to the file without being copied again.
+
+    A slice is only valid until the next chunk is read, so chunks must be written or copied before the iteration
+    continues.  Responses whose body has a content encoding that requests would decode, and responses that do not come
+    from the HTTP/1.1 connection pool (such as HTTP/2 responses), are read with iter_content instead.
+    """
+
+    def __init__(self):
+        self.local = local()
+
+    @property
+    def settings_manager(self):
+        return injector.get_settings_manager()
+
+    @property
+    def buffer_size(self):
+        return max(4096, self.settings_manager.download_buffer_size)
+
+    def get_buffer(self):
+        """Returns the calling thread's buffer, which is created again if the buffer size setting has changed."""
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None or len(buffer) != self.buffer_size:
+            buffer = memoryview(bytearray(self.buffer_size))
+            self.local.buffer = buffer
+        return buffer
+
+    @staticmethod
+    def get_stream(response):
+        """
+        Returns the socket stream that the body of a response can be read from directly, or None if the body has to be
+        read with iter_content.
+        """
+        if response.headers.get('Content-Encoding', 'identity').lower() != 'identity':
+            return None
+        stream = getattr(getattr(response, 'raw', None), '_fp', None)
+        return stream if hasattr(stream, 'readinto') else None
+
+    def iter_response(self, response):
+        """
+        Yields the body of a response in chunks of up to the buffer size.  The chunks yielded from the socket stream
+        are slices of the calling thread's buffer, and the connection is returned to the connection pool once the whole
+        body has been read so that it can be reused as it would be after iter_content.
+        """
+        stream = self.get_stream(response)
+        if stream is None or not self.settings_manager.use_receive_buffer:
+            yield from response.iter_content(self.buffer_size)
+            return
+        buffer = self.get_buffer()
+        received = 0
+        while True:
+            with translate_errors():
+                count = stream.readinto(buffer)
+            if not count:
+                break
+            received += count
+            yield buffer[:count]
+        self.check_length(response, received)
+        response.raw.release_conn()
+
+    @staticmethod
+    def check_length(response, received):
+        """
+        Raises the error that iter_content raises for a body that ended before its Content-Length was received, as the
+        socket stream treats the end of the connection as the end of the body.
+        """
+        try:
+            length = int(response.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return
+        if received < length:
+            raise requests.exceptions.ChunkedEncodingError(
+                f'Connection closed after {received} of {length} bytes were received')
@@ -0,0 +1,93 @@
+import random
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from .errors import Error
+from ..utils import injector, imgur_utils
+
+
+# delay_factor: the multiple of the base retry delay that the first retry waits for, doubled for each further failure.
+# max_attempts: the number of failures after which the item is no longer retried, None to use the maximum retry
+#               attempts setting, or 0 for no limit.
+# wait_for_imgur_reset: if True, the item is not retried until the imgur credits have been reset.
+RetryPolicy = namedtuple('RetryPolicy', 'delay_factor max_attempts wait_for_imgur_reset')
+
+DEFAULT_POLICY = RetryPolicy(delay_factor=1, max_attempts=None, wait_for_imgur_reset=False)
+
+# errors that are not listed use the default policy, and errors that map to None are never retried
+RETRY_POLICIES = {
+    Error.UNSUPPORTED_DOMAIN: None,
+    Error.DOES_NOT_EXIST: None,
+    Error.FAILED_TO_LOCATE: None,
+    Error.FORBIDDEN: None,
+    Error.DUPLICATE_CONTENT: None,
+    Error.RATE_LIMIT_ERROR: RetryPolicy(delay_factor=1, max_attempts=None, wait_for_imgur_reset=True),
+    Error.CREDIT_ERROR: RetryPolicy(delay_factor=1, max_attempts=None, wait_for_imgur_reset=True),
+    # a download that was stopped by the user did not fail, so it is retried as soon as another session runs
+    Error.DOWNLOAD_STOPPED: RetryPolicy(delay_factor=0, max_attempts=0, wait_for_imgur_reset=False),
+    Error.CONNECTION_ERROR: RetryPolicy(delay_factor=1, max_attempts=None, wait_for_imgur_reset=False),
+    Error.UNSUCCESSFUL_RESPONSE: RetryPolicy(delay_factor=2, max_attempts=None, wait_for_imgur_reset=False),
+    # a file that failed verification is downloaded again as soon as possible
+    Error.INTEGRITY_FAILURE: RetryPolicy(delay_factor=0, max_attempts=None, wait_for_imgur_reset=False),
+}
+
+
+class RetryScheduler:
+
+    """
+    Decides when a post that failed to extract or content that failed to download is to be retried.  The time of the
+    next retry is stored with the item (next_retry_at), so that retries survive between sessions and any session can
+    find the items that are due with a single query instead of retrying every failed item at once.
+
+    Each failure doubles the delay before the next retry, starting from the base retry delay multiplied by the delay
+    factor of the error's policy and capped at the maximum retry delay.  A random jitter of up to half the delay is
+    taken off so that items that failed together, such as every item from a host that was down, are not all retried at
+    the same moment.  Errors that can not be fixed by retrying (such as content that does not exist) are never retried,
+    imgur rate limit and credit errors wait until the imgur credits are reset, and items are not retried once they have
+    failed more than the maximum retry attempts.
+    """
+
+    @property
+    def settings_manager(self):
+        return injector.get_settings_manager()
+
+    def get_next_retry_at(self, error, retry_attempts, now=None):
+        """
+        Returns the time at which an item that has failed with the supplied error is to be retried.
+        :param error: The error that the item failed with.
+        :param retry_attempts: The number of times the item has failed, including this failure.
+        :param now: The time of the failure.  The current time is used if None.
+        :return: The time of the next retry, or None if the item is not to be retried.
+        """
+        policy = RETRY_POLICIES.get(error, DEFAULT_POLICY)
+        if policy is None:
+            return None
+        max_attempts = policy.max_attempts if policy.max_attempts is not None else \
+            self.settings_manager.max_retry_attempts
+        if max_attempts and retry_attempts > max_attempts:
+            return None
+        now = now or datetime.now()
+        if policy.wait_for_imgur_reset and imgur_utils.credit_reset_time > now.timestamp():
+            # the jitter spreads the items out over the first minutes after the reset instead of bringing it forward
+            return datetime.fromtimestamp(imgur_utils.credit_reset_time) + \
+                timedelta(seconds=random.uniform(0, self.settings_manager.retry_base_delay))
+        delay = self.settings_manager.retry_base_delay * policy.delay_factor * 2 ** max(0, retry_attempts - 1)
+        delay = min(delay, self.settings_manager.retry_max_delay)
+        delay -= random.uniform(0, delay / 2)
+        return now + timedelta(seconds=delay)
+
+    def get_deferred_retry_at(self, retry_after, now=None):
+        """
+        Returns the time at which an item that was deferred without failing, such as an item whose domain's circuit is
+        open, is to be retried.  A random jitter of up to half the delay is added so that the deferred items do not all
+        become due at once.
+        :param retry_after: The number of seconds after which the item can be retried.
+        :param now: The time the item was deferred.  The current time is used if None.
+        """
+        now = now or datetime.now()
+        return now + timedelta(seconds=retry_after + random.uniform(0, retry_after / 2))
+
+    @staticmethod
+    def due(query, column, now=None):
+        """Filters a query down to the items whose next retry time has been reached."""
+        return query.filter(column.isnot(None)).filter(column <= (now or datetime.now()))
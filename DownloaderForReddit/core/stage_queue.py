@@ -0,0 +1,132 @@
+import logging
+from collections import deque
+from queue import Empty
+from threading import Condition
+from time import monotonic
+
+
+class StageQueue:
+
+    """
+    A queue between two stages of a download session (listing, extraction and download) that applies backpressure to
+    the stage that fills it.  Once the number of queued items reaches the high watermark, put blocks until the
+    downstream stage has taken enough items to bring the queue down to the low watermark, so that a fast upstream stage
+    can not race ahead and hold thousands of items in memory.  Waiting until the low watermark is reached, rather than
+    letting the producer go as soon as there is a single free place, lets the producer work in bursts instead of waking
+    for every item the consumer takes.
+
+    The control items of the queue protocol ('HOLD', 'RELEASE_HOLD' and None) are never blocked and are not counted
+    towards the watermarks, so that a stage can always be held, released or ended.  A producer that is blocked stops
+    waiting when the download session is stopped, so that it does not wait on a consumer that has already exited.
+    Items are returned in the order they were added.
+    """
+
+    CONTROL_ITEMS = ('HOLD', 'RELEASE_HOLD', None)
+
+    # how often a blocked producer checks whether the download session has been stopped
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, name, high_watermark=0, low_watermark=0, stop_run=None):
+        """
+        :param name: The name of the stage queue, used in logs.
+        :param high_watermark: The number of queued items at which producers are blocked.  0 does not limit the queue.
+        :param low_watermark: The number of queued items that blocked producers wait for the queue to be brought down
+                              to before they continue.
+        :param stop_run: The event that is set when the download session is stopped.
+        """
+        self.logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
+        self.name = name
+        self.high_watermark = max(0, high_watermark)
+        self.low_watermark = min(max(0, low_watermark), max(0, self.high_watermark - 1))
+        self.stop_run = stop_run
+        self.condition = Condition()
+        self.items = deque()
+        self.depth = 0
+        self.saturated = False
+        self.max_depth = 0
+        self.blocked_count = 0
+        self.blocked_time = 0
+
+    def put(self, item):
+        """
+        Adds an item to the queue, first waiting for the downstream stage to catch up if the queue is saturated.
+        :param item: The item to add, or one of the queue control items.
+        """
+        with self.condition:
+            if item not in self.CONTROL_ITEMS:
+                self.wait_for_space()
+                self.depth += 1
+                self.max_depth = max(self.max_depth, self.depth)
+                if self.high_watermark and self.depth >= self.high_watermark and not self.saturated:
+                    self.saturated = True
+                    self.logger.debug('Stage queue saturated', extra={'queue': self.name, 'depth': self.depth})
+            self.push(item)
+            self.condition.notify_all()
+
+    def wait_for_space(self):
+        """Blocks while the queue is saturated.  Must be called while holding the condition."""
+        if not self.saturated:
+            return
+        start = monotonic()
+        self.blocked_count += 1
+        while self.saturated and (self.stop_run is None or not self.stop_run.is_set()):
+            self.condition.wait(self.POLL_INTERVAL)
+        self.blocked_time += monotonic() - start
+
+    def get(self, block=True, timeout=None):
+        """
+        Removes and returns the next item from the queue.
+        :param block: If False, an item is only returned if one is available immediately.
+        :param timeout: The number of seconds to wait for an item if blocking.  None waits until an item is available.
+        :raises Empty: If no item is available.
+        """
+        end_time = monotonic() + timeout if timeout is not None else None
+        with self.condition:
+            while True:
+                available, item = self.pop()
+                if available:
+                    if item not in self.CONTROL_ITEMS:
+                        self.depth -= 1
+                        if self.saturated and self.depth <= self.low_watermark:
+                            self.saturated = False
+                            self.logger.debug('Stage queue drained', extra={'queue': self.name, 'depth': self.depth})
+                        self.condition.notify_all()
+                    return item
+                if not block:
+                    raise Empty
+                if end_time is None:
+                    self.condition.wait()
+                else:
+                    remaining = end_time - monotonic()
+                    if remaining <= 0:
+                        raise Empty
+                    self.condition.wait(remaining)
+
+    def push(self, item):
+        """Stores an item in the queue.  Must be called while holding the condition."""
+        self.items.append(item)
+
+    def pop(self):
+        """
+        Removes the next item to be returned from the queue.  Must be called while holding the condition.
+        :return: A tuple of whether an item was available and the item.
+        """
+        if self.items:
+            return True, self.items.popleft()
+        return False, None
+
+    def qsize(self):
+        """Returns the number of queued items, not counting control items."""
+        with self.condition:
+            return self.depth
+
+    def get_stats(self):
+        with self.condition:
+            return {
+                'depth': self.depth,
+                'max_depth': self.max_depth,
+                'high_watermark': self.high_watermark,
+                'low_watermark': self.low_watermark,
+                'blocked_count': self.blocked_count,
+                'blocked_time': round(self.blocked_time, 2),
+            }
@@ -8,6 +8,8 @@ from bs4 import BeautifulSoup, SoupStrainer
 from .runner import Runner, verify_run
 from .comment_handler import CommentHandler
 from .errors import Error
+from .circuit_breaker import CircuitOpen
+from .cancellation import Cancelled
 from . import const
 from ..database.models import Post
 from ..extractors.base_extractor import BaseExtractor
@@ -90,7 +92,8 @@ class SubmissionHandler(Runner):
     def extract_link(self, url, text_link_extraction=False, **kwargs):
         try:
             extractor_class = self.assign_extractor(url)
-            extractor = extractor_class(self.post, url=url, submission=self.submission, **kwargs)
+            extractor = extractor_class(self.post, url=url, submission=self.submission, cancel_token=self.stop_run,
+                                        **kwargs)
             self.finish_extractor(extractor, text_link_extraction=text_link_extraction)
         except Exception as e:
             self.handle_error(e)
@@ -99,7 +102,11 @@ class SubmissionHandler(Runner):
     def finish_extractor(self, extractor, text_link_extraction=False, comment=None):
         if extractor is not None:
             extractor.extract_content()
-            if not extractor.failed_extraction:
+            if extractor.deferred_retry_after is not None:
+                self.defer_extraction(extractor.deferred_retry_after)
+            elif extractor.stopped:
+                self.handle_stopped_extraction()
+            elif not extractor.failed_extraction:
                 self.post.set_extracted()
             else:
                 if not text_link_extraction:
@@ -112,7 +119,7 @@ class SubmissionHandler(Runner):
                         comment.set_extraction_failed(Error.TEXT_LINK_FAILURE,
                                                       'Failed to extract links from comment text')
             for content in extractor.extracted_content:
-                self.download_queue.put(content.id)
+                self.download_queue.put_content(content)
 
     @verify_run
     def assign_extractor(self, url):
@@ -124,8 +131,27 @@ class SubmissionHandler(Runner):
             return DirectExtractor
         return None
 
+    def defer_extraction(self, retry_after):
+        """
+        Defers the post to the retry scheduler instead of failing it, as a domain that its extraction needed was not
+        requested because the domain's circuit is open.
+        """
+        self.post.set_extraction_deferred(retry_after)
+        Message.send_debug(f'Deferred extraction: {self.post.title}: {self.post.url}')
+
+    def handle_stopped_extraction(self):
+        """
+        Leaves a post whose extraction was interrupted by the download session being stopped unextracted, so that it is
+        extracted again the next time unfinished extractions are run.
+        """
+        self.logger.debug('Extraction stopped', extra={'url': self.post.url, 'stop_latency': self.stop_run.latency})
+
     def handle_error(self, exception):
-        if isinstance(exception, TypeError):
+        if isinstance(exception, CircuitOpen):
+            self.defer_extraction(exception.retry_after)
+        elif isinstance(exception, Cancelled):
+            self.handle_stopped_extraction()
+        elif isinstance(exception, TypeError):
             self.handle_unsupported_domain()
         elif isinstance(exception, ConnectionError):
             self.handle_connection_error()
@@ -1,11 +1,13 @@
 import logging
 from datetime import datetime
 from queue import Queue
-from threading import Thread, Event
+from threading import Thread
 from PyQt5.QtCore import QObject, pyqtSignal
 
 from .submission_handler import SubmissionHandler
 from .downloader import Downloader
+from .download_queue import DownloadQueue
+from .cancellation import CancellationToken
 from .runner import verify_run
 from ..database.models import DownloadSession, Post
 from ..utils import injector, reddit_utils
@@ -30,16 +32,17 @@ class UpdateRunner(QObject):
         self.reddit_object_id_list = kwargs.get('reddit_object_id_list', None)
         self.post_id_list = kwargs.get('post_id_list', None)
 
-        self.stop_run = Event()
+        self.stop_run = CancellationToken()
         self.continue_run = True
         self.post_queue = Queue(maxsize=-1)
         self.download_thread = None
         self.downloader = None
-        self.download_queue = Queue(maxsize=-1)
+        self.download_queue = DownloadQueue(stop_run=self.stop_run)
         self.download_session_id = None
 
     def run(self):
         self.logger.debug('Update runner starting')
+        injector.get_directory_index().reset()
         if self.run_method == 'UPDATE_SCORES':
             self.update_scores()
         elif self.run_method == 'UPDATE_COMMENTS':
@@ -109,11 +112,12 @@ class UpdateRunner(QObject):
             self.extract_comments(post_id)
         self.download_queue.put(None)
         self.download_thread.join()
+        injector.get_file_sync_batcher().flush()
         self.finish_download_session()
         self.finished.emit()
 
     def start_downloader(self):
-        self.downloader = Downloader(self.download_queue, self.download_session_id)
+        self.downloader = Downloader(self.download_queue, self.download_session_id, self.stop_run)
         self.download_thread = Thread(target=self.downloader.run)
         self.download_thread.start()
 
@@ -127,4 +131,5 @@ class UpdateRunner(QObject):
             submission_handler.extract_comments()
 
     def stop(self):
+        self.continue_run = False
         self.stop_run.set()
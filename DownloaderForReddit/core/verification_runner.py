@@ -0,0 +1,167 @@
+import os
+import logging
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from threading import Event
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from . import file_verifier, const
+from .file_verifier import FileStatus
+from .errors import Error
+from ..database.models import Content, Post
+from ..utils import injector
+from ..messaging.message import Message
+
+
+class VerificationRunner(QObject):
+
+    """
+    Scans the files of downloaded content for files that have been cut short or damaged since they were downloaded.
+    Each file is checked against the size and signature recorded when it was downloaded, and the header and trailer of
+    the file are checked for its format.  Only the first and last bytes of each file are read, so the scan is bound by
+    the time taken to open the files, and the files are checked in batches by a pool of processes so that a large
+    archive is scanned in parallel without holding the GIL of the application.
+
+    Content whose file is truncated or corrupt has the file removed and is failed with an integrity failure, which the
+    retry scheduler makes due straight away, and the ids of the content are emitted so that it can be downloaded again.
+    Content whose file is missing is only reported, as the file may have been removed on purpose, as is content whose
+    file does not hold the trailer of its format, as that alone does not show that the file is broken.  The results are
+    reported for each reddit object.
+    """
+
+    finished = pyqtSignal()
+    requeue = pyqtSignal(list)
+
+    # the number of files checked by a process at a time
+    BATCH_SIZE = 256
+
+    def __init__(self, reddit_object_id_list=None):
+        """
+        :param reddit_object_id_list: Optional.  The ids of the reddit objects whose content is verified.  All
+                                      downloaded content is verified if None.
+        """
+        super().__init__()
+        self.logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
+        self.settings_manager = injector.get_settings_manager()
+        self.db = injector.get_database_handler()
+        self.reddit_object_id_list = reddit_object_id_list
+        self.stop_run = Event()
+        # reddit object name: counter of the file statuses of its content
+        self.report = {}
+        self.requeued_ids = []
+
+    @property
+    def process_count(self):
+        return self.settings_manager.verification_process_count or os.cpu_count() or 1
+
+    def stop(self):
+        self.stop_run.set()
+
+    def run(self):
+        self.logger.debug('Verification runner starting')
+        owners, items = self.get_items()
+        Message.send_info(f'Verifying {len(items)} downloaded files')
+        results = self.scan(items)
+        self.handle_results(owners, results)
+        self.send_report(len(items), len(results))
+        if self.requeued_ids:
+            self.requeue.emit(self.requeued_ids)
+        self.logger.debug('Verification runner finished')
+        self.finished.emit()
+
+    def get_items(self):
+        """
+        Returns the name of the reddit object that each downloaded content item belongs to, and the items that are
+        checked by the scan.  Content downloaded before its expected size was recorded is checked against the size
+        of the file when it was downloaded.
+        """
+        owners = {}
+        items = []
+        with self.db.get_scoped_session() as session:
+            query = session.query(Content).filter(Content.downloaded.is_(True))
+            if self.reddit_object_id_list is not None:
+                query = query.join(Post, Content.post_id == Post.id) \
+                    .filter(Post.significant_reddit_object_id.in_(self.reddit_object_id_list))
+            for content in query:
+                owner = content.post.significant_reddit_object if content.post is not None else content.user
+                owners[content.id] = owner.name if owner is not None else None
+                expected_size = content.expected_size if content.expected_size is not None else content.file_size
+                items.append((content.id, content.get_full_file_path(), expected_size, content.file_signature,
+                              content.extension in const.ALL_EXT))
+        return owners, items
+
+    def scan(self, items):
+        """
+        Checks the files of the supplied items in batches with a process pool.  Batches that have not been started when
+        the scan is stopped are cancelled.
+        :return: The (content id, (status, problem)) result of each item that was checked.
+        """
+        results = []
+        batches = [items[x:x + self.BATCH_SIZE] for x in range(0, len(items), self.BATCH_SIZE)]
+        if not batches:
+            return results
+        with ProcessPoolExecutor(max_workers=min(self.process_count, len(batches))) as executor:
+            futures = [executor.submit(file_verifier.check_items, batch) for batch in batches]
+            for future in futures:
+                if self.stop_run.is_set():
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                results.extend(future.result())
+        return results
+
+    def handle_results(self, owners, results):
+        with self.db.get_scoped_session() as session:
+            for content_id, (status, problem) in results:
+                self.report.setdefault(owners.get(content_id), Counter())[status] += 1
+                if status == FileStatus.TRUNCATED or status == FileStatus.CORRUPT:
+                    self.requeue_content(session.query(Content).get(content_id), status, problem)
+                elif status == FileStatus.NO_TRAILER:
+                    self.logger.warning('Downloaded file does not hold the end of its format',
+                                        extra={'content_id': content_id, 'problem': problem})
+
+    def requeue_content(self, content: Content, status, problem):
+        """
+        Removes the file of content that failed verification and fails the content so that it is downloaded again.
+        The validators are cleared so that the server sends the whole file instead of responding that it has not
+        changed.
+        """
+        path = content.get_full_file_path()
+        self.logger.warning('Downloaded file failed verification',
+                            extra={'content_id': content.id, 'path': path, 'status': status.name, 'problem': problem})
+        try:
+            os.remove(path)
+        except OSError:
+            self.logger.error('Failed to remove file that failed verification', extra={'path': path},
+                              exc_info=True)
+        content.etag = None
+        content.last_modified = None
+        content.file_size = None
+        content.set_download_error(Error.INTEGRITY_FAILURE,
+                                   f'File failed verification: {status.name.lower()}: {problem}')
+        self.requeued_ids.append(content.id)
+
+    def send_report(self, item_count, checked_count):
+        totals = Counter()
+        for counts in self.report.values():
+            totals.update(counts)
+        self.logger.info('Verification complete', extra={
+            'checked_count': checked_count,
+            'reddit_objects': {name: {status.name: count for status, count in counts.items()}
+                               for name, counts in self.report.items()},
+        })
+        message = f'\nVerification {"stopped" if checked_count < item_count else "finished"}\n' \
+                  f'Checked: {checked_count} of {item_count} files\n' \
+                  f'OK: {totals[FileStatus.OK]}\n' \
+                  f'Truncated: {totals[FileStatus.TRUNCATED]}\n' \
+                  f'Corrupt: {totals[FileStatus.CORRUPT]}\n' \
+                  f'Missing: {totals[FileStatus.MISSING]}\n' \
+                  f'No trailer: {totals[FileStatus.NO_TRAILER]}'
+        for name, counts in sorted(self.report.items(), key=lambda x: str(x[0])):
+            if counts[FileStatus.OK] < sum(counts.values()):
+                message += f'\n    {name}: {counts[FileStatus.TRUNCATED]} truncated, ' \
+                           f'{counts[FileStatus.CORRUPT]} corrupt, {counts[FileStatus.MISSING]} missing, ' \
+                           f'{counts[FileStatus.NO_TRAILER]} without a trailer'
+        if self.requeued_ids:
+            message += f'\n{len(self.requeued_ids)} files will be downloaded again'
+        Message.send_info(message)
@@ -3,6 +3,7 @@ from contextlib import contextmanager
 from sqlalchemy.ext.declarative import declarative_base
 import sqlalchemy
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 from ..core import const
 from ..utils import system_util
@@ -19,7 +20,10 @@ class DatabaseHandler:
             self.engine = sqlalchemy.create_engine(self.database_url, echo=False,
                                                    connect_args={'check_same_thread': False})
         else:
-            self.engine = sqlalchemy.create_engine('sqlite:///:memory:')
+            # the in memory database only exists on its connection, so one connection is shared by every thread so that
+            # the database can be used from the worker threads of the downloaders as the file database can
+            self.engine = sqlalchemy.create_engine('sqlite:///:memory:', connect_args={'check_same_thread': False},
+                                                   poolclass=StaticPool)
         self.base.metadata.create_all(self.engine)
 
         self.Session = sessionmaker(bind=self.engine)
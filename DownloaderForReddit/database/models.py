@@ -481,6 +481,8 @@ class Post(BaseModel):
     extraction_error = Column(Enum(Error), nullable=True)
     error_message = Column(String, nullable=True)
     retry_attempts = Column(Integer, default=0)
+    # the time at which the post is due to be extracted again after failing, None if it is not to be retried
+    next_retry_at = Column(DateTime, nullable=True, index=True)
 
     author_id = Column(ForeignKey('user.id'))
     author = relationship('User', foreign_keys=author_id, backref='posts')
@@ -528,6 +530,7 @@ class Post(BaseModel):
         self.extraction_date = datetime.now()
         self.extraction_error = None
         self.error_message = None
+        self.next_retry_at = None
         self.get_session().commit()
 
     def set_extraction_failed(self, error, message):
@@ -536,6 +539,15 @@ class Post(BaseModel):
         self.extraction_error = error
         self.error_message = message
         self.retry_attempts += 1
+        self.next_retry_at = injector.get_retry_scheduler().get_next_retry_at(error, self.retry_attempts)
+        self.get_session().commit()
+
+    def set_extraction_deferred(self, retry_after):
+        """
+        Defers the extraction of the post without counting it as a failure, so that it is retried once the supplied
+        number of seconds has passed.
+        """
+        self.next_retry_at = injector.get_retry_scheduler().get_deferred_retry_at(retry_after)
         self.get_session().commit()
 
 
@@ -628,6 +640,19 @@ class Content(BaseModel):
     download_error = Column(Enum(Error), nullable=True)
     error_message = Column(String, nullable=True)
     retry_attempts = Column(Integer, default=0)
+    # the time at which the content is due to be downloaded again after failing, None if it is not to be retried
+    next_retry_at = Column(DateTime, nullable=True, index=True)
+    # hash of the downloaded file, used to find the same file downloaded from a different url
+    content_hash = Column(String, nullable=True, index=True)
+    # validators and size sent by the server when the content was downloaded, used to ask the server whether the file
+    # has changed instead of downloading it again
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)
+    file_size = Column(Integer, nullable=True)
+    # the size of the file on the server and the hex of the file's first bytes when it was downloaded, used to find
+    # files that have been cut short or damaged since
+    expected_size = Column(Integer, nullable=True)
+    file_signature = Column(String, nullable=True)
 
     user_id = Column(ForeignKey('user.id'))
     user = relationship('User', backref='content')
@@ -689,6 +714,7 @@ class Content(BaseModel):
         self.download_date = datetime.now()
         self.download_error = None
         self.error_message = None
+        self.next_retry_at = None
         self.get_session().commit()
 
     def set_download_error(self, error, message):
@@ -696,4 +722,28 @@ class Content(BaseModel):
         self.download_error = error
         self.error_message = message
         self.retry_attempts = self.retry_attempts + 1
+        self.next_retry_at = injector.get_retry_scheduler().get_next_retry_at(error, self.retry_attempts)
+        self.get_session().commit()
+
+    def set_download_deferred(self, retry_after):
+        """
+        Defers the download of the content without counting it as a failure, so that it is retried once the supplied
+        number of seconds has passed.
+        """
+        self.next_retry_at = injector.get_retry_scheduler().get_deferred_retry_at(retry_after)
         self.get_session().commit()
+
+
+class ImageHash(BaseModel):
+
+    """
+    The perceptual hash of a downloaded image, used to find images that are near duplicates of each other.  The hash is
+    an unsigned 64 bit value stored as a signed integer to fit in an sqlite integer column.
+    """
+
+    __tablename__ = 'image_hash'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    content_id = Column(ForeignKey('content.id'), unique=True, index=True)
+    content = relationship('Content', backref=backref('image_hash', uselist=False))
+    value = Column(Integer, index=True)
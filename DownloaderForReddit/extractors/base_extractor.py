@@ -24,10 +24,13 @@ along with Downloader for Reddit.  If not, see <http://www.gnu.org/licenses/>.
 
 import requests
 import logging
+from contextlib import contextmanager
 
 from ..database import Content, Post
 from ..core.content_filter import ContentFilter
 from ..core.errors import Error
+from ..core.circuit_breaker import CircuitOpen
+from ..core.cancellation import Cancelled
 from ..utils import injector, system_util, TokenParser
 from ..messaging.message import Message
 
@@ -47,6 +50,8 @@ class BaseExtractor:
         """
         self.logger = logging.getLogger(f'DownloaderForReddit.{__name__}')
         self.settings_manager = injector.get_settings_manager()
+        self.host_limiter = injector.get_host_limiter()
+        self.circuit_breaker = injector.get_circuit_breaker()
         self.content_filter = ContentFilter()
         self.post = post
         self.submission = kwargs.get('submission', None)
@@ -57,10 +62,16 @@ class BaseExtractor:
         self.significant_reddit_object = kwargs.get('significant_reddit_object', post.significant_reddit_object)
         self.creation_date = kwargs.get('date_posted', post.date_posted)
         self.count = kwargs.get('count', None)
+        # the cancellation token of the download session, which interrupts the extractor's requests when it is stopped
+        self.cancel_token = kwargs.get('cancel_token', None)
         self.extracted_content = []
         self.failed_extraction = False
         self.extraction_error = None
         self.failed_extraction_message = None
+        # the number of seconds after which the extraction is to be retried if it was deferred by an open circuit
+        self.deferred_retry_after = None
+        # True if the extraction was interrupted by the download session being stopped
+        self.stopped = False
         self.use_count = True
 
     def __str__(self):
@@ -114,7 +125,9 @@ class BaseExtractor:
 
     def get_json(self, url):
         """Makes sure that a request is valid and handles without errors if the connection is not successful"""
-        response = requests.get(url, timeout=10)
+        with self.guard_requests(), self.circuit_breaker.guard(url) as circuit, self.limit_host(url):
+            response = self.get_response(url)
+            circuit.record_response(response.status_code)
         if response.status_code == 200 and 'json' in response.headers['Content-Type']:
             return response.json()
         else:
@@ -123,13 +136,76 @@ class BaseExtractor:
 
     def get_text(self, url):
         """See get_json"""
-        response = requests.get(url, timeout=10)
+        with self.guard_requests(), self.circuit_breaker.guard(url) as circuit, self.limit_host(url):
+            response = self.get_response(url)
+            circuit.record_response(response.status_code)
         if response.status_code == 200 and 'text' in response.headers['Content-Type']:
             return response.text
         else:
             self.handle_failed_extract(error=Error.FAILED_TO_LOCATE, message='Failed to retrieve data from link',
                                        status_code=response.status_code)
 
+    @contextmanager
+    def guard_requests(self):
+        """
+        Context manager around the requests of an extraction that records an extraction that was deferred because a
+        domain's circuit is open, or interrupted because the download session was stopped, as the error is raised.  The
+        error is re-raised so that the extraction stops, and the extractor's own error handling then leaves the
+        extraction to be retried instead of failing it.
+        """
+        try:
+            yield
+        except CircuitOpen as e:
+            self.defer_extraction(e)
+            raise
+        except Cancelled:
+            self.stopped = True
+            raise
+
+    @contextmanager
+    def limit_host(self, url):
+        """
+        Context manager that holds a request slot from the host limiter for the host of the supplied url for the
+        duration of the block.
+        :raises Cancelled: If the download session is stopped while waiting for a slot, in which case the block is not
+                           run.
+        """
+        with self.guard_requests(), self.host_limiter.limit(url, self.cancel_token) as acquired:
+            if not acquired:
+                raise Cancelled()
+            yield
+
+    def get_response(self, url, method='get'):
+        """
+        Requests the supplied url.  Requests made for a download session are made through the connection pool with the
+        session's cancellation token, so that they are interrupted when the session is stopped.  Urls on the hosts that
+        are requested over HTTP/2 share the connection pool's HTTP/2 connections, and any other url is requested over
+        HTTP/1.1.
+        :param method: The name of the request method, either 'get' or 'head'.
+        :raises Cancelled: If the download session is stopped before the response arrives.
+        """
+        if self.cancel_token is not None:
+            with self.guard_requests():
+                return injector.get_connection_pool().request(method.upper(), url, self.cancel_token, timeout=10)
+        if self.settings_manager.use_http2:
+            connection_pool = injector.get_connection_pool()
+            if connection_pool.use_http2(url):
+                return getattr(connection_pool, method)(url, timeout=10)
+        return getattr(requests, method)(url, timeout=10)
+
+    def call_cancellable(self, function, *args, **kwargs):
+        """
+        Calls a blocking function that can not be interrupted, such as a youtube_dl extraction, whose requests are not
+        made through the connection pool.  If the extractor has a cancellation token, the function is run in a separate
+        thread and the call is abandoned as soon as the download session is stopped.
+        :return: The return value of the function.
+        :raises Cancelled: If the download session is stopped before the function returns.
+        """
+        if self.cancel_token is not None:
+            with self.guard_requests():
+                return self.cancel_token.run(function, *args, **kwargs)
+        return function(*args, **kwargs)
+
     def make_content(self, url, extension, count=None, name_modifier=''):
         """
         Takes content elements that are extracted and creates a Content object with the extracted parts and the global
@@ -234,6 +310,10 @@ class BaseExtractor:
         :type log: bool
         :type log_exception: bool
         """
+        if self.deferred_retry_after is not None or self.stopped:
+            # the extraction did not fail, a request it needed was not made because the domain's circuit is open, or it
+            # was interrupted by the download session being stopped
+            return
         self.failed_extraction = True
         self.extraction_error = error
         self.failed_extraction_message = message
@@ -244,6 +324,16 @@ class BaseExtractor:
         message += f'\nTitle: {self.post.title}\nUrl: {self.url}'
         Message.send_extraction_error(message)
 
+    def defer_extraction(self, circuit_open):
+        """
+        Marks the extraction as deferred to the retry scheduler because the circuit of a domain that it needed to
+        request is open.
+        :param circuit_open: The CircuitOpen exception that was raised in place of the request.
+        """
+        self.deferred_retry_after = circuit_open.retry_after
+        self.logger.debug('Extraction deferred while domain circuit is open',
+                          extra={'domain': circuit_open.domain, 'extractor_data': self.get_log_data()})
+
     def get_log_data(self):
         """
         Returns a loggable dictionary of the extractors current variables to be put into the log.
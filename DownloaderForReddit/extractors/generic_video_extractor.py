@@ -57,9 +57,7 @@ class GenericVideoExtractor(BaseExtractor):
 
     def extract_content(self):
         try:
-            # TODO: need way to kill this when session is terminated
-            with youtube_dl.YoutubeDL({'format': 'mp4'}) as ydl:
-                result = ydl.extract_info(self.url, download=False)
+            result = self.call_cancellable(self.extract_info)
             if 'entries' in result:
                 self.extract_playlist(result['entries'])
             else:
@@ -69,6 +67,10 @@ class GenericVideoExtractor(BaseExtractor):
             self.handle_failed_extract(error=Error.FAILED_TO_LOCATE, message=message, extractor_error_message=message,
                                        failed_domain=self.post.domain)
 
+    def extract_info(self):
+        with youtube_dl.YoutubeDL({'format': 'mp4'}) as ydl:
+            return ydl.extract_info(self.url, download=False)
+
     def extract_single_video(self, entry):
         self.make_content(entry['url'], 'mp4')
 
@@ -24,10 +24,10 @@ along with Downloader for Reddit.  If not, see <http://www.gnu.org/licenses/>.
 
 from os import path
 from urllib.parse import urlparse
-import requests
 
 from .base_extractor import BaseExtractor
 from ..core.errors import Error
+from ..core.circuit_breaker import CircuitOpen
 from ..core import const
 
 _REDGIFS_ENDPOINT = "https://api.redgifs.com/v1/gfycats/"
@@ -69,8 +69,14 @@ class GfycatExtractor(BaseExtractor):
         if item.hostname == 'redgifs.com':
             gfy_json = self.get_json(_REDGIFS_ENDPOINT + gif_id)
         else:
-            response = requests.get(_GFYCAT_ENDPOINT + gif_id, timeout=10)
-            if response.status_code == 200 and 'json' in response.headers['Content-Type']:
+            try:
+                with self.circuit_breaker.guard(_GFYCAT_ENDPOINT) as circuit, self.limit_host(_GFYCAT_ENDPOINT):
+                    response = self.get_response(_GFYCAT_ENDPOINT + gif_id)
+                    circuit.record_response(response.status_code)
+            except CircuitOpen:
+                # gfycat is not answering, so the gif is looked up on redgifs instead
+                response = None
+            if response is not None and response.status_code == 200 and 'json' in response.headers['Content-Type']:
                 gfy_json = response.json()
             else:
                 gfy_json = self.get_json(_REDGIFS_ENDPOINT + gif_id)
@@ -75,7 +75,9 @@ class ImgurExtractor(BaseExtractor):
     def extract_album(self):
         count = 1
         _, album_id = self.url.rsplit('/', 1)
-        for url in imgur_utils.get_album_images(album_id):
+        with self.guard_requests():
+            urls = imgur_utils.get_album_images(album_id, cancel_token=self.cancel_token)
+        for url in urls:
             url = self.filter_url(url)
             _, extension = url.rsplit('.', 1)
             self.make_content(url, extension, count)
@@ -83,7 +85,8 @@ class ImgurExtractor(BaseExtractor):
 
     def extract_single(self):
         _, image_id = self.url.rsplit('/', 1)
-        url = imgur_utils.get_single_image(image_id)
+        with self.guard_requests():
+            url = imgur_utils.get_single_image(image_id, cancel_token=self.cancel_token)
         _, extension = url.rsplit('.', 1)
         self.make_content(url, extension)
 
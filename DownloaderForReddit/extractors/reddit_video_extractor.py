@@ -23,7 +23,6 @@ along with Downloader for Reddit.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import re
-import requests
 
 from .base_extractor import BaseExtractor
 from ..core.errors import Error
@@ -110,7 +109,10 @@ class RedditVideoExtractor(BaseExtractor):
         audio.
         :return: True if the audio link is valid, False if not.
         """
-        response = requests.head(self.audio_url)
+        with self.guard_requests(), self.circuit_breaker.guard(self.audio_url) as circuit, \
+                self.limit_host(self.audio_url):
+            response = self.get_response(self.audio_url, method='head')
+            circuit.record_response(response.status_code)
         return response.status_code == 200
 
     def get_audio_content(self):
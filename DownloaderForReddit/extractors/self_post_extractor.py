@@ -3,7 +3,8 @@ import os
 from .base_extractor import BaseExtractor
 from ..database import Content
 from ..core.errors import Error
-from ..utils import system_util
+from ..core.partial_download import PartialDownload
+from ..utils import injector, system_util
 
 
 class SelfPostExtractor(BaseExtractor):
@@ -46,10 +47,14 @@ class SelfPostExtractor(BaseExtractor):
 
     def download_text_post(self, content):
         try:
-            with open(content.get_full_file_path(), 'w', encoding='utf-8') as file:
+            path = content.get_full_file_path()
+            temp_path = path + PartialDownload.PART_SUFFIX
+            with open(temp_path, 'w', encoding='utf-8') as file:
                 text = self.get_text(content.extension)
                 file.write(text)
-                content.set_downloaded(self.download_session_id)
+            injector.get_file_sync_batcher().finalise(temp_path, path)
+            content.file_size = os.path.getsize(path)
+            content.set_downloaded(self.download_session_id)
         except Exception as e:
             content.set_download_error(Error.TEXT_FAILURE, 'Failed to save text post', extra={'error': e})
 
@@ -60,16 +65,8 @@ class SelfPostExtractor(BaseExtractor):
             return self.comment.body_html if self.comment is not None else self.post.text_html
 
     def check_file_path(self, content):
-        self.create_dir_path(content.directory_path)
-        unique_count = 1
-        base_path = system_util.clean(content.title)
-        download_title = base_path
-        path = content.get_full_file_path(download_title)
-        while os.path.exists(path):
-            download_title = f'{base_path}({unique_count})'
-            path = content.get_full_file_path(download_title)
-            unique_count += 1
-        content.download_title = download_title
+        content.download_title = injector.get_directory_index().reserve(
+            content.directory_path, system_util.clean(content.title), content.extension, check_partial=False)
 
     def create_dir_path(self, dir_path):
         try:
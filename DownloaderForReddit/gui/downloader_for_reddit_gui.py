@@ -46,6 +46,7 @@ from ..gui.settings.settings_dialog import SettingsDialog
 from ..gui.export_wizard import ExportWizard
 from ..core.download_runner import DownloadRunner
 from ..core.update_runner import UpdateRunner
+from ..core.verification_runner import VerificationRunner
 from ..database.models import RedditObject, RedditObjectList, ListAssociation
 from ..database.filters import RedditObjectFilter
 from ..database.model_manager import ModelManger
@@ -158,6 +159,7 @@ class DownloaderForRedditGUI(QMainWindow, Ui_MainWindow):
         self.run_unfinished_extractions_menu_item.triggered.connect(self.run_unextracted_only)
         self.run_unfinished_downloads_menu_item.triggered.connect(self.run_undownloaded_only)
         self.run_all_unfiinished_menu_item.triggered.connect(self.run_all_unfinished)
+        self.verify_downloads_menu_item.triggered.connect(lambda: self.verify_downloads())
         # endregion
 
         # region Help Menu
@@ -247,6 +249,11 @@ class DownloaderForRedditGUI(QMainWindow, Ui_MainWindow):
         layout.addWidget(self.timer_label)
 
         self.statusbar.addPermanentWidget(self.timer_widget)
+        self.queue_depth_label = QLabel()
+        self.queue_depth_label.setToolTip('The number of posts waiting to be extracted and the number of files waiting '
+                                          'to be downloaded')
+        self.statusbar.addPermanentWidget(self.queue_depth_label)
+        self.queue_depth_label.setVisible(False)
         self.run_timer = QTimer(self)
         self.run_timer.timeout.connect(self.update_run_time)
 
@@ -381,6 +388,7 @@ class DownloaderForRedditGUI(QMainWindow, Ui_MainWindow):
             enabled_text = 'Differing Download Enabled States'
         enable_download = menu.addAction(enabled_text, lambda: [ro.toggle_enable_download() for ro in ros])
         download = menu.addAction(download_text, lambda: self.add_to_download(*[x.id for x in ros]))
+        menu.addAction('Verify Downloads', lambda: self.verify_downloads([x.id for x in ros]))
 
         for action in menu.actions():
             if action != add_object:
@@ -518,7 +526,8 @@ class DownloaderForRedditGUI(QMainWindow, Ui_MainWindow):
                     user_id_list = session.query(RedditObjectList).get(user_list_id).get_reddit_object_id_list()
                 if subreddit_list_id is not None:
                     sub_id_list = session.query(RedditObjectList).get(subreddit_list_id).get_reddit_object_id_list()
-                self.run(user_id_list, sub_id_list, run_unextracted=run_unextracted, run_undownloaded=run_undownloaded)
+                self.run(user_id_list, sub_id_list, run_unextracted=run_unextracted, run_undownloaded=run_undownloaded,
+                         run_due_retries=self.settings_manager.retry_due_items_automatically)
 
     def run(self, user_id_list, sub_id_list, reddit_object_id_list=None, **kwargs):
         self.started_download_gui_shift()
@@ -600,6 +609,31 @@ class DownloaderForRedditGUI(QMainWindow, Ui_MainWindow):
     def finish_update(self):
         pass
 
+    def verify_downloads(self, reddit_object_id_list=None):
+        """
+        Starts a scan of the downloaded files of the supplied reddit objects, or of all downloaded content if no ids are
+        supplied, that re-downloads the files found to be truncated or corrupt.
+        :param reddit_object_id_list: The ids of the reddit objects whose downloaded files are verified.
+        """
+        self.verification_runner = VerificationRunner(reddit_object_id_list=reddit_object_id_list)
+        self.verification_runner.requeue.connect(self.requeue_failed_verification)
+        self.verification_thread = QThread()
+        self.verification_runner.moveToThread(self.verification_thread)
+        self.stop_download_signal.connect(self.verification_runner.stop)
+        self.verification_runner.finished.connect(self.verification_thread.quit)
+        self.verification_runner.finished.connect(self.verification_runner.deleteLater)
+        self.verification_thread.finished.connect(self.verification_thread.deleteLater)
+        self.verification_thread.started.connect(self.verification_runner.run)
+        self.verification_thread.start()
+
+    def requeue_failed_verification(self, content_id_list):
+        """
+        Downloads the content whose files failed verification.  If a download is already running the content is left
+        for the retry scheduler, which has made it due.
+        """
+        if not self.running:
+            self.run_undownloaded_only(id_list=content_id_list)
+
     def handle_progress(self, message):
         """
         Handles non-text style messages that it receives from the message receiver.  Decides what to update on the main
@@ -1078,6 +1112,7 @@ class DownloaderForRedditGUI(QMainWindow, Ui_MainWindow):
         self.potential_downloads = 0
         self.shift_download_buttons()
         self.timer_widget.setVisible(False)
+        self.queue_depth_label.setVisible(False)
         self.run_time = 0
         # list models are sorted to refresh the display list and
         self.user_list_model.refresh_session()
@@ -1103,11 +1138,22 @@ class DownloaderForRedditGUI(QMainWindow, Ui_MainWindow):
         """
         self.run_timer.start(1000)
         self.timer_widget.setVisible(True)
+        self.queue_depth_label.setText('')
+        self.queue_depth_label.setVisible(True)
         self.perpetual_run_label.setVisible(self.settings_manager.perpetual_download)
 
     def update_run_time(self):
         self.run_time += 1
         self.timer_label.setText(system_util.format_duration_short(self.run_time))
+        self.update_queue_depths()
+
+    def update_queue_depths(self):
+        try:
+            depths = self.download_runner.get_queue_depths()
+        except (AttributeError, RuntimeError):
+            # the download runner has not been created yet or has already been deleted
+            return
+        self.queue_depth_label.setText(f'Queued: {depths["extraction"]} to extract, {depths["download"]} to download')
 
     def open_settings_dialog(self, **kwargs):
         """Displays the main settings dialog and calls methods that update each reddit object if needed."""
@@ -1,10 +1,11 @@
 import os
 from PyQt5.QtWidgets import QFileDialog
 from PyQt5.QtGui import QValidator
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTime
 
 from DownloaderForReddit.guiresources.settings.core_settings_widget_auto import Ui_CoreSettingsWidget
 from .abstract_settings_widget import AbstractSettingsWidget
+from DownloaderForReddit.core.connection_pool import ConnectionPool
 from DownloaderForReddit.utils import general_utils, system_util
 
 
@@ -20,6 +21,15 @@ class CoreSettingsWidget(AbstractSettingsWidget, Ui_CoreSettingsWidget):
         for key, value in self.size_map.items():
             self.threshold_size_combo.addItem(key, value)
             self.chunk_size_combo.addItem(key, value)
+            self.bandwidth_limit_size_combo.addItem(key, value)
+            self.bandwidth_schedule_size_combo.addItem(key, value)
+            self.minimum_free_disk_space_size_combo.addItem(key, value)
+        for engine in self.settings.download_engine_choices:
+            self.download_engine_combo.addItem(engine.title(), engine)
+        self.download_engine_combo.currentIndexChanged.connect(self.toggle_async_options)
+        self.bandwidth_schedule_checkbox.toggled.connect(self.toggle_bandwidth_schedule_options)
+        self.pause_on_low_disk_space_checkbox.toggled.connect(self.toggle_disk_space_options)
+        self.use_http2_checkbox.toggled.connect(self.toggle_http2_options)
         self.select_user_base_directory_button.clicked.connect(
             lambda: self.select_directory_path(self.user_save_dir_line_edit))
         self.select_subreddit_base_directory_button.clicked.connect(
@@ -37,18 +47,40 @@ class CoreSettingsWidget(AbstractSettingsWidget, Ui_CoreSettingsWidget):
 
         self.extraction_thread_count_spinbox.setValue(self.settings.extraction_thread_count)
         self.download_thread_count_spinbox.setValue(self.settings.download_thread_count)
+        self.download_engine_combo.setCurrentIndex(self.download_engine_combo.findData(self.settings.download_engine))
+        self.async_download_limit_spinbox.setValue(self.settings.async_download_limit)
+        self.toggle_async_options()
         self.download_on_add_checkbox.setChecked(self.settings.download_on_add)
         self.finish_incomplete_extractions_checkbox.setChecked(
             self.settings.finish_incomplete_extractions_at_session_start)
         self.finish_incomplete_downloads_checkbox.setChecked(
             self.settings.finish_incomplete_downloads_at_session_start)
         self.download_reddit_hosted_videos_checkbox.setChecked(self.settings.download_reddit_hosted_videos)
+        self.drop_near_duplicate_images_checkbox.setChecked(self.settings.drop_near_duplicate_images)
+        self.pause_on_low_disk_space_checkbox.setChecked(self.settings.pause_on_low_disk_space)
+        self.set_size_options(self.settings.minimum_free_disk_space, self.minimum_free_disk_space_size_combo,
+                              self.minimum_free_disk_space_spinbox)
+        self.toggle_disk_space_options()
+        self.use_http2_checkbox.setChecked(self.settings.use_http2)
+        self.http2_max_connections_spinbox.setValue(self.settings.http2_max_connections_per_host)
+        self.toggle_http2_options()
         self.multi_part_download_groupbox.setChecked(self.settings.use_multi_part_downloader)
         self.set_size_options(self.settings.multi_part_threshold, self.threshold_size_combo,
                               self.multipart_threshold_spinbox)
         self.set_size_options(self.settings.multi_part_chunk_size, self.chunk_size_combo,
                               self.multi_part_chunk_size_spinbox)
         self.multi_part_thread_count_spinbox.setValue(self.settings.multi_part_thread_count)
+        self.multi_part_max_in_flight_spinbox.setValue(self.settings.multi_part_max_in_flight)
+        self.bandwidth_limit_groupbox.setChecked(self.settings.limit_download_bandwidth)
+        self.set_size_options(self.settings.bandwidth_limit, self.bandwidth_limit_size_combo,
+                              self.bandwidth_limit_spinbox)
+        self.bandwidth_schedule_checkbox.setChecked(self.settings.bandwidth_schedule_enabled)
+        self.bandwidth_schedule_start_time_edit.setTime(QTime.fromString(self.settings.bandwidth_schedule_start,
+                                                                         'HH:mm'))
+        self.bandwidth_schedule_end_time_edit.setTime(QTime.fromString(self.settings.bandwidth_schedule_end, 'HH:mm'))
+        self.set_size_options(self.settings.bandwidth_schedule_limit, self.bandwidth_schedule_size_combo,
+                              self.bandwidth_schedule_limit_spinbox)
+        self.toggle_bandwidth_schedule_options()
 
     def set_size_options(self, size, combo, spinbox):
         for key, value in sorted(self.size_map.items(), key=lambda x: x[1], reverse=True):
@@ -66,16 +98,33 @@ class CoreSettingsWidget(AbstractSettingsWidget, Ui_CoreSettingsWidget):
 
         self.settings.extraction_thread_count = self.extraction_thread_count_spinbox.value()
         self.settings.download_thread_count = self.download_thread_count_spinbox.value()
+        self.settings.download_engine = self.download_engine_combo.currentData(Qt.UserRole)
+        self.settings.async_download_limit = self.async_download_limit_spinbox.value()
         self.settings.finish_incomplete_extractions_at_session_start = \
             self.finish_incomplete_extractions_checkbox.isChecked()
         self.settings.finish_incomplete_downloads_at_session_start = \
             self.finish_incomplete_downloads_checkbox.isChecked()
         self.settings.download_reddit_hosted_videos = self.download_reddit_hosted_videos_checkbox.isChecked()
+        self.settings.drop_near_duplicate_images = self.drop_near_duplicate_images_checkbox.isChecked()
+        self.settings.pause_on_low_disk_space = self.pause_on_low_disk_space_checkbox.isChecked()
+        self.settings.minimum_free_disk_space = int(self.minimum_free_disk_space_spinbox.value() *
+                                                    self.minimum_free_disk_space_size_combo.currentData(Qt.UserRole))
+        self.settings.use_http2 = self.use_http2_checkbox.isChecked()
+        self.settings.http2_max_connections_per_host = self.http2_max_connections_spinbox.value()
         self.settings.use_multi_part_downloader = self.multi_part_download_groupbox.isChecked()
         threshold_size = \
             int(self.multipart_threshold_spinbox.value() * self.threshold_size_combo.currentData(Qt.UserRole))
         self.settings.multi_part_threshold = threshold_size
         self.settings.multi_part_thread_count = self.multi_part_thread_count_spinbox.value()
+        self.settings.multi_part_max_in_flight = self.multi_part_max_in_flight_spinbox.value()
+        self.settings.limit_download_bandwidth = self.bandwidth_limit_groupbox.isChecked()
+        self.settings.bandwidth_limit = \
+            int(self.bandwidth_limit_spinbox.value() * self.bandwidth_limit_size_combo.currentData(Qt.UserRole))
+        self.settings.bandwidth_schedule_enabled = self.bandwidth_schedule_checkbox.isChecked()
+        self.settings.bandwidth_schedule_start = self.bandwidth_schedule_start_time_edit.time().toString('HH:mm')
+        self.settings.bandwidth_schedule_end = self.bandwidth_schedule_end_time_edit.time().toString('HH:mm')
+        self.settings.bandwidth_schedule_limit = int(self.bandwidth_schedule_limit_spinbox.value() *
+                                                     self.bandwidth_schedule_size_combo.currentData(Qt.UserRole))
 
     def select_directory_path(self, line_edit):
         text = line_edit.text()
@@ -84,6 +133,33 @@ class CoreSettingsWidget(AbstractSettingsWidget, Ui_CoreSettingsWidget):
         if directory != '' and directory is not None and os.path.isdir(directory):
             line_edit.setText(directory)
 
+    def toggle_async_options(self):
+        enabled = self.download_engine_combo.currentData(Qt.UserRole) == 'ASYNC'
+        self.async_download_limit_spinbox.setEnabled(enabled)
+        self.async_download_limit_label.setEnabled(enabled)
+
+    def toggle_bandwidth_schedule_options(self):
+        enabled = self.bandwidth_schedule_checkbox.isChecked()
+        self.bandwidth_schedule_start_time_edit.setEnabled(enabled)
+        self.bandwidth_schedule_end_time_edit.setEnabled(enabled)
+        self.bandwidth_schedule_limit_spinbox.setEnabled(enabled)
+        self.bandwidth_schedule_size_combo.setEnabled(enabled)
+        self.bandwidth_schedule_limit_label.setEnabled(enabled)
+
+    def toggle_disk_space_options(self):
+        enabled = self.pause_on_low_disk_space_checkbox.isChecked()
+        self.minimum_free_disk_space_spinbox.setEnabled(enabled)
+        self.minimum_free_disk_space_size_combo.setEnabled(enabled)
+
+    def toggle_http2_options(self):
+        available = ConnectionPool.http2_available()
+        self.use_http2_checkbox.setEnabled(available)
+        if not available:
+            self.use_http2_checkbox.setToolTip('HTTP/2 requires the httpx package with HTTP/2 support to be installed')
+        enabled = available and self.use_http2_checkbox.isChecked()
+        self.http2_max_connections_spinbox.setEnabled(enabled)
+        self.http2_max_connections_label.setEnabled(enabled)
+
     def toggle_invalid_name_options(self):
         enabled = not self.rename_invalid_download_folders_checkbox.isChecked()
         self.invalid_rename_format_line_edit.setDisabled(enabled)
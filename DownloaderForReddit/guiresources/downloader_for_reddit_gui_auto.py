@@ -315,6 +315,8 @@ class Ui_MainWindow(object):
         self.statistics_view_menu_item.setObjectName("statistics_view_menu_item")
         self.run_all_unfiinished_menu_item = QtWidgets.QAction(MainWindow)
         self.run_all_unfiinished_menu_item.setObjectName("run_all_unfiinished_menu_item")
+        self.verify_downloads_menu_item = QtWidgets.QAction(MainWindow)
+        self.verify_downloads_menu_item.setObjectName("verify_downloads_menu_item")
         self.export_user_list_menu_item = QtWidgets.QAction(MainWindow)
         self.export_user_list_menu_item.setObjectName("export_user_list_menu_item")
         self.export_subreddit_list_menu_item = QtWidgets.QAction(MainWindow)
@@ -351,6 +353,8 @@ class Ui_MainWindow(object):
         self.menuDownload.addAction(self.run_unfinished_extractions_menu_item)
         self.menuDownload.addAction(self.run_unfinished_downloads_menu_item)
         self.menuDownload.addAction(self.run_all_unfiinished_menu_item)
+        self.menuDownload.addSeparator()
+        self.menuDownload.addAction(self.verify_downloads_menu_item)
         self.menuDatabase.addAction(self.database_view_menu_item)
         self.menuDatabase.addSeparator()
         self.menuDatabase.addAction(self.download_sessions_view_menu_item)
@@ -455,5 +459,6 @@ class Ui_MainWindow(object):
         self.comments_view_menu_item.setText(_translate("MainWindow", "Comments"))
         self.statistics_view_menu_item.setText(_translate("MainWindow", "Statistics"))
         self.run_all_unfiinished_menu_item.setText(_translate("MainWindow", "Run All Unfinished"))
+        self.verify_downloads_menu_item.setText(_translate("MainWindow", "Verify Downloaded Files"))
         self.export_user_list_menu_item.setText(_translate("MainWindow", "Export User List"))
         self.export_subreddit_list_menu_item.setText(_translate("MainWindow", "Export Subreddit List"))
@@ -168,6 +168,22 @@ class Ui_CoreSettingsWidget(object):
         self.download_thread_count_spinbox.setMaximumSize(QtCore.QSize(116, 16777215))
         self.download_thread_count_spinbox.setObjectName("download_thread_count_spinbox")
         self.formLayout_3.setWidget(1, QtWidgets.QFormLayout.FieldRole, self.download_thread_count_spinbox)
+        self.download_engine_label = QtWidgets.QLabel(self.download_group_box)
+        self.download_engine_label.setObjectName("download_engine_label")
+        self.formLayout_3.setWidget(2, QtWidgets.QFormLayout.LabelRole, self.download_engine_label)
+        self.download_engine_combo = QtWidgets.QComboBox(self.download_group_box)
+        self.download_engine_combo.setMaximumSize(QtCore.QSize(116, 16777215))
+        self.download_engine_combo.setObjectName("download_engine_combo")
+        self.formLayout_3.setWidget(2, QtWidgets.QFormLayout.FieldRole, self.download_engine_combo)
+        self.async_download_limit_label = QtWidgets.QLabel(self.download_group_box)
+        self.async_download_limit_label.setObjectName("async_download_limit_label")
+        self.formLayout_3.setWidget(3, QtWidgets.QFormLayout.LabelRole, self.async_download_limit_label)
+        self.async_download_limit_spinbox = QtWidgets.QSpinBox(self.download_group_box)
+        self.async_download_limit_spinbox.setMaximumSize(QtCore.QSize(116, 16777215))
+        self.async_download_limit_spinbox.setMinimum(1)
+        self.async_download_limit_spinbox.setMaximum(1000)
+        self.async_download_limit_spinbox.setObjectName("async_download_limit_spinbox")
+        self.formLayout_3.setWidget(3, QtWidgets.QFormLayout.FieldRole, self.async_download_limit_spinbox)
         self.verticalLayout_3.addLayout(self.formLayout_3)
         self.multi_part_download_groupbox = QtWidgets.QGroupBox(self.download_group_box)
         self.multi_part_download_groupbox.setCheckable(True)
@@ -218,7 +234,82 @@ class Ui_CoreSettingsWidget(object):
         spacerItem2 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.horizontalLayout_10.addItem(spacerItem2)
         self.verticalLayout_6.addLayout(self.horizontalLayout_10)
+        self.horizontalLayout_12 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_12.setObjectName("horizontalLayout_12")
+        self.multi_part_max_in_flight_label = QtWidgets.QLabel(self.multi_part_download_groupbox)
+        self.multi_part_max_in_flight_label.setObjectName("multi_part_max_in_flight_label")
+        self.horizontalLayout_12.addWidget(self.multi_part_max_in_flight_label)
+        self.multi_part_max_in_flight_spinbox = QtWidgets.QSpinBox(self.multi_part_download_groupbox)
+        self.multi_part_max_in_flight_spinbox.setMinimumSize(QtCore.QSize(100, 0))
+        self.multi_part_max_in_flight_spinbox.setMinimum(1)
+        self.multi_part_max_in_flight_spinbox.setMaximum(256)
+        self.multi_part_max_in_flight_spinbox.setObjectName("multi_part_max_in_flight_spinbox")
+        self.horizontalLayout_12.addWidget(self.multi_part_max_in_flight_spinbox)
+        spacerItem3 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayout_12.addItem(spacerItem3)
+        self.verticalLayout_6.addLayout(self.horizontalLayout_12)
         self.verticalLayout_3.addWidget(self.multi_part_download_groupbox)
+        self.bandwidth_limit_groupbox = QtWidgets.QGroupBox(self.download_group_box)
+        self.bandwidth_limit_groupbox.setCheckable(True)
+        self.bandwidth_limit_groupbox.setObjectName("bandwidth_limit_groupbox")
+        self.verticalLayout_7 = QtWidgets.QVBoxLayout(self.bandwidth_limit_groupbox)
+        self.verticalLayout_7.setObjectName("verticalLayout_7")
+        self.horizontalLayout_14 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_14.setObjectName("horizontalLayout_14")
+        self.bandwidth_limit_label = QtWidgets.QLabel(self.bandwidth_limit_groupbox)
+        self.bandwidth_limit_label.setObjectName("bandwidth_limit_label")
+        self.horizontalLayout_14.addWidget(self.bandwidth_limit_label)
+        self.bandwidth_limit_spinbox = QtWidgets.QDoubleSpinBox(self.bandwidth_limit_groupbox)
+        self.bandwidth_limit_spinbox.setMinimumSize(QtCore.QSize(100, 0))
+        self.bandwidth_limit_spinbox.setMaximum(10000000000.99)
+        self.bandwidth_limit_spinbox.setObjectName("bandwidth_limit_spinbox")
+        self.horizontalLayout_14.addWidget(self.bandwidth_limit_spinbox)
+        self.bandwidth_limit_size_combo = QtWidgets.QComboBox(self.bandwidth_limit_groupbox)
+        self.bandwidth_limit_size_combo.setObjectName("bandwidth_limit_size_combo")
+        self.horizontalLayout_14.addWidget(self.bandwidth_limit_size_combo)
+        self.bandwidth_limit_unit_label = QtWidgets.QLabel(self.bandwidth_limit_groupbox)
+        self.bandwidth_limit_unit_label.setObjectName("bandwidth_limit_unit_label")
+        self.horizontalLayout_14.addWidget(self.bandwidth_limit_unit_label)
+        spacerItem4 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayout_14.addItem(spacerItem4)
+        self.verticalLayout_7.addLayout(self.horizontalLayout_14)
+        self.horizontalLayout_15 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_15.setObjectName("horizontalLayout_15")
+        self.bandwidth_schedule_checkbox = QtWidgets.QCheckBox(self.bandwidth_limit_groupbox)
+        self.bandwidth_schedule_checkbox.setObjectName("bandwidth_schedule_checkbox")
+        self.horizontalLayout_15.addWidget(self.bandwidth_schedule_checkbox)
+        self.bandwidth_schedule_start_time_edit = QtWidgets.QTimeEdit(self.bandwidth_limit_groupbox)
+        self.bandwidth_schedule_start_time_edit.setObjectName("bandwidth_schedule_start_time_edit")
+        self.horizontalLayout_15.addWidget(self.bandwidth_schedule_start_time_edit)
+        self.bandwidth_schedule_and_label = QtWidgets.QLabel(self.bandwidth_limit_groupbox)
+        self.bandwidth_schedule_and_label.setObjectName("bandwidth_schedule_and_label")
+        self.horizontalLayout_15.addWidget(self.bandwidth_schedule_and_label)
+        self.bandwidth_schedule_end_time_edit = QtWidgets.QTimeEdit(self.bandwidth_limit_groupbox)
+        self.bandwidth_schedule_end_time_edit.setObjectName("bandwidth_schedule_end_time_edit")
+        self.horizontalLayout_15.addWidget(self.bandwidth_schedule_end_time_edit)
+        spacerItem5 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayout_15.addItem(spacerItem5)
+        self.verticalLayout_7.addLayout(self.horizontalLayout_15)
+        self.horizontalLayout_16 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_16.setObjectName("horizontalLayout_16")
+        self.bandwidth_schedule_limit_label = QtWidgets.QLabel(self.bandwidth_limit_groupbox)
+        self.bandwidth_schedule_limit_label.setObjectName("bandwidth_schedule_limit_label")
+        self.horizontalLayout_16.addWidget(self.bandwidth_schedule_limit_label)
+        self.bandwidth_schedule_limit_spinbox = QtWidgets.QDoubleSpinBox(self.bandwidth_limit_groupbox)
+        self.bandwidth_schedule_limit_spinbox.setMinimumSize(QtCore.QSize(100, 0))
+        self.bandwidth_schedule_limit_spinbox.setMaximum(10000000000.99)
+        self.bandwidth_schedule_limit_spinbox.setObjectName("bandwidth_schedule_limit_spinbox")
+        self.horizontalLayout_16.addWidget(self.bandwidth_schedule_limit_spinbox)
+        self.bandwidth_schedule_size_combo = QtWidgets.QComboBox(self.bandwidth_limit_groupbox)
+        self.bandwidth_schedule_size_combo.setObjectName("bandwidth_schedule_size_combo")
+        self.horizontalLayout_16.addWidget(self.bandwidth_schedule_size_combo)
+        self.bandwidth_schedule_limit_unit_label = QtWidgets.QLabel(self.bandwidth_limit_groupbox)
+        self.bandwidth_schedule_limit_unit_label.setObjectName("bandwidth_schedule_limit_unit_label")
+        self.horizontalLayout_16.addWidget(self.bandwidth_schedule_limit_unit_label)
+        spacerItem6 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayout_16.addItem(spacerItem6)
+        self.verticalLayout_7.addLayout(self.horizontalLayout_16)
+        self.verticalLayout_3.addWidget(self.bandwidth_limit_groupbox)
         self.horizontalLayout_5 = QtWidgets.QHBoxLayout()
         self.horizontalLayout_5.setObjectName("horizontalLayout_5")
         self.label_9 = QtWidgets.QLabel(self.download_group_box)
@@ -267,9 +358,59 @@ class Ui_CoreSettingsWidget(object):
         self.download_reddit_hosted_videos_checkbox.setObjectName("download_reddit_hosted_videos_checkbox")
         self.horizontalLayout_6.addWidget(self.download_reddit_hosted_videos_checkbox)
         self.verticalLayout_3.addLayout(self.horizontalLayout_6)
+        self.horizontalLayout_13 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_13.setSpacing(20)
+        self.horizontalLayout_13.setObjectName("horizontalLayout_13")
+        self.drop_near_duplicate_images_label = QtWidgets.QLabel(self.download_group_box)
+        self.drop_near_duplicate_images_label.setObjectName("drop_near_duplicate_images_label")
+        self.horizontalLayout_13.addWidget(self.drop_near_duplicate_images_label)
+        self.drop_near_duplicate_images_checkbox = QtWidgets.QCheckBox(self.download_group_box)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.drop_near_duplicate_images_checkbox.sizePolicy().hasHeightForWidth())
+        self.drop_near_duplicate_images_checkbox.setSizePolicy(sizePolicy)
+        self.drop_near_duplicate_images_checkbox.setText("")
+        self.drop_near_duplicate_images_checkbox.setObjectName("drop_near_duplicate_images_checkbox")
+        self.horizontalLayout_13.addWidget(self.drop_near_duplicate_images_checkbox)
+        self.verticalLayout_3.addLayout(self.horizontalLayout_13)
+        self.horizontalLayout_17 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_17.setSpacing(20)
+        self.horizontalLayout_17.setObjectName("horizontalLayout_17")
+        self.pause_on_low_disk_space_checkbox = QtWidgets.QCheckBox(self.download_group_box)
+        self.pause_on_low_disk_space_checkbox.setObjectName("pause_on_low_disk_space_checkbox")
+        self.horizontalLayout_17.addWidget(self.pause_on_low_disk_space_checkbox)
+        self.minimum_free_disk_space_spinbox = QtWidgets.QDoubleSpinBox(self.download_group_box)
+        self.minimum_free_disk_space_spinbox.setMinimumSize(QtCore.QSize(100, 0))
+        self.minimum_free_disk_space_spinbox.setMaximum(10000000000.99)
+        self.minimum_free_disk_space_spinbox.setObjectName("minimum_free_disk_space_spinbox")
+        self.horizontalLayout_17.addWidget(self.minimum_free_disk_space_spinbox)
+        self.minimum_free_disk_space_size_combo = QtWidgets.QComboBox(self.download_group_box)
+        self.minimum_free_disk_space_size_combo.setObjectName("minimum_free_disk_space_size_combo")
+        self.horizontalLayout_17.addWidget(self.minimum_free_disk_space_size_combo)
+        spacerItem7 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayout_17.addItem(spacerItem7)
+        self.verticalLayout_3.addLayout(self.horizontalLayout_17)
+        self.horizontalLayout_18 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_18.setSpacing(20)
+        self.horizontalLayout_18.setObjectName("horizontalLayout_18")
+        self.use_http2_checkbox = QtWidgets.QCheckBox(self.download_group_box)
+        self.use_http2_checkbox.setObjectName("use_http2_checkbox")
+        self.horizontalLayout_18.addWidget(self.use_http2_checkbox)
+        self.http2_max_connections_label = QtWidgets.QLabel(self.download_group_box)
+        self.http2_max_connections_label.setObjectName("http2_max_connections_label")
+        self.horizontalLayout_18.addWidget(self.http2_max_connections_label)
+        self.http2_max_connections_spinbox = QtWidgets.QSpinBox(self.download_group_box)
+        self.http2_max_connections_spinbox.setMinimum(1)
+        self.http2_max_connections_spinbox.setMaximum(16)
+        self.http2_max_connections_spinbox.setObjectName("http2_max_connections_spinbox")
+        self.horizontalLayout_18.addWidget(self.http2_max_connections_spinbox)
+        spacerItem8 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayout_18.addItem(spacerItem8)
+        self.verticalLayout_3.addLayout(self.horizontalLayout_18)
         self.verticalLayout_4.addWidget(self.download_group_box)
-        spacerItem3 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
-        self.verticalLayout_4.addItem(spacerItem3)
+        spacerItem9 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
+        self.verticalLayout_4.addItem(spacerItem9)
         self.label_3.setBuddy(self.match_date_modified_checkbox)
         self.label_4.setBuddy(self.rename_invalid_download_folders_checkbox)
         self.label_9.setBuddy(self.download_on_add_checkbox)
@@ -299,14 +440,33 @@ class Ui_CoreSettingsWidget(object):
         self.download_group_box.setTitle(_translate("CoreSettingsWidget", "Download"))
         self.label_6.setText(_translate("CoreSettingsWidget", "Extraction thread count:"))
         self.label_7.setText(_translate("CoreSettingsWidget", "Download thread count:"))
+        self.download_engine_label.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>The engine used to download content.  The threaded engine downloads one file per download thread.  The async engine runs many downloads concurrently on a single event loop thread, which can increase throughput for sessions with many media files.</p></body></html>"))
+        self.download_engine_label.setText(_translate("CoreSettingsWidget", "Download engine:"))
+        self.async_download_limit_label.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>The maximum number of downloads the async engine will keep in progress at once.</p></body></html>"))
+        self.async_download_limit_label.setText(_translate("CoreSettingsWidget", "Async download limit:"))
         self.multi_part_download_groupbox.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>When enabled, large files (over the set threshold size) will be downloaded in multiple part simultaneously.  This will increase download speeds for downloads containing many large files.</p></body></html>"))
         self.multi_part_download_groupbox.setTitle(_translate("CoreSettingsWidget", "Multi-Part Download"))
         self.label_8.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>The size threshold at which a file is downloaded in parts in multiple threads.  Carefully adjust this number as there is a definite point of diminishing returns depending on your internet connection.</p></body></html>"))
         self.label_8.setText(_translate("CoreSettingsWidget", "Multi-part download threshold:"))
         self.label_13.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>The size threshold at which a file is downloaded in parts in multiple threads.  Carefully adjust this number as there is a definite point of diminishing returns depending on your internet connection.</p></body></html>"))
         self.label_13.setText(_translate("CoreSettingsWidget", "Multi-part download chunk size:"))
-        self.label_12.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>The number of threads that will be used for multi-part downloads.  This count should balance with the extraction and download thread counts you have set.</p></body></html>"))
+        self.label_12.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>The number of parts of a single file that will be downloaded at the same time.  This count should balance with the extraction and download thread counts you have set.</p></body></html>"))
         self.label_12.setText(_translate("CoreSettingsWidget", "Multi-part thread count:"))
+        self.multi_part_max_in_flight_label.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>The maximum number of multi-part download parts that will be downloaded at the same time across all files.  Parts from several large files are shared between this many threads.</p></body></html>"))
+        self.multi_part_max_in_flight_label.setText(_translate("CoreSettingsWidget", "Max parts in progress:"))
+        self.bandwidth_limit_groupbox.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>When enabled, the combined download speed of all downloads is limited to the set speed.  The available speed is shared evenly between the files being downloaded.  Changes to the limit take effect immediately, including for a download session that is already running.</p></body></html>"))
+        self.bandwidth_limit_groupbox.setTitle(_translate("CoreSettingsWidget", "Bandwidth Limit"))
+        self.bandwidth_limit_label.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>The maximum combined download speed.  Set to 0 for no limit.</p></body></html>"))
+        self.bandwidth_limit_label.setText(_translate("CoreSettingsWidget", "Download speed limit:"))
+        self.bandwidth_limit_unit_label.setText(_translate("CoreSettingsWidget", "per second"))
+        self.bandwidth_schedule_checkbox.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>When checked, the scheduled speed limit is used instead of the download speed limit between the set times of day.  If the end time is before the start time the scheduled period runs past midnight.</p></body></html>"))
+        self.bandwidth_schedule_checkbox.setText(_translate("CoreSettingsWidget", "Use scheduled limit between:"))
+        self.bandwidth_schedule_start_time_edit.setDisplayFormat(_translate("CoreSettingsWidget", "HH:mm"))
+        self.bandwidth_schedule_and_label.setText(_translate("CoreSettingsWidget", "and"))
+        self.bandwidth_schedule_end_time_edit.setDisplayFormat(_translate("CoreSettingsWidget", "HH:mm"))
+        self.bandwidth_schedule_limit_label.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>The maximum combined download speed during the scheduled period.  Set to 0 for no limit.</p></body></html>"))
+        self.bandwidth_schedule_limit_label.setText(_translate("CoreSettingsWidget", "Scheduled speed limit:"))
+        self.bandwidth_schedule_limit_unit_label.setText(_translate("CoreSettingsWidget", "per second"))
         self.label_9.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>When selected, users or subreddits will be downloaded immediately upon being added</p></body></html>"))
         self.label_9.setWhatsThis(_translate("CoreSettingsWidget", "When checked, users or subreddits will be downloaded immediately upon being added"))
         self.label_9.setText(_translate("CoreSettingsWidget", "Download on add:"))
@@ -318,3 +478,11 @@ class Ui_CoreSettingsWidget(object):
         self.label_11.setText(_translate("CoreSettingsWidget", "Finish incomplete extractions at start of session:"))
         self.label_5.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>Videos hosted on reddit are downloaded in two parts and must be joined after the download session is complete.</p><p>Because of this extra step, downloading these videos is optional</p></body></html>"))
         self.label_5.setText(_translate("CoreSettingsWidget", "Download reddit hosted videos:"))
+        self.drop_near_duplicate_images_label.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>If selected, a downloaded image that looks the same as an image that has already been downloaded (such as a resized or recompressed repost) will be deleted and marked as duplicate content.</p></body></html>"))
+        self.drop_near_duplicate_images_label.setText(_translate("CoreSettingsWidget", "Drop near duplicate images:"))
+        self.pause_on_low_disk_space_checkbox.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>If selected, downloads to a drive are paused while the drive\'s free space (less the space reserved by downloads in progress) is below the set amount, and resume once space has been freed.  Downloads that are paused are not marked as failed.</p></body></html>"))
+        self.pause_on_low_disk_space_checkbox.setText(_translate("CoreSettingsWidget", "Pause downloads when free disk space is below:"))
+        self.use_http2_checkbox.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>If selected, files from media hosts that support HTTP/2 (such as i.redd.it, v.redd.it and i.imgur.com) are downloaded over a small number of shared connections per host, with many downloads and multi-part ranges sent over each connection at once.  Other hosts, and hosts that do not support HTTP/2, use HTTP/1.1.  Requires the httpx package with HTTP/2 support to be installed.</p></body></html>"))
+        self.use_http2_checkbox.setText(_translate("CoreSettingsWidget", "Use HTTP/2 for media hosts"))
+        self.http2_max_connections_label.setText(_translate("CoreSettingsWidget", "Connections per host:"))
+        self.http2_max_connections_spinbox.setToolTip(_translate("CoreSettingsWidget", "<html><head/><body><p>The most HTTP/2 connections that are opened to a single host.  Requests beyond the number a connection can carry at once wait for a free stream.</p></body></html>"))
@@ -34,11 +34,92 @@ class SettingsManager:
         self.invalid_rename_format = self.get('core', 'invalid_rename_format', '%[dir_name](deleted)')
         self.extraction_thread_count = self.get('core', 'extraction_thread_count', 4)
         self.download_thread_count = self.get('core', 'download_thread_count', 4)
+        self.download_engine_choices = ['THREADED', 'ASYNC']
+        self.download_engine = self.get('core', 'download_engine', 'THREADED')
+        self.async_download_limit = self.get('core', 'async_download_limit', 100)
         self.use_multi_part_downloader = self.get('core', 'use_multi_part_downloader', True)
         self.multi_part_threshold = self.get('core', 'multi_part_threshold', 3 * 1024 * 1024)
         self.multi_part_chunk_size = self.get('core', 'multi_part_chunk_size', 1024 * 1024)
         self.multi_part_thread_count = self.get('core', 'multi_part_thread_count', 4)
+        self.multi_part_adaptive_range_size = self.get('core', 'multi_part_adaptive_range_size', True)
+        self.multi_part_max_chunk_size = self.get('core', 'multi_part_max_chunk_size', 64 * 1024 * 1024)
+        # the smallest range (in bytes) that adaptive range sizing shrinks to for slow or high latency hosts
+        self.multi_part_min_chunk_size = self.get('core', 'multi_part_min_chunk_size', 256 * 1024)
+        self.multi_part_target_range_seconds = self.get('core', 'multi_part_target_range_seconds', 4)
+        self.multi_part_preallocate = self.get('core', 'multi_part_preallocate', True)
+        self.multi_part_max_in_flight = self.get('core', 'multi_part_max_in_flight', 16)
+        # response bodies are read into a buffer of the buffer size (in bytes) that each download thread reuses, instead
+        # of a new chunk being allocated for each read
+        self.use_receive_buffer = self.get('core', 'use_receive_buffer', True)
+        self.download_buffer_size = self.get('core', 'download_buffer_size', 1024 * 1024)
+        # the number of processes that check downloaded files in a verification scan, 0 for one per cpu
+        self.verification_process_count = self.get('core', 'verification_process_count', 0)
+        self.link_duplicate_content = self.get('core', 'link_duplicate_content', True)
+        # completed files are flushed to the disk in batches per directory, each batch being synced once it has been
+        # open for the sync interval (in seconds)
+        self.sync_downloaded_files = self.get('core', 'sync_downloaded_files', True)
+        self.file_sync_interval = self.get('core', 'file_sync_interval', 5)
+        # downloads to a volume are paused while its free space (less the space reserved by downloads in progress) is
+        # below the minimum, and resumed once space has been freed
+        self.pause_on_low_disk_space = self.get('core', 'pause_on_low_disk_space', True)
+        self.minimum_free_disk_space = self.get('core', 'minimum_free_disk_space', 1024 * 1024 * 1024)
+        self.compute_image_hashes = self.get('core', 'compute_image_hashes', True)
+        self.drop_near_duplicate_images = self.get('core', 'drop_near_duplicate_images', False)
+        self.near_duplicate_distance = self.get('core', 'near_duplicate_distance', 4)
+        self.image_hash_process_count = self.get('core', 'image_hash_process_count', 2)
+        # the policies used to order the download queue, most important first.  Available policies are
+        # 'retries_last', 'added_objects_first', 'significant_first' and 'small_first'
+        self.download_priority_order = self.get('core', 'download_priority_order',
+                                                ['retries_last', 'added_objects_first', 'significant_first',
+                                                 'small_first'])
+        # the number of items queued between the download session stages at which the stage filling the queue is
+        # paused, and the number the queue must drain down to before it is resumed
+        self.submission_queue_high_watermark = self.get('core', 'submission_queue_high_watermark', 500)
+        self.submission_queue_low_watermark = self.get('core', 'submission_queue_low_watermark', 250)
+        self.download_queue_high_watermark = self.get('core', 'download_queue_high_watermark', 2000)
+        self.download_queue_low_watermark = self.get('core', 'download_queue_low_watermark', 1000)
+        # queued content with the same priority is downloaded in batches of up to the batch size per host, so that
+        # kept-alive connections are reused.  An item is only moved ahead of items queued up to the window (in seconds)
+        # before it
+        self.group_downloads_by_host = self.get('core', 'group_downloads_by_host', True)
+        self.host_batch_size = self.get('core', 'host_batch_size', 8)
+        self.host_batch_window = self.get('core', 'host_batch_window', 5)
+        self.limit_download_bandwidth = self.get('core', 'limit_download_bandwidth', False)
+        self.bandwidth_limit = self.get('core', 'bandwidth_limit', 1024 * 1024)
+        self.bandwidth_schedule_enabled = self.get('core', 'bandwidth_schedule_enabled', False)
+        self.bandwidth_schedule_start = self.get('core', 'bandwidth_schedule_start', '09:00')
+        self.bandwidth_schedule_end = self.get('core', 'bandwidth_schedule_end', '17:00')
+        self.bandwidth_schedule_limit = self.get('core', 'bandwidth_schedule_limit', 256 * 1024)
+        self.connection_pool_size = self.get('core', 'connection_pool_size', 16)
+        self.match_connection_pool_to_thread_count = self.get('core', 'match_connection_pool_to_thread_count', True)
+        # urls on the http2 hosts (and their subdomains) are requested over HTTP/2 if it is enabled and httpx is
+        # installed, with at most the set number of connections per host that the requests are multiplexed over
+        self.use_http2 = self.get('core', 'use_http2', False)
+        self.http2_max_connections_per_host = self.get('core', 'http2_max_connections_per_host', 1)
+        self.http2_hosts = self.get('core', 'http2_hosts', ['i.redd.it', 'v.redd.it', 'preview.redd.it', 'i.imgur.com'])
+        default_host_limits = {
+            'imgur.com': {'max_connections': 4, 'requests_per_second': 5},
+            'redgifs.com': {'max_connections': 4, 'requests_per_second': 4},
+            'gfycat.com': {'max_connections': 4, 'requests_per_second': 4},
+            'v.redd.it': {'max_connections': 8, 'requests_per_second': 8},
+        }
+        self.host_limit_defaults = self.get('core', 'host_limit_defaults',
+                                            {'max_connections': 8, 'requests_per_second': 10})
+        self.host_limits = self.get('core', 'host_limits', default_host_limits)
         self.download_on_add = self.get('core', 'download_on_add', False)
+        # failed posts and content are retried with a delay (in seconds) that starts at the base delay and doubles with
+        # each failure up to the max delay, until they have failed more than the max retry attempts.  Perpetual and
+        # scheduled sessions queue the items that are due for a retry every retry check interval
+        self.retry_base_delay = self.get('core', 'retry_base_delay', 300)
+        self.retry_max_delay = self.get('core', 'retry_max_delay', 24 * 60 * 60)
+        self.max_retry_attempts = self.get('core', 'max_retry_attempts', 3)
+        self.retry_due_items_automatically = self.get('core', 'retry_due_items_automatically', True)
+        self.retry_check_interval = self.get('core', 'retry_check_interval', 60)
+        # requests to a domain are paused for the cool-down (in seconds) once the failure threshold number of requests
+        # to it have failed in a row, and the items that point at it are deferred to be retried after the cool-down
+        self.use_circuit_breaker = self.get('core', 'use_circuit_breaker', True)
+        self.circuit_breaker_failure_threshold = self.get('core', 'circuit_breaker_failure_threshold', 5)
+        self.circuit_breaker_cooldown = self.get('core', 'circuit_breaker_cooldown', 120)
         self.finish_incomplete_extractions_at_session_start = \
             self.get('core', 'finish_incomplete_extractions_at_session_start', False)
         self.finish_incomplete_downloads_at_session_start = \
@@ -62,20 +62,10 @@ def open_post_in_browser(post):
 def check_file_path(content):
     """
     Checks the content's full file path to make sure there are no naming conflicts.  If there are, a number is
-    incremented and appended to the contents title until a naming conflict no longer exists.
+    incremented and appended to the contents title until a naming conflict no longer exists.  Paths that are reserved
+    by a partial download are treated as existing so that an unfinished download is not overwritten.  Names are
+    reserved from the session's directory index, so the returned name will not be given to any other content.
     :param content: The Content item who's path is to be checked.
     """
-    try:
-        system_util.create_directory(content.directory_path)
-    except PermissionError:
-        logger.error('Could not create directory path', extra={'directory_path': content.directory_path}, exc_info=True)
-    unique_count = 1
-    clean_title = system_util.clean(content.title)
-    download_title = clean_title
-    path = content.get_full_file_path(download_title)
-    while os.path.exists(path):
-        download_title = f'{clean_title}({unique_count})'
-        path = content.get_full_file_path(download_title)
-        unique_count += 1
-    # content.download_title = download_title
-    return download_title
+    return injector.get_directory_index().reserve(content.directory_path, system_util.clean(content.title),
+                                                  content.extension)
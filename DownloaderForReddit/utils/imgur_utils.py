@@ -27,6 +27,7 @@ from time import time
 import requests
 
 from ..utils import injector
+from ..core.cancellation import Cancelled
 
 
 logger = logging.getLogger(__name__)
@@ -44,7 +45,7 @@ class ImgurError(Exception):
         self.status_code = status_code
 
 
-def _send_request(url_extension, retries=1):
+def _send_request(url_extension, retries=1, cancel_token=None):
     global num_credits
     if retries < 0:
         return
@@ -52,7 +53,7 @@ def _send_request(url_extension, retries=1):
         'Authorization': 'Client-ID {}'.format(injector.settings_manager.imgur_client_id)
     }
     if time() > credit_reset_time:
-        check_credits()
+        check_credits(cancel_token)
     if num_credits > 0:
         url = _FREE_ENDPOINT + url_extension
         num_credits -= 1
@@ -61,23 +62,41 @@ def _send_request(url_extension, retries=1):
         headers['X-Mashape-Key'] = injector.settings_manager.imgur_mashape_key
     else:
         raise ImgurError(429)
-    response = requests.get(url, headers=headers, timeout=10)
+    response = _get(url, headers, cancel_token)
     if response.status_code == 200:
         return response.json()
     if response.status_code == 429:
         # Rate limiting.
-        check_credits()
-        _send_request(url_extension, retries - 1)
+        check_credits(cancel_token)
+        _send_request(url_extension, retries - 1, cancel_token)
     raise ImgurError(response.status_code)
 
 
-def check_credits():
+def _get(url, headers, cancel_token=None):
+    """
+    Requests an imgur api url.  If a cancellation token is supplied, the request is made through the connection pool so
+    that it is interrupted when the download session is stopped.
+    :raises Cancelled: If the download session is stopped before the response arrives.
+    """
+    with injector.get_circuit_breaker().guard(url) as circuit, \
+            injector.get_host_limiter().limit(url, cancel_token) as acquired:
+        if not acquired:
+            raise Cancelled()
+        if cancel_token is not None:
+            response = injector.get_connection_pool().get(url, cancel_token, headers=headers, timeout=10)
+        else:
+            response = requests.get(url, headers=headers, timeout=10)
+        circuit.record_response(response.status_code)
+    return response
+
+
+def check_credits(cancel_token=None):
     global num_credits, credit_reset_time
     url = _FREE_ENDPOINT + "credits"
     headers = {
         'Authorization': 'Client-ID {}'.format(injector.settings_manager.imgur_client_id)
     }
-    response = requests.get(url, headers=headers, timeout=10)
+    response = _get(url, headers, cancel_token)
     if response.status_code != 200:
         logger.error('Failed to check imgur credits, bad status code', extra={'status_code': response.status_code},
                      exc_info=True)
@@ -95,14 +114,14 @@ def get_link(json):
     return json['link']
 
 
-def get_album_images(album_id):
-    json = _send_request('album/{}/images'.format(album_id))
+def get_album_images(album_id, cancel_token=None):
+    json = _send_request('album/{}/images'.format(album_id), cancel_token=cancel_token)
     data = json['data']
     urls = [get_link(x) for x in data]
     return urls
 
 
-def get_single_image(image_id):
-    json = _send_request('image/{}'.format(image_id))
+def get_single_image(image_id, cancel_token=None):
+    json = _send_request('image/{}'.format(image_id), cancel_token=cancel_token)
     data = json['data']
     return get_link(data)
@@ -27,6 +27,17 @@ settings_manager = None
 database_handler = None
 message_queue = None
 scheduler = None
+connection_pool = None
+host_limiter = None
+range_sizer = None
+image_hash_index = None
+bandwidth_limiter = None
+file_sync_batcher = None
+disk_space_monitor = None
+directory_index = None
+retry_scheduler = None
+circuit_breaker = None
+receive_buffer = None
 
 
 def get_settings_manager():
@@ -58,3 +69,91 @@ def get_scheduler():
         from ..scheduling.scheduler import Scheduler
         scheduler = Scheduler()
     return scheduler
+
+
+def get_connection_pool():
+    global connection_pool
+    if connection_pool is None:
+        from ..core.connection_pool import ConnectionPool
+        connection_pool = ConnectionPool()
+    return connection_pool
+
+
+def get_host_limiter():
+    global host_limiter
+    if host_limiter is None:
+        from ..core.host_limiter import HostLimiter
+        host_limiter = HostLimiter()
+    return host_limiter
+
+
+def get_range_sizer():
+    global range_sizer
+    if range_sizer is None:
+        from ..core.range_sizer import RangeSizer
+        range_sizer = RangeSizer()
+    return range_sizer
+
+
+def get_image_hash_index():
+    global image_hash_index
+    if image_hash_index is None:
+        from ..core.image_hash import ImageHashIndex
+        image_hash_index = ImageHashIndex()
+    return image_hash_index
+
+
+def get_bandwidth_limiter():
+    global bandwidth_limiter
+    if bandwidth_limiter is None:
+        from ..core.bandwidth_limiter import BandwidthLimiter
+        bandwidth_limiter = BandwidthLimiter()
+    return bandwidth_limiter
+
+
+def get_file_sync_batcher():
+    global file_sync_batcher
+    if file_sync_batcher is None:
+        from ..core.file_sync import FileSyncBatcher
+        file_sync_batcher = FileSyncBatcher()
+    return file_sync_batcher
+
+
+def get_disk_space_monitor():
+    global disk_space_monitor
+    if disk_space_monitor is None:
+        from ..core.disk_space import DiskSpaceMonitor
+        disk_space_monitor = DiskSpaceMonitor()
+    return disk_space_monitor
+
+
+def get_directory_index():
+    global directory_index
+    if directory_index is None:
+        from ..core.directory_index import DirectoryIndex
+        directory_index = DirectoryIndex()
+    return directory_index
+
+
+def get_retry_scheduler():
+    global retry_scheduler
+    if retry_scheduler is None:
+        from ..core.retry_scheduler import RetryScheduler
+        retry_scheduler = RetryScheduler()
+    return retry_scheduler
+
+
+def get_circuit_breaker():
+    global circuit_breaker
+    if circuit_breaker is None:
+        from ..core.circuit_breaker import CircuitBreaker
+        circuit_breaker = CircuitBreaker()
+    return circuit_breaker
+
+
+def get_receive_buffer():
+    global receive_buffer
+    if receive_buffer is None:
+        from ..core.receive_buffer import ReceiveBuffer
+        receive_buffer = ReceiveBuffer()
+    return receive_buffer
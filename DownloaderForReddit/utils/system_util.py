@@ -29,6 +29,7 @@ import shutil
 import datetime
 import logging
 import re
+import hashlib
 
 from ..local_logging import log_utils
 
@@ -242,6 +243,120 @@ def delete_file(file_path):
         os.remove(file_path)
 
 
+def sync_file(file_path):
+    """
+    Flushes the data of the file at the supplied path from the operating system's cache to the disk.  Windows only
+    allows files that are open for writing to be flushed.
+    """
+    fd = os.open(file_path, os.O_RDWR if os.name == 'nt' else os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def sync_directory(path):
+    """
+    Flushes the entries of the directory at the supplied path to the disk, which makes files that have been created or
+    renamed in it durable.  Directories can not be opened to be flushed on Windows, where this does nothing.
+    """
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def new_content_hash():
+    """Returns a new hash object of the type used to identify downloaded content."""
+    return hashlib.blake2b(digest_size=20)
+
+
+def hash_file(file_path, length=None, content_hash=None):
+    """
+    Hashes the contents of the file at the supplied path without reading the whole file into memory.
+    :param file_path: The path of the file to hash.
+    :param length: Optional.  The number of bytes from the start of the file to hash.  The whole file is hashed if None.
+    :param content_hash: Optional.  A hash object to update.  A new content hash is used if None.
+    :return: The updated hash object.
+    """
+    with open(file_path, 'rb') as file:
+        return hash_file_object(file, length, content_hash)
+
+
+def hash_file_object(file, length=None, content_hash=None):
+    """
+    Hashes the contents of an open file from its current position.
+    :param file: The file object to read from.
+    :param length: Optional.  The number of bytes to hash.  The rest of the file is hashed if None.
+    :param content_hash: Optional.  A hash object to update.  A new content hash is used if None.
+    :return: The updated hash object.
+    """
+    if content_hash is None:
+        content_hash = new_content_hash()
+    for chunk in read_file_object(file, length):
+        content_hash.update(chunk)
+    return content_hash
+
+
+def read_file_object(file, length=None):
+    """
+    Yields the contents of an open file from its current position in chunks of up to a megabyte.
+    :param file: The file object to read from.
+    :param length: Optional.  The number of bytes to read.  The rest of the file is read if None.
+    """
+    remaining = length
+    while remaining is None or remaining > 0:
+        chunk = file.read(MB if remaining is None else min(MB, remaining))
+        if not chunk:
+            break
+        yield chunk
+        if remaining is not None:
+            remaining -= len(chunk)
+
+
+def reflink_file(source_path, link_path):
+    """
+    Creates a copy-on-write clone of the source file at the link path on file systems that support it (btrfs, xfs).
+    :return: True if the clone was created, False if the system or file system does not support it.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    ficlone = 0x40049409
+    try:
+        with open(source_path, 'rb') as source, open(link_path, 'wb') as link:
+            fcntl.ioctl(link.fileno(), ficlone, source.fileno())
+        return True
+    except OSError:
+        delete_file(link_path)
+        return False
+
+
+def link_duplicate_file(source_path, duplicate_path):
+    """
+    Replaces the file at the duplicate path with a reflink of the source file, or a hardlink if reflinks are not
+    supported, so that the identical files only take up space on the disk once.
+    :return: True if the duplicate file was replaced, False if neither link type could be created, in which case the
+             duplicate file is left as it was.
+    """
+    temp_path = f'{duplicate_path}.link'
+    try:
+        delete_file(temp_path)
+        if not reflink_file(source_path, temp_path):
+            os.link(source_path, temp_path)
+        os.replace(temp_path, duplicate_path)
+        return True
+    except OSError:
+        logger.debug('Failed to link duplicate file', extra={'source_path': source_path,
+                                                             'duplicate_path': duplicate_path}, exc_info=True)
+        delete_file(temp_path)
+        return False
+
+
 def join_path(*args):
     """
     Used in place of os.path.join in order to give uniform path separators that display nicely to the user and work in
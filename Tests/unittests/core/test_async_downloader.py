@@ -0,0 +1,166 @@
+import os
+import time
+import asyncio
+import tempfile
+import logging
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from threading import Thread, get_ident
+from queue import Queue
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from DownloaderForReddit.core.cancellation import CancellationToken
+from DownloaderForReddit.core.async_downloader import AsyncDownloader
+from DownloaderForReddit.database.database_handler import DatabaseHandler
+from DownloaderForReddit.database.models import Content
+from DownloaderForReddit.utils import injector
+from Tests.mockobjects.mock_objects import get_post
+
+
+logging.disable(logging.CRITICAL)
+
+# the header of an mp4 file, so that the downloaded file passes verification
+MP4_HEADER = b'\x00\x00\x00\x18ftypmp42'
+FILE_DATA = MP4_HEADER + os.urandom(64 * 1024 - len(MP4_HEADER))
+
+
+class FileHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path == '/image.jpg':
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(FILE_DATA)))
+            self.end_headers()
+            self.wfile.write(FILE_DATA)
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@patch('DownloaderForReddit.core.downloader.Message')
+class TestAsyncDownloader(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), FileHandler)
+        cls.server_thread = Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.settings = MagicMock()
+        # the in memory database shares a single connection between sessions, so the database work that the io executor
+        # runs is kept to one thread to stop the sessions of concurrent downloads from committing each other's changes
+        self.settings.download_thread_count = 1
+        self.settings.multi_part_thread_count = 2
+        self.settings.multi_part_max_in_flight = 4
+        self.settings.use_receive_buffer = True
+        self.settings.download_buffer_size = 64 * 1024
+        self.settings.limit_download_bandwidth = False
+        self.settings.sync_downloaded_files = False
+        self.settings.pause_on_low_disk_space = False
+        self.settings.retry_base_delay = 300
+        self.settings.retry_max_delay = 86400
+        self.settings.max_retry_attempts = 3
+        self.settings.async_download_limit = 10
+        self.settings.use_multi_part_downloader = False
+        self.settings.match_file_modified_to_post_date = False
+        self.settings.compute_image_hashes = False
+        self.settings.drop_near_duplicate_images = False
+        self.settings.host_limits = {}
+        self.settings.host_limit_defaults = {'max_connections': 8, 'requests_per_second': 100}
+        injector.settings_manager = self.settings
+        injector.connection_pool = None
+        injector.directory_index = None
+        injector.database_handler = DatabaseHandler(in_memory=True)
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_downloader(self, *urls):
+        content_ids = []
+        with injector.database_handler.get_scoped_session() as session:
+            post = get_post(session=session)
+            for url in urls:
+                content = Content(title='Test Content', extension='jpg', url=url, user=post.author,
+                                  subreddit=post.subreddit, post=post, directory_path=self.directory.name)
+                session.add(content)
+                session.commit()
+                content_ids.append(content.id)
+        queue = Queue()
+        for content_id in content_ids:
+            queue.put(content_id)
+        queue.put(None)
+        downloader = AsyncDownloader(queue, 1, CancellationToken())
+        downloader.run()
+        with injector.database_handler.get_scoped_session() as session:
+            return [session.query(Content).get(x) for x in content_ids], downloader
+
+    def test_download_content(self, message):
+        contents, downloader = self.run_downloader(f'{self.base_url}/image.jpg', f'{self.base_url}/image.jpg')
+        self.assertEqual(2, downloader.download_count)
+        for content in contents:
+            self.assertTrue(content.downloaded)
+            with open(content.get_full_file_path(), 'rb') as file:
+                self.assertEqual(FILE_DATA, file.read())
+        self.assertNotEqual(contents[0].download_title, contents[1].download_title)
+
+    def test_unsuccessful_response(self, message):
+        contents, downloader = self.run_downloader(f'{self.base_url}/missing.jpg')
+        self.assertEqual(0, downloader.download_count)
+        self.assertFalse(contents[0].downloaded)
+        self.assertEqual('UNSUCCESSFUL_RESPONSE', contents[0].download_error.name)
+
+    def test_connection_error_recorded_off_event_loop(self, message):
+        self.settings.use_circuit_breaker = False
+        injector.circuit_breaker = None
+        self.addCleanup(setattr, injector, 'circuit_breaker', None)
+        threads = []
+        set_download_error = Content.set_download_error
+
+        def record_thread(content, *args):
+            threads.append(get_ident())
+            set_download_error(content, *args)
+
+        with patch.object(Content, 'set_download_error', record_thread):
+            contents, downloader = self.run_downloader('http://127.0.0.1:1/image.jpg')
+        self.assertEqual('CONNECTION_ERROR', contents[0].download_error.name)
+        self.assertEqual(1, len(threads))
+        self.assertNotEqual(get_ident(), threads[0])
+
+    def test_cancelled_task_waits_for_blocking_call(self, message):
+        downloader = AsyncDownloader(Queue(), 1, CancellationToken())
+        downloader.loop = asyncio.new_event_loop()
+        calls = []
+
+        def call():
+            calls.append(get_ident())
+            time.sleep(0.2)
+            calls.append('returned')
+
+        async def cancel():
+            task = downloader.loop.create_task(downloader.run_blocking(call))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            calls.append('cancelled')
+
+        try:
+            downloader.loop.run_until_complete(cancel())
+        finally:
+            downloader.loop.close()
+            downloader.io_executor.shutdown()
+            downloader.multi_part_executor.shutdown()
+            downloader.multi_part_scheduler.shutdown()
+        self.assertNotEqual(get_ident(), calls[0])
+        self.assertEqual(['returned', 'cancelled'], calls[1:])
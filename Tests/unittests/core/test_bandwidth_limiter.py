@@ -0,0 +1,90 @@
+import time
+from datetime import datetime
+from threading import Thread, Timer
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from DownloaderForReddit.core.bandwidth_limiter import BandwidthLimiter
+from DownloaderForReddit.core.cancellation import CancellationToken, Cancelled
+from DownloaderForReddit.utils import injector
+
+
+KB = 1024
+
+
+class TestBandwidthLimiter(TestCase):
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.limit_download_bandwidth = True
+        self.settings.bandwidth_limit = 400 * KB
+        self.settings.bandwidth_schedule_enabled = False
+        self.settings.bandwidth_schedule_start = '09:00'
+        self.settings.bandwidth_schedule_end = '17:00'
+        self.settings.bandwidth_schedule_limit = 100 * KB
+        injector.settings_manager = self.settings
+        self.limiter = BandwidthLimiter()
+
+    def test_unlimited_returns_immediately(self):
+        self.settings.limit_download_bandwidth = False
+        start = time.perf_counter()
+        self.limiter.consume(100 * 1024 * KB)
+        self.assertLess(time.perf_counter() - start, 0.1)
+
+    def test_consume_limits_rate(self):
+        start = time.perf_counter()
+        self.limiter.consume(300 * KB)
+        elapsed = time.perf_counter() - start
+        # 300 KB at 400 KB/s less the burst allowance
+        self.assertGreater(elapsed, 0.4)
+        self.assertLess(elapsed, 1.2)
+
+    def test_small_flow_not_starved_by_large_flow(self):
+        finished = {}
+
+        def consume(flow, byte_count):
+            self.limiter.consume(byte_count, flow)
+            finished[flow] = time.perf_counter()
+
+        start = time.perf_counter()
+        large = Thread(target=consume, args=('video.mp4', 800 * KB))
+        large.start()
+        time.sleep(0.1)
+        small = Thread(target=consume, args=('image.jpg', 40 * KB))
+        small.start()
+        small.join()
+        large.join()
+        self.assertLess(finished['image.jpg'] - start, 0.6)
+        self.assertGreater(finished['video.mp4'], finished['image.jpg'])
+
+    def test_limit_change_takes_effect_while_waiting(self):
+        self.settings.bandwidth_limit = 10 * KB
+        thread = Thread(target=self.limiter.consume, args=(1024 * KB,))
+        thread.start()
+        time.sleep(0.2)
+        self.settings.limit_download_bandwidth = False
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+
+    def test_cancel_stops_wait(self):
+        self.settings.bandwidth_limit = 10 * KB
+        token = CancellationToken()
+        Timer(0.2, token.cancel).start()
+        start = time.perf_counter()
+        with self.assertRaises(Cancelled):
+            self.limiter.consume(1024 * KB, 'image.jpg', token)
+        self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertEqual([], self.limiter.waiting)
+
+    def test_schedule_limit(self):
+        self.settings.bandwidth_schedule_enabled = True
+        self.assertEqual(100 * KB, self.limiter.get_limit(datetime(2020, 1, 1, 12, 0)))
+        self.assertEqual(400 * KB, self.limiter.get_limit(datetime(2020, 1, 1, 18, 0)))
+
+    def test_schedule_past_midnight(self):
+        self.settings.bandwidth_schedule_enabled = True
+        self.settings.bandwidth_schedule_start = '22:00'
+        self.settings.bandwidth_schedule_end = '06:00'
+        self.assertEqual(100 * KB, self.limiter.get_limit(datetime(2020, 1, 1, 23, 30)))
+        self.assertEqual(100 * KB, self.limiter.get_limit(datetime(2020, 1, 1, 2, 0)))
+        self.assertEqual(400 * KB, self.limiter.get_limit(datetime(2020, 1, 1, 12, 0)))
@@ -0,0 +1,131 @@
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock
+from threading import Thread, Event, Timer
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from DownloaderForReddit.core.cancellation import CancellationToken, Cancelled
+from DownloaderForReddit.core.connection_pool import ConnectionPool
+from DownloaderForReddit.utils import injector
+
+
+class StallHandler(BaseHTTPRequestHandler):
+
+    release = Event()
+
+    def do_GET(self):
+        if self.path == '/headers':
+            self.release.wait(5)
+        self.send_response(200)
+        self.send_header('Content-Length', '100')
+        self.end_headers()
+        self.wfile.write(bytes(50))
+        self.wfile.flush()
+        self.release.wait(5)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCancellationToken(TestCase):
+
+    def test_callbacks_called_once_on_cancel(self):
+        token = CancellationToken()
+        callback = MagicMock()
+        with token.on_cancel(callback):
+            token.cancel()
+            token.cancel()
+        callback.assert_called_once_with()
+        self.assertTrue(token.is_set())
+        self.assertIsNotNone(token.latency)
+
+    def test_callback_not_called_after_context_exits(self):
+        token = CancellationToken()
+        callback = MagicMock()
+        with token.on_cancel(callback):
+            pass
+        token.cancel()
+        callback.assert_not_called()
+
+    def test_callback_called_when_already_cancelled(self):
+        token = CancellationToken()
+        token.cancel()
+        callback = MagicMock()
+        with token.on_cancel(callback):
+            callback.assert_called_once_with()
+
+    def test_check(self):
+        token = CancellationToken()
+        self.assertIsNone(token.latency)
+        token.check()
+        token.cancel()
+        self.assertRaises(Cancelled, token.check)
+
+    def test_interruptible_replaces_error_after_cancel(self):
+        token = CancellationToken()
+        with self.assertRaises(ValueError):
+            with token.interruptible():
+                raise ValueError()
+        token.cancel()
+        with self.assertRaises(Cancelled):
+            with token.interruptible():
+                raise ValueError()
+
+    def test_run_returns_value_and_raises_error(self):
+        token = CancellationToken()
+        self.assertEqual(3, token.run(lambda x, y: x + y, 1, y=2))
+        with self.assertRaises(KeyError):
+            token.run(lambda: {}['key'])
+
+    def test_run_abandons_blocking_call(self):
+        token = CancellationToken()
+        blocker = Event()
+        Timer(0.1, token.cancel).start()
+        start = time.monotonic()
+        with self.assertRaises(Cancelled):
+            token.run(blocker.wait, 5)
+        self.assertLess(time.monotonic() - start, 1)
+        blocker.set()
+
+
+class TestCancelRequests(TestCase):
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.match_connection_pool_to_thread_count = False
+        self.settings.connection_pool_size = 2
+        self.settings.use_http2 = False
+        injector.settings_manager = self.settings
+        StallHandler.release.clear()
+        self.server = HTTPServer(('127.0.0.1', 0), StallHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self.pool = ConnectionPool()
+        self.token = CancellationToken()
+
+    def tearDown(self):
+        StallHandler.release.set()
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_request_waiting_on_headers_interrupted(self):
+        Timer(0.2, self.token.cancel).start()
+        start = time.monotonic()
+        with self.assertRaises(Cancelled):
+            self.pool.get(f'{self.url}/headers', cancel_token=self.token, timeout=10)
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_streamed_body_read_interrupted(self):
+        start = time.monotonic()
+        with self.pool.get(f'{self.url}/body', cancel_token=self.token, stream=True, timeout=10) as response:
+            Timer(0.2, self.token.cancel).start()
+            with self.assertRaises(Cancelled):
+                with self.token.interruptible():
+                    for _ in response.iter_content(10):
+                        pass
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_request_not_sent_after_cancel(self):
+        self.token.cancel()
+        self.assertRaises(Cancelled, self.pool.get, f'{self.url}/body', cancel_token=self.token)
@@ -0,0 +1,99 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from DownloaderForReddit.core.circuit_breaker import CircuitBreaker, CircuitOpen, DomainCircuit
+from DownloaderForReddit.utils import injector
+
+
+@patch('DownloaderForReddit.core.circuit_breaker.Message')
+class TestCircuitBreaker(TestCase):
+
+    URL = 'https://api.gfycat.com/v1/gfycats/abc'
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.use_circuit_breaker = True
+        self.settings.circuit_breaker_failure_threshold = 3
+        self.settings.circuit_breaker_cooldown = 60
+        self.settings.host_limits = {'gfycat.com': {}}
+        injector.settings_manager = self.settings
+        injector.host_limiter = None
+        self.breaker = CircuitBreaker()
+        self.now = 1000
+        patcher = patch('DownloaderForReddit.core.circuit_breaker.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record_failures(self, count=1):
+        for _ in range(count):
+            self.breaker.admit(self.URL).record_failure()
+
+    def get_state(self):
+        return self.breaker.domains['gfycat.com'].state
+
+    def test_opens_after_consecutive_failures(self, message):
+        self.record_failures(2)
+        self.breaker.admit(self.URL).record_response(200)
+        self.record_failures(2)
+        self.assertEqual(DomainCircuit.CLOSED, self.get_state())
+        self.record_failures()
+        self.assertEqual(DomainCircuit.OPEN, self.get_state())
+        with self.assertRaises(CircuitOpen) as context:
+            self.breaker.admit('https://thumbs.gfycat.com/abc.webm')
+        self.assertEqual('gfycat.com', context.exception.domain)
+        self.assertEqual(60, context.exception.retry_after)
+
+    def test_client_errors_are_not_failures(self, message):
+        for _ in range(5):
+            self.breaker.admit(self.URL).record_response(404)
+        self.assertEqual(DomainCircuit.CLOSED, self.get_state())
+
+    def test_guard_records_connection_errors(self, message):
+        for _ in range(3):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                with self.breaker.guard(self.URL):
+                    raise requests.exceptions.ConnectionError()
+        self.assertEqual(DomainCircuit.OPEN, self.get_state())
+        with self.assertRaises(CircuitOpen):
+            with self.breaker.guard(self.URL):
+                self.fail('Request made while the circuit is open')
+
+    def test_successful_probe_closes_circuit(self, message):
+        self.record_failures(3)
+        self.now += 60
+        probe = self.breaker.admit(self.URL)
+        self.assertTrue(probe.probe)
+        with self.assertRaises(CircuitOpen):
+            self.breaker.admit(self.URL)
+        probe.record_response(200)
+        self.assertEqual(DomainCircuit.CLOSED, self.get_state())
+        self.assertFalse(self.breaker.admit(self.URL).probe)
+
+    def test_failed_probe_reopens_circuit(self, message):
+        self.record_failures(3)
+        self.now += 60
+        self.breaker.admit(self.URL).record_response(503)
+        self.assertEqual(DomainCircuit.OPEN, self.get_state())
+        self.now += 30
+        with self.assertRaises(CircuitOpen) as context:
+            self.breaker.admit(self.URL)
+        self.assertEqual(30, context.exception.retry_after)
+        stats = self.breaker.get_stats()['gfycat.com']
+        self.assertEqual(2, stats['open_count'])
+        self.assertEqual(1, stats['probe_failures'])
+        self.assertEqual(1, stats['short_circuited_requests'])
+
+    def test_probe_without_outcome_released(self, message):
+        self.record_failures(3)
+        self.now += 60
+        with self.breaker.guard(self.URL) as call:
+            self.assertTrue(call.probe)
+        self.assertTrue(self.breaker.admit(self.URL).probe)
+
+    def test_disabled(self, message):
+        self.settings.use_circuit_breaker = False
+        self.record_failures(5)
+        self.assertFalse(self.breaker.admit(self.URL).probe)
+        self.assertEqual({}, self.breaker.get_stats())
@@ -0,0 +1,157 @@
+from unittest import TestCase, skipUnless
+from unittest.mock import MagicMock, patch
+from threading import Thread
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from DownloaderForReddit.core.connection_pool import ConnectionPool
+from DownloaderForReddit.utils import injector
+
+
+class TestConnectionPool(TestCase):
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.match_connection_pool_to_thread_count = True
+        self.settings.use_multi_part_downloader = True
+        self.settings.download_thread_count = 4
+        self.settings.multi_part_thread_count = 3
+        self.settings.multi_part_max_in_flight = 8
+        self.settings.connection_pool_size = 10
+        self.settings.use_http2 = False
+        self.settings.http2_max_connections_per_host = 1
+        self.settings.http2_hosts = ['i.redd.it', 'imgur.com']
+        injector.settings_manager = self.settings
+
+    def test_pool_size_tracks_thread_counts(self):
+        pool = ConnectionPool()
+        self.assertEqual(12, pool.pool_size)
+
+    def test_pool_size_tracks_download_thread_count_without_multi_part(self):
+        self.settings.use_multi_part_downloader = False
+        pool = ConnectionPool()
+        self.assertEqual(4, pool.pool_size)
+
+    def test_pool_size_from_settings(self):
+        self.settings.match_connection_pool_to_thread_count = False
+        pool = ConnectionPool()
+        self.assertEqual(10, pool.pool_size)
+
+    def test_thread_sessions_share_adapter(self):
+        pool = ConnectionPool()
+        sessions = []
+        threads = [Thread(target=lambda: sessions.append(pool.session)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(3, len(set(id(x) for x in sessions)))
+        for session in sessions:
+            self.assertIs(pool.adapter, session.get_adapter('https://i.redd.it/'))
+
+    def test_update_pool_size_replaces_sessions(self):
+        pool = ConnectionPool()
+        session = pool.session
+        self.settings.download_thread_count = 8
+        pool.update_pool_size()
+        self.assertEqual(16, pool.pool_size)
+        self.assertIsNot(session, pool.session)
+        self.assertIs(pool.adapter, pool.session.get_adapter('https://i.imgur.com/'))
+
+    def test_http2_not_used_when_disabled(self):
+        pool = ConnectionPool()
+        with patch.object(ConnectionPool, 'http2_available', return_value=True):
+            self.assertFalse(pool.use_http2('https://i.redd.it/abc.jpg'))
+
+    @patch.object(ConnectionPool, 'http2_available', return_value=True)
+    def test_http2_used_for_configured_hosts(self, available):
+        self.settings.use_http2 = True
+        pool = ConnectionPool()
+        self.assertTrue(pool.use_http2('https://i.redd.it/abc.jpg'))
+        self.assertTrue(pool.use_http2('https://i.imgur.com/abc.jpg'))
+        self.assertFalse(pool.use_http2('https://v.redd.it/abc/DASH_720'))
+        self.assertFalse(pool.use_http2('https://notimgur.com/abc.jpg'))
+
+    @patch.object(ConnectionPool, 'http2_available', return_value=True)
+    def test_http1_fallback_hosts_reset(self, available):
+        self.settings.use_http2 = True
+        pool = ConnectionPool()
+        pool.http1_hosts.add('i.redd.it')
+        self.assertFalse(pool.use_http2('https://i.redd.it/abc.jpg'))
+        pool.reset_http1_hosts()
+        self.assertTrue(pool.use_http2('https://i.redd.it/abc.jpg'))
+
+
+class FileHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '1024')
+        self.end_headers()
+        self.wfile.write(b'x' * 1024)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConnectionReuse(TestCase):
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.match_connection_pool_to_thread_count = False
+        self.settings.connection_pool_size = 4
+        self.settings.use_http2 = False
+        injector.settings_manager = self.settings
+        self.server = HTTPServer(('127.0.0.1', 0), FileHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/image.jpg'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_kept_alive_connection_reuse_counted(self):
+        pool = ConnectionPool()
+        for _ in range(3):
+            with pool.get(self.url, stream=True, timeout=10) as response:
+                b''.join(response.iter_content(256))
+        stats = pool.get_stats()
+        self.assertEqual(3, stats['requests'])
+        self.assertEqual(1, stats['new_connections'])
+        self.assertEqual(0.667, stats['reuse_ratio'])
+        pool.reset_stats()
+        self.assertEqual(0, pool.get_stats()['requests'])
+        pool.close()
+
+
+@skipUnless(ConnectionPool.http2_available(), 'httpx with HTTP/2 support is not installed')
+class TestHttp2Transport(TestCase):
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.match_connection_pool_to_thread_count = False
+        self.settings.connection_pool_size = 4
+        self.settings.use_http2 = True
+        self.settings.http2_max_connections_per_host = 1
+        self.settings.http2_hosts = ['127.0.0.1']
+        injector.settings_manager = self.settings
+        self.server = HTTPServer(('127.0.0.1', 0), FileHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/image.jpg'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_requests_share_client_and_fall_back_to_http1(self):
+        pool = ConnectionPool()
+        responses = []
+        for _ in range(3):
+            with pool.get(self.url, stream=True, timeout=10) as response:
+                responses.append((response.status_code, response.http_version,
+                                  b''.join(response.iter_content(256))))
+        # the local server does not offer HTTP/2, so the client speaks HTTP/1.1 to it over the shared connection
+        self.assertEqual([(200, 'HTTP/1.1', b'x' * 1024)] * 3, responses)
+        self.assertEqual(1, len(pool.http2_clients))
+        pool.close()
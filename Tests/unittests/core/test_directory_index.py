@@ -0,0 +1,67 @@
+import os
+import tempfile
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import patch
+
+from DownloaderForReddit.core.directory_index import DirectoryIndex
+from DownloaderForReddit.core.partial_download import PartialDownload
+
+
+class TestDirectoryIndex(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.index = DirectoryIndex()
+
+    def create_file(self, name):
+        with open(os.path.join(self.directory.name, name), 'w'):
+            pass
+
+    def test_free_title_reserved(self):
+        self.assertEqual('title', self.index.reserve(self.directory.name, 'title', 'jpg'))
+
+    def test_existing_file_not_reused(self):
+        self.create_file('title.jpg')
+        self.create_file('title(1).jpg')
+        self.assertEqual('title(2)', self.index.reserve(self.directory.name, 'title', 'jpg'))
+
+    def test_reserved_names_not_given_twice(self):
+        titles = [self.index.reserve(self.directory.name, 'title', 'jpg') for _ in range(3)]
+        self.assertEqual(['title', 'title(1)', 'title(2)'], titles)
+        self.assertEqual('title', self.index.reserve(self.directory.name, 'title', 'png'))
+
+    def test_partial_download_name_not_reused(self):
+        self.create_file('title.jpg' + PartialDownload.SIDECAR_SUFFIX)
+        self.assertEqual('title(1)', self.index.reserve(self.directory.name, 'title', 'jpg'))
+        self.index.reset()
+        self.assertEqual('title', self.index.reserve(self.directory.name, 'title', 'jpg', check_partial=False))
+
+    def test_directory_created_and_listed_once(self):
+        directory = os.path.join(self.directory.name, 'new')
+        with patch('DownloaderForReddit.core.directory_index.os.listdir', wraps=os.listdir) as listdir:
+            for _ in range(5):
+                self.index.reserve(directory, 'title', 'jpg')
+        self.assertTrue(os.path.isdir(directory))
+        listdir.assert_called_once()
+
+    def test_concurrent_reservations_unique(self):
+        titles = []
+
+        def reserve():
+            for _ in range(50):
+                titles.append(self.index.reserve(self.directory.name, 'title', 'jpg'))
+
+        threads = [Thread(target=reserve) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(200, len(set(titles)))
+
+    def test_reset_lists_directory_again(self):
+        self.index.reserve(self.directory.name, 'title', 'jpg')
+        self.index.reset()
+        self.create_file('title.jpg')
+        self.assertEqual('title(1)', self.index.reserve(self.directory.name, 'title', 'jpg'))
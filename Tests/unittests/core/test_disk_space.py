@@ -0,0 +1,114 @@
+import tempfile
+from collections import namedtuple
+from threading import Thread, Event
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from DownloaderForReddit.core.disk_space import DiskSpaceMonitor, InsufficientDiskSpace, DownloadDoesNotFit
+from DownloaderForReddit.utils import injector
+
+
+MB = 1024 * 1024
+DiskUsage = namedtuple('DiskUsage', 'total used free')
+
+
+@patch('DownloaderForReddit.core.disk_space.Message')
+class TestDiskSpaceMonitor(TestCase):
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.pause_on_low_disk_space = True
+        self.settings.minimum_free_disk_space = 100 * MB
+        injector.settings_manager = self.settings
+        self.free = 150 * MB
+        patcher = patch('DownloaderForReddit.core.disk_space.shutil.disk_usage',
+                        side_effect=lambda path: DiskUsage(0, 0, self.free))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.monitor = DiskSpaceMonitor()
+        self.monitor.REFRESH_INTERVAL = 0
+        self.monitor.POLL_INTERVAL = 0.05
+        self.stop_run = Event()
+
+    def get_partial(self, size, bytes_received=0):
+        partial = MagicMock()
+        partial.size = size
+        partial.bytes_received = bytes_received
+        return partial
+
+    def test_reserved_space_counted_against_other_downloads(self, message):
+        self.monitor.reservation(self.directory.name).reserve(self.get_partial(40 * MB))
+        with self.assertRaises(InsufficientDiskSpace):
+            self.monitor.reservation(self.directory.name).reserve(self.get_partial(20 * MB))
+
+    def test_reservation_shrinks_as_file_is_written(self, message):
+        partial = self.get_partial(40 * MB)
+        self.monitor.reservation(self.directory.name).reserve(partial)
+        partial.bytes_received = 30 * MB
+        self.free -= 30 * MB
+        self.monitor.reservation(self.directory.name).reserve(self.get_partial(10 * MB))
+
+    def test_released_space_available(self, message):
+        reservation = self.monitor.reservation(self.directory.name)
+        reservation.reserve(self.get_partial(40 * MB))
+        reservation.release()
+        self.monitor.reservation(self.directory.name).reserve(self.get_partial(40 * MB))
+
+    def test_unknown_size_needs_minimum_free_space(self, message):
+        self.monitor.reservation(self.directory.name).reserve(self.get_partial(None))
+        self.free = 50 * MB
+        with self.assertRaises(InsufficientDiskSpace):
+            self.monitor.reservation(self.directory.name).reserve(self.get_partial(None))
+
+    def test_wait_paused_until_space_freed(self, message):
+        self.free = 50 * MB
+        reservation = self.monitor.reservation(self.directory.name)
+        thread = Thread(target=reservation.wait, args=(self.stop_run,), daemon=True)
+        thread.start()
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+        self.assertIn(self.directory.name, self.monitor.get_stats()['paused_volumes'])
+        self.free = 150 * MB
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([], self.monitor.get_stats()['paused_volumes'])
+        self.assertEqual(1, self.monitor.get_stats()['pause_count'])
+
+    def test_wait_ends_when_stopped(self, message):
+        self.free = 0
+        self.stop_run.set()
+        self.assertFalse(self.monitor.reservation(self.directory.name).wait(self.stop_run))
+
+    def test_oversized_download_failed_after_wait(self, message):
+        self.monitor.OVERSIZED_WAIT = 0.2
+        reservation = self.monitor.reservation(self.directory.name)
+        with self.assertRaises(InsufficientDiskSpace):
+            reservation.reserve(self.get_partial(60 * MB))
+        with self.assertRaises(DownloadDoesNotFit):
+            reservation.wait(self.stop_run)
+        message.send_warning.assert_called_once()
+
+    def test_oversized_download_admitted_when_space_freed(self, message):
+        reservation = self.monitor.reservation(self.directory.name)
+        with self.assertRaises(InsufficientDiskSpace):
+            reservation.reserve(self.get_partial(60 * MB))
+        self.assertFalse(reservation.check())
+        self.free = 200 * MB
+        self.assertTrue(reservation.wait(self.stop_run))
+        self.assertIsNone(reservation.oversized_since)
+
+    def test_paused_volume_not_failed(self, message):
+        self.monitor.OVERSIZED_WAIT = 0
+        self.free = 50 * MB
+        reservation = self.monitor.reservation(self.directory.name)
+        with self.assertRaises(InsufficientDiskSpace):
+            reservation.reserve(self.get_partial(60 * MB))
+        self.assertFalse(reservation.check())
+        self.assertFalse(reservation.check())
+
+    def test_disabled_does_not_limit(self, message):
+        self.settings.pause_on_low_disk_space = False
+        self.free = 0
+        self.monitor.reservation(self.directory.name).reserve(self.get_partial(40 * MB))
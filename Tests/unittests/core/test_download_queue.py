@@ -0,0 +1,130 @@
+from queue import Empty
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from DownloaderForReddit.core.download_queue import DownloadQueue
+from DownloaderForReddit.utils import injector
+
+
+class TestDownloadQueue(TestCase):
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.download_priority_order = ['retries_last', 'added_objects_first', 'significant_first',
+                                                 'small_first']
+        self.settings.group_downloads_by_host = False
+        self.settings.host_batch_size = 3
+        self.settings.host_batch_window = 5
+        self.settings.host_limits = {}
+        injector.settings_manager = self.settings
+        injector.host_limiter = None
+        self.queue = DownloadQueue()
+
+    def get_content(self, content_id, kind='image', retry_attempts=0, reddit_object_id=1, significant=True,
+                    host='i.redd.it'):
+        content = MagicMock()
+        content.id = content_id
+        content.url = f'https://{host}/{content_id}.jpg'
+        content.is_image = kind == 'image'
+        content.is_video = kind == 'video'
+        content.retry_attempts = retry_attempts
+        content.post.significant_reddit_object_id = reddit_object_id
+        content.post.significant_reddit_object.significant = significant
+        return content
+
+    def get_all(self):
+        items = []
+        while True:
+            try:
+                items.append(self.queue.get(block=False))
+            except Empty:
+                return items
+
+    def test_small_files_first(self):
+        self.queue.put_content(self.get_content(1, kind='video'))
+        self.queue.put_content(self.get_content(2, kind='gif'))
+        self.queue.put_content(self.get_content(3, kind='image'))
+        self.queue.put_content(self.get_content(4, kind='video'))
+        self.assertEqual([3, 2, 1, 4], self.get_all())
+
+    def test_retries_last(self):
+        self.queue.put_content(self.get_content(1, retry_attempts=2))
+        self.queue.put_content(self.get_content(2, kind='video'))
+        self.assertEqual([2, 1], self.get_all())
+
+    def test_significant_first(self):
+        self.queue.put_content(self.get_content(1, significant=False))
+        self.queue.put_content(self.get_content(2, kind='video'))
+        self.assertEqual([2, 1], self.get_all())
+
+    def test_added_objects_first(self):
+        self.queue.put_content(self.get_content(1, reddit_object_id=1))
+        self.queue.add_reddit_object(2)
+        self.queue.put_content(self.get_content(2, reddit_object_id=2, kind='video'))
+        self.assertEqual([2, 1], self.get_all())
+
+    def test_policy_order_configurable(self):
+        self.settings.download_priority_order = ['small_first', 'retries_last']
+        self.queue.put_content(self.get_content(1, retry_attempts=1))
+        self.queue.put_content(self.get_content(2, kind='video'))
+        self.assertEqual([1, 2], self.get_all())
+
+    def test_hold_returned_after_queued_content(self):
+        self.queue.put(1)
+        self.queue.put('HOLD')
+        self.queue.put(2)
+        self.queue.put(None)
+        self.assertEqual([1, 2, 'HOLD', None], self.get_all())
+
+    def test_release_hold_cancels_pending_hold(self):
+        self.queue.put(1)
+        self.queue.put('HOLD')
+        self.queue.put('RELEASE_HOLD')
+        self.queue.put(2)
+        self.assertEqual([1, 2], self.get_all())
+
+    def test_release_hold_returned_first(self):
+        self.queue.put('HOLD')
+        self.assertEqual('HOLD', self.queue.get())
+        self.queue.put(1)
+        self.queue.put('RELEASE_HOLD')
+        self.assertEqual(['RELEASE_HOLD', 1], self.get_all())
+
+    def test_get_timeout(self):
+        with self.assertRaises(Empty):
+            self.queue.get(timeout=0.05)
+
+    def put_hosts(self, hosts):
+        for content_id, host in enumerate(hosts, start=1):
+            self.queue.put_content(self.get_content(content_id, host=host))
+
+    def test_queued_order_without_host_grouping(self):
+        self.put_hosts(['i.redd.it', 'i.imgur.com', 'i.redd.it', 'i.imgur.com'])
+        self.assertEqual([1, 2, 3, 4], self.get_all())
+
+    def test_grouped_by_host(self):
+        self.settings.group_downloads_by_host = True
+        self.put_hosts(['i.redd.it', 'i.imgur.com', 'i.redd.it', 'i.imgur.com', 'i.redd.it'])
+        self.assertEqual([1, 3, 5, 2, 4], self.get_all())
+        self.assertEqual(2, self.queue.get_stats()['host_batches'])
+
+    def test_host_batch_size_limits_batch(self):
+        self.settings.group_downloads_by_host = True
+        self.put_hosts(['i.redd.it'] * 5 + ['i.imgur.com'])
+        self.assertEqual([1, 2, 3, 6, 4, 5], self.get_all())
+
+    def test_grouping_does_not_pass_priority(self):
+        self.settings.group_downloads_by_host = True
+        self.queue.put_content(self.get_content(1, host='i.redd.it'))
+        self.queue.put_content(self.get_content(2, host='i.imgur.com'))
+        self.queue.put_content(self.get_content(3, host='i.redd.it', kind='video'))
+        self.assertEqual([1, 2, 3], self.get_all())
+
+    def test_items_outside_window_not_moved_ahead(self):
+        self.settings.group_downloads_by_host = True
+        with patch('DownloaderForReddit.core.download_queue.monotonic') as monotonic:
+            for content_id, (host, added) in enumerate([('i.redd.it', 0), ('i.imgur.com', 1), ('i.redd.it', 10)],
+                                                       start=1):
+                monotonic.return_value = added
+                self.queue.put_content(self.get_content(content_id, host=host))
+        self.assertEqual([1, 2, 3], self.get_all())
@@ -30,6 +30,10 @@ class TestDownloadRunner(TestCase):
     def setUpClass(cls):
         cls.now = datetime.now()
         cls.settings_manager = MagicMock()
+        cls.settings_manager.submission_queue_high_watermark = 500
+        cls.settings_manager.submission_queue_low_watermark = 250
+        cls.settings_manager.download_queue_high_watermark = 2000
+        cls.settings_manager.download_queue_low_watermark = 1000
         injector.settings_manager = cls.settings_manager
         injector.database_handler = DatabaseHandler(in_memory=True)
 
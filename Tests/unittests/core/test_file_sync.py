@@ -0,0 +1,129 @@
+import os
+import json
+import tempfile
+import logging
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from DownloaderForReddit.core.errors import Error
+from DownloaderForReddit.core.file_sync import FileSyncBatcher
+from DownloaderForReddit.core.retry_scheduler import RetryScheduler
+from DownloaderForReddit.database.database_handler import DatabaseHandler
+from DownloaderForReddit.database.models import Content, Post
+from DownloaderForReddit.utils import injector
+from Tests.mockobjects.mock_objects import get_post
+
+
+logging.disable(logging.CRITICAL)
+
+
+class TestFileSyncBatcher(TestCase):
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.sync_downloaded_files = True
+        self.settings.file_sync_interval = 60
+        self.settings.max_retry_attempts = 3
+        self.settings.retry_base_delay = 100
+        self.settings.retry_max_delay = 1000
+        injector.retry_scheduler = None
+        injector.settings_manager = self.settings
+        self.directory = tempfile.TemporaryDirectory()
+        self.journal_path = os.path.join(self.directory.name, 'journal.json')
+        self.batcher = FileSyncBatcher(journal_path=self.journal_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_temp(self, name, data=b'data'):
+        path = os.path.join(self.directory.name, name)
+        with open(path + '.part', 'wb') as file:
+            file.write(data)
+        return path + '.part', path
+
+    def load_journal(self):
+        with open(self.journal_path, 'r') as file:
+            return json.load(file)
+
+    def test_finalise_moves_file_and_records_batch(self):
+        temp_path, path = self.write_temp('image.jpg')
+        self.batcher.finalise(temp_path, path)
+        self.assertFalse(os.path.exists(temp_path))
+        self.assertTrue(os.path.exists(path))
+        self.assertIn(os.path.abspath(self.directory.name), self.load_journal())
+        self.batcher.flush()
+        self.assertFalse(os.path.exists(self.journal_path))
+
+    @patch('DownloaderForReddit.core.file_sync.system_util.sync_directory')
+    @patch('DownloaderForReddit.core.file_sync.system_util.sync_file')
+    def test_files_synced_in_batches(self, sync_file, sync_directory):
+        for x in range(3):
+            self.batcher.finalise(*self.write_temp(f'image_{x}.jpg'))
+        sync_file.assert_not_called()
+        self.batcher.flush()
+        self.assertEqual(3, sync_file.call_count)
+        # the directory of the journal is synced once when the batch is opened, as it is the same directory here
+        self.assertEqual(2, sync_directory.call_count)
+        sync_directory.assert_called_with(os.path.abspath(self.directory.name))
+
+    @patch('DownloaderForReddit.core.file_sync.system_util.sync_file')
+    def test_due_batch_synced_on_finalise(self, sync_file):
+        self.settings.file_sync_interval = 0
+        self.batcher.finalise(*self.write_temp('image.jpg'))
+        sync_file.assert_called_once()
+        self.assertFalse(os.path.exists(self.journal_path))
+
+    def test_disabled_does_not_journal(self):
+        self.settings.sync_downloaded_files = False
+        temp_path, path = self.write_temp('image.jpg')
+        self.batcher.finalise(temp_path, path)
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(os.path.exists(self.journal_path))
+
+    def test_recover_resets_content_with_broken_files(self):
+        injector.database_handler = DatabaseHandler(in_memory=True)
+        opened = datetime.now() - timedelta(minutes=1)
+        with open(self.journal_path, 'w') as file:
+            json.dump({os.path.abspath(self.directory.name): opened.isoformat()}, file)
+        with injector.database_handler.get_scoped_session() as session:
+            post = session.query(Post).first() or get_post(session=session)
+            ids = []
+            for title, written, downloaded in [('intact', 4, opened), ('truncated', 2, opened),
+                                               ('missing', 0, opened), ('synced', 2, opened - timedelta(hours=1))]:
+                content = Content(title=title, download_title=title, extension='jpg', url=title, user=post.author,
+                                  subreddit=post.subreddit, post=post, directory_path=self.directory.name,
+                                  downloaded=True, download_date=downloaded, file_size=4)
+                if written:
+                    with open(content.get_full_file_path(), 'wb') as file:
+                        file.write(b'data'[:written])
+                session.add(content)
+                session.commit()
+                ids.append(content.id)
+        self.assertEqual(2, self.batcher.recover())
+        self.assertFalse(os.path.exists(self.journal_path))
+        with injector.database_handler.get_scoped_session() as session:
+            downloaded = [session.query(Content).get(content_id).downloaded for content_id in ids]
+        self.assertEqual([True, False, False, True], downloaded)
+        self.assertFalse(os.path.exists(os.path.join(self.directory.name, 'truncated.jpg')))
+
+    def test_recovered_content_due_for_retry(self):
+        injector.database_handler = DatabaseHandler(in_memory=True)
+        opened = datetime.now() - timedelta(minutes=1)
+        with open(self.journal_path, 'w') as file:
+            json.dump({os.path.abspath(self.directory.name): opened.isoformat()}, file)
+        with injector.database_handler.get_scoped_session() as session:
+            post = get_post(session=session)
+            content = Content(title='missing', download_title='missing', extension='jpg', url='missing',
+                              user=post.author, subreddit=post.subreddit, post=post, directory_path=self.directory.name,
+                              downloaded=True, download_date=opened, file_size=4, etag='etag')
+            session.add(content)
+            session.commit()
+            content_id = content.id
+        self.assertEqual(1, self.batcher.recover())
+        with injector.database_handler.get_scoped_session() as session:
+            content = session.query(Content).get(content_id)
+            self.assertEqual(Error.INTEGRITY_FAILURE, content.download_error)
+            self.assertIsNone(content.etag)
+            due = RetryScheduler.due(session.query(Content), Content.next_retry_at).all()
+            self.assertEqual([content_id], [x.id for x in due])
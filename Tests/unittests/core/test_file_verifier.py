@@ -0,0 +1,167 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from DownloaderForReddit.core import file_verifier
+from DownloaderForReddit.core.download_runner import DownloadRunner
+from DownloaderForReddit.core.errors import Error
+from DownloaderForReddit.core.file_verifier import FileStatus
+from DownloaderForReddit.core.verification_runner import VerificationRunner
+from DownloaderForReddit.database.database_handler import DatabaseHandler
+from DownloaderForReddit.database.models import Content
+from DownloaderForReddit.utils import injector
+from Tests.mockobjects.mock_objects import get_post
+
+
+JPEG_DATA = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00' + os.urandom(1000) + b'\xff\xd9'
+PNG_DATA = b'\x89PNG\r\n\x1a\n' + os.urandom(1000) + b'\x00\x00\x00\x00IEND\xae\x42\x60\x82'
+
+
+class TestFileVerifier(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, data):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'wb') as file:
+            file.write(data)
+        return path
+
+    def test_complete_files_ok(self):
+        for name, data in [('image.jpg', JPEG_DATA), ('image.png', PNG_DATA)]:
+            path = self.write(name, data)
+            status = file_verifier.check_file(path, len(data), file_verifier.read_signature(path))
+            self.assertEqual((FileStatus.OK, None), status)
+
+    def test_missing_file(self):
+        status, _ = file_verifier.check_file(os.path.join(self.directory.name, 'missing.jpg'), 100)
+        self.assertEqual(FileStatus.MISSING, status)
+
+    def test_short_file_truncated(self):
+        path = self.write('image.png', PNG_DATA[:500])
+        status, problem = file_verifier.check_file(path, len(PNG_DATA))
+        self.assertEqual(FileStatus.TRUNCATED, status)
+        self.assertEqual(f'500 of {len(PNG_DATA)} bytes on disk', problem)
+
+    def test_long_file_corrupt(self):
+        path = self.write('image.png', PNG_DATA + b'extra')
+        status, _ = file_verifier.check_file(path, len(PNG_DATA))
+        self.assertEqual(FileStatus.CORRUPT, status)
+
+    def test_missing_trailer_reported(self):
+        data = JPEG_DATA[:-100].replace(b'\xff\xd9', b'\xff\x00')
+        path = self.write('image.jpg', data)
+        self.assertEqual(FileStatus.NO_TRAILER, file_verifier.check_file(path)[0])
+        self.assertEqual(FileStatus.NO_TRAILER, file_verifier.check_file(path, len(data))[0])
+
+    def test_data_after_trailer_ok(self):
+        path = self.write('motion.jpg', JPEG_DATA + b'\x00\x00\x00\x18ftypmp42' + os.urandom(1000))
+        self.assertEqual(FileStatus.OK, file_verifier.check_file(path)[0])
+
+    def test_error_page_corrupt(self):
+        path = self.write('image.jpg', b'<!DOCTYPE html><html><body>Not Found</body></html>')
+        self.assertEqual(FileStatus.CORRUPT, file_verifier.check_file(path)[0])
+        self.assertEqual(FileStatus.OK, file_verifier.check_file(path, media=False)[0])
+
+    def test_unwritten_header_corrupt(self):
+        path = self.write('video.mp4', bytes(1000))
+        status, _ = file_verifier.check_file(path, 1000)
+        self.assertEqual(FileStatus.CORRUPT, status)
+
+    def test_signature_mismatch_corrupt(self):
+        path = self.write('image.png', PNG_DATA)
+        signature = file_verifier.read_signature(path)
+        self.write('image.png', PNG_DATA[:8] + bytes(8) + PNG_DATA[16:])
+        status, _ = file_verifier.check_file(path, len(PNG_DATA), signature)
+        self.assertEqual(FileStatus.CORRUPT, status)
+
+    def test_unknown_format_accepted(self):
+        path = self.write('video.mkv', b'\x01\x02\x03' + os.urandom(100))
+        self.assertEqual(FileStatus.OK, file_verifier.check_file(path)[0])
+
+
+class TestVerificationRunner(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings = MagicMock()
+        self.settings.verification_process_count = 1
+        self.settings.retry_base_delay = 100
+        self.settings.retry_max_delay = 1000
+        self.settings.max_retry_attempts = 3
+        injector.settings_manager = self.settings
+        injector.retry_scheduler = None
+        injector.database_handler = DatabaseHandler(in_memory=True)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def add_content(self, session, post, title, data, expected_size):
+        with open(os.path.join(self.directory.name, f'{title}.png'), 'wb') as file:
+            file.write(data)
+        content = Content(title=title, download_title=title, extension='png', url=title,
+                          directory_path=self.directory.name, user=post.author, subreddit=post.subreddit, post=post,
+                          downloaded=True, expected_size=expected_size, file_size=expected_size, etag='etag')
+        session.add(content)
+        return content
+
+    def test_truncated_content_requeued(self):
+        with injector.database_handler.get_scoped_session() as session:
+            post = get_post(session=session)
+            self.add_content(session, post, 'complete', PNG_DATA, len(PNG_DATA))
+            truncated = self.add_content(session, post, 'truncated', PNG_DATA[:200], len(PNG_DATA))
+            self.add_content(session, post, 'no_trailer', PNG_DATA[:200], 200)
+            session.commit()
+            truncated_id = truncated.id
+
+        runner = VerificationRunner()
+        requeued = []
+        runner.requeue.connect(requeued.append)
+        runner.run()
+
+        self.assertEqual([[truncated_id]], requeued)
+        self.assertFalse(os.path.exists(os.path.join(self.directory.name, 'truncated.png')))
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, 'complete.png')))
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, 'no_trailer.png')))
+        with injector.database_handler.get_scoped_session() as session:
+            content = session.query(Content).get(truncated_id)
+            self.assertFalse(content.downloaded)
+            self.assertEqual(Error.INTEGRITY_FAILURE, content.download_error)
+            self.assertIsNone(content.etag)
+            self.assertIsNotNone(content.next_retry_at)
+        counts = list(runner.report.values())[0]
+        self.assertEqual(1, counts[FileStatus.OK])
+        self.assertEqual(1, counts[FileStatus.TRUNCATED])
+        self.assertEqual(1, counts[FileStatus.NO_TRAILER])
+
+    @patch('DownloaderForReddit.utils.reddit_utils.get_reddit_instance', return_value=None)
+    def test_requeued_content_queued_for_download(self, reddit_instance):
+        self.settings.submission_queue_high_watermark = 0
+        self.settings.submission_queue_low_watermark = 0
+        self.settings.download_queue_high_watermark = 0
+        self.settings.download_queue_low_watermark = 0
+        self.settings.perpetual_download = False
+        self.settings.download_priority_order = ['retries_last']
+        self.settings.host_limits = {}
+        injector.host_limiter = None
+        with injector.database_handler.get_scoped_session() as session:
+            post = get_post(session=session)
+            self.add_content(session, post, 'complete', PNG_DATA, len(PNG_DATA))
+            truncated = self.add_content(session, post, 'truncated', PNG_DATA[:200], len(PNG_DATA))
+            session.commit()
+            truncated_id = truncated.id
+
+        runner = VerificationRunner()
+        requeued = []
+        runner.requeue.connect(requeued.append)
+        runner.run()
+
+        download_runner = DownloadRunner(run_new=False, run_undownloaded=True, undownloaded_id_list=requeued[0])
+        download_runner.run_undownloaded_content()
+        self.assertEqual(1, download_runner.download_queue.qsize())
+        self.assertEqual(truncated_id, download_runner.download_queue.get(timeout=1))
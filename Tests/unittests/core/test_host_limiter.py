@@ -0,0 +1,90 @@
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from threading import Thread
+
+from DownloaderForReddit.core.cancellation import CancellationToken
+from DownloaderForReddit.core.host_limiter import HostLimiter
+from DownloaderForReddit.utils import injector
+
+
+class TestHostLimiter(TestCase):
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.host_limit_defaults = {'max_connections': 8, 'requests_per_second': 1000}
+        self.settings.host_limits = {
+            'imgur.com': {'max_connections': 2, 'requests_per_second': 1000},
+            'redgifs.com': {'requests_per_second': 2},
+        }
+        injector.settings_manager = self.settings
+        self.limiter = HostLimiter()
+
+    def test_get_host_matches_configured_parent_domain(self):
+        self.assertEqual('imgur.com', self.limiter.get_host('https://i.imgur.com/abc.jpg'))
+        self.assertEqual('imgur.com', self.limiter.get_host('https://imgur.com/a/abc'))
+        self.assertEqual('i.redd.it', self.limiter.get_host('https://i.redd.it/abc.jpg'))
+
+    def test_host_limits_merged_with_defaults(self):
+        state = self.limiter.get_state('redgifs.com')
+        self.assertEqual(8, state.max_connections)
+        self.assertEqual(2, state.requests_per_second)
+
+    def test_max_connections_limited(self):
+        url = 'https://i.imgur.com/abc.jpg'
+        self.assertEqual(0, self.limiter.try_acquire(url)[1])
+        self.assertEqual(0, self.limiter.try_acquire(url)[1])
+        self.assertGreater(self.limiter.try_acquire(url)[1], 0)
+        self.limiter.release('imgur.com')
+        self.assertEqual(0, self.limiter.try_acquire(url)[1])
+
+    def test_requests_per_second_limited(self):
+        url = 'https://redgifs.com/watch/abc'
+        for _ in range(2):
+            host, wait = self.limiter.try_acquire(url)
+            self.assertEqual(0, wait)
+            self.limiter.release(host)
+        host, wait = self.limiter.try_acquire(url)
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 0.5)
+
+    def test_acquire_records_wait_time(self):
+        url = 'https://redgifs.com/watch/abc'
+        for _ in range(3):
+            with self.limiter.limit(url) as acquired:
+                self.assertTrue(acquired)
+        stats = self.limiter.get_stats()['redgifs.com']
+        self.assertEqual(3, stats['requests'])
+        self.assertEqual(1, stats['waited_requests'])
+        self.assertGreater(stats['max_wait'], 0)
+
+    def test_acquire_stopped_while_waiting(self):
+        url = 'https://i.imgur.com/abc.jpg'
+        self.limiter.try_acquire(url)
+        self.limiter.try_acquire(url)
+        stop = CancellationToken()
+        stop.set()
+        start = time.monotonic()
+        with self.limiter.limit(url, stop_event=stop) as acquired:
+            self.assertFalse(acquired)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(2, self.limiter.get_state('imgur.com').active)
+
+    def test_stop_wakes_wait_for_connection(self):
+        url = 'https://i.imgur.com/abc.jpg'
+        self.limiter.try_acquire(url)
+        self.limiter.try_acquire(url)
+        stop = CancellationToken()
+        results = []
+        thread = Thread(target=lambda: results.append(self.limiter.acquire(url, stop)), daemon=True)
+        # the host is polled less often than the test waits, so the wait only ends in time if the stop wakes it
+        patcher = patch.object(HostLimiter, 'POLL_INTERVAL', 60)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        thread.start()
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+        stop.set()
+        thread.join(1)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([None], results)
@@ -0,0 +1,150 @@
+import os
+import random
+import tempfile
+from unittest import TestCase, skipIf
+from unittest.mock import MagicMock
+
+from DownloaderForReddit.core import image_hash
+from DownloaderForReddit.core.image_hash import ImageHashIndex, ImageHasher, get_dhash, hamming_distance
+from DownloaderForReddit.core.errors import Error
+from DownloaderForReddit.database.database_handler import DatabaseHandler
+from DownloaderForReddit.database.models import Content, ImageHash
+from DownloaderForReddit.utils import injector
+from Tests.mockobjects.mock_objects import get_post
+
+
+class TestImageHashIndex(TestCase):
+
+    def setUp(self):
+        injector.database_handler = DatabaseHandler(in_memory=True)
+        self.index = ImageHashIndex()
+
+    def test_find_within_distance(self):
+        base = random.getrandbits(64)
+        self.index.add(1, base, 4, check=False)
+        self.index.add(2, base ^ 0b1111111, 4, check=False)
+        self.assertEqual((1, 0), self.index.find(base, 4))
+        self.assertEqual((1, 3), self.index.find(base ^ 0b111, 4))
+        self.assertIsNone(self.index.find(base ^ (0b11111 << 40), 4))
+
+    def test_every_distance_found_by_bands(self):
+        base = random.getrandbits(64)
+        self.index.add(1, base, 6, check=False)
+        for _ in range(100):
+            bits = random.sample(range(64), 6)
+            value = base
+            for bit in bits:
+                value ^= 1 << bit
+            self.assertEqual((1, 6), self.index.find(value, 6))
+
+    def test_add_returns_existing_match(self):
+        base = random.getrandbits(64)
+        self.assertIsNone(self.index.add(1, base, 4))
+        self.assertEqual((1, 1), self.index.add(2, base ^ 1, 4))
+        self.assertNotIn(2, self.index.hashes)
+
+    def test_add_replaces_hash_of_same_content(self):
+        base = random.getrandbits(64)
+        self.index.add(1, base, 4)
+        self.assertIsNone(self.index.add(1, base ^ (0b11111 << 40), 4))
+        self.assertIsNone(self.index.find(base, 4))
+        self.assertEqual((1, 0), self.index.find(base ^ (0b11111 << 40), 4))
+
+    def test_index_loaded_from_database(self):
+        with injector.database_handler.get_scoped_session() as session:
+            post = get_post(session=session)
+            content = Content(title='Test', extension='jpg', url='https://i.redd.it/a.jpg', user=post.author,
+                              subreddit=post.subreddit, post=post, downloaded=True)
+            session.add(content)
+            session.commit()
+            session.add(ImageHash(content_id=content.id, value=image_hash.to_signed(2 ** 63 + 5)))
+            session.commit()
+            content_id = content.id
+        self.assertEqual((content_id, 0), self.index.find(2 ** 63 + 5, 2))
+
+
+@skipIf(image_hash.Image is None, 'Pillow is not installed')
+class TestImageHasher(TestCase):
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.compute_image_hashes = True
+        self.settings.drop_near_duplicate_images = True
+        self.settings.near_duplicate_distance = 6
+        self.settings.image_hash_process_count = 1
+        injector.settings_manager = self.settings
+        injector.database_handler = DatabaseHandler(in_memory=True)
+        injector.image_hash_index = None
+        self.directory = tempfile.TemporaryDirectory()
+        self.image = self.make_image()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_image(self):
+        image = image_hash.Image.new('L', (400, 300))
+        random.seed(4)
+        for x in range(0, 400, 20):
+            for y in range(0, 300, 20):
+                image.paste(random.randint(0, 255), (x, y, x + 20, y + 20))
+        return image
+
+    def save_image(self, name, image, **kwargs):
+        path = os.path.join(self.directory.name, name)
+        image.save(path, **kwargs)
+        return path
+
+    def test_resized_and_recompressed_image_has_close_hash(self):
+        original = get_dhash(self.save_image('original.png', self.image))
+        resized = get_dhash(self.save_image('resized.jpg', self.image.resize((200, 150)), quality=40))
+        self.assertLessEqual(hamming_distance(original, resized), 4)
+        other = get_dhash(self.save_image('other.png', self.image.rotate(90, expand=True)))
+        self.assertGreater(hamming_distance(original, other), 10)
+
+    def test_near_duplicate_dropped(self):
+        self.save_image('original.png', self.image)
+        self.save_image('resized.jpg', self.image.resize((200, 150)), quality=40)
+        content_ids = []
+        with injector.database_handler.get_scoped_session() as session:
+            post = get_post(session=session)
+            for name, extension in (('original', 'png'), ('resized', 'jpg')):
+                content = Content(title=name, download_title=name, extension=extension, url=f'https://x.com/{name}',
+                                  user=post.author, subreddit=post.subreddit, post=post,
+                                  directory_path=self.directory.name, downloaded=True)
+                session.add(content)
+                session.commit()
+                content_ids.append(content.id)
+            hasher = ImageHasher()
+            for content_id in content_ids:
+                hasher.submit(session.query(Content).get(content_id))
+                hasher.shutdown()
+        self.assertEqual(1, hasher.dropped_count)
+        with injector.database_handler.get_scoped_session() as session:
+            original, resized = [session.query(Content).get(x) for x in content_ids]
+            self.assertTrue(original.downloaded)
+            self.assertFalse(resized.downloaded)
+            self.assertEqual(Error.DUPLICATE_CONTENT, resized.download_error)
+            self.assertEqual(2, session.query(ImageHash).count())
+        self.assertFalse(os.path.exists(os.path.join(self.directory.name, 'resized.jpg')))
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, 'original.png')))
+
+    def test_downloaded_again_replaces_hash(self):
+        self.save_image('original.png', self.image)
+        with injector.database_handler.get_scoped_session() as session:
+            post = get_post(session=session)
+            content = Content(title='original', download_title='original', extension='png', url='https://x.com/a',
+                              user=post.author, subreddit=post.subreddit, post=post,
+                              directory_path=self.directory.name, downloaded=True)
+            session.add(content)
+            session.commit()
+            hasher = ImageHasher()
+            hasher.submit(content)
+            hasher.shutdown()
+            changed = get_dhash(self.save_image('original.png', self.image.rotate(90, expand=True)))
+            hasher.submit(content)
+            hasher.shutdown()
+            content_id = content.id
+        self.assertEqual(0, hasher.dropped_count)
+        with injector.database_handler.get_scoped_session() as session:
+            self.assertTrue(session.query(Content).get(content_id).downloaded)
+            self.assertEqual([image_hash.to_signed(changed)], [x.value for x in session.query(ImageHash)])
@@ -0,0 +1,186 @@
+import os
+import tempfile
+import logging
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from threading import Thread
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from DownloaderForReddit.core.cancellation import CancellationToken
+from DownloaderForReddit.core.multipart_downloader import MultipartDownloader
+from DownloaderForReddit.core.multipart_scheduler import MultipartScheduler
+from DownloaderForReddit.core.partial_download import PartialDownload
+from DownloaderForReddit.utils import injector, system_util
+
+
+logging.disable(logging.CRITICAL)
+
+FILE_DATA = os.urandom(10 * 1024 + 17)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+
+    requested_ranges = []
+    # range start: the number of requests for the range that fail before the range is sent
+    failing_ranges = {}
+
+    def do_GET(self):
+        start, end = self.headers['Range'].split('=')[1].split('-')
+        start, end = int(start), min(int(end), len(FILE_DATA) - 1)
+        RangeHandler.requested_ranges.append(start)
+        if RangeHandler.failing_ranges.get(start, 0) > 0:
+            RangeHandler.failing_ranges[start] -= 1
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes {start}-{end}/{len(FILE_DATA)}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(FILE_DATA[start:end + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+class TestMultipartDownloader(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), RangeHandler)
+        cls.server_thread = Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/video.mp4'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.download_thread_count = 1
+        self.settings.multi_part_thread_count = 3
+        self.settings.multi_part_chunk_size = 1024
+        self.settings.multi_part_preallocate = True
+        self.settings.multi_part_adaptive_range_size = False
+        self.settings.multi_part_max_chunk_size = 4096
+        self.settings.multi_part_min_chunk_size = 1024
+        self.settings.multi_part_target_range_seconds = 4
+        self.settings.multi_part_max_in_flight = 4
+        self.settings.use_receive_buffer = True
+        self.settings.download_buffer_size = 64 * 1024
+        self.settings.limit_download_bandwidth = False
+        self.settings.sync_downloaded_files = False
+        self.settings.pause_on_low_disk_space = False
+        self.settings.host_limits = {}
+        self.settings.host_limit_defaults = {'max_connections': 8, 'requests_per_second': 1000}
+        injector.settings_manager = self.settings
+        injector.connection_pool = None
+        injector.range_sizer = None
+        self.stop_run = CancellationToken()
+        self.scheduler = MultipartScheduler(self.stop_run)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'video.mp4')
+        RangeHandler.requested_ranges = []
+        RangeHandler.failing_ranges = {}
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+        self.directory.cleanup()
+
+    def download(self, partial=None):
+        downloader = MultipartDownloader(self.stop_run, self.scheduler)
+        downloader.run(self.url, self.path, len(FILE_DATA), partial=partial)
+        return downloader
+
+    def get_partial(self, completed_ranges, data=FILE_DATA):
+        """Returns a partial download whose preallocated file holds the supplied data for the completed ranges."""
+        partial = PartialDownload(self.path, self.url, size=len(FILE_DATA), validator='"etag"', multi_part=True)
+        with open(partial.part_path, 'wb') as file:
+            file.truncate(len(FILE_DATA))
+            for start, length in completed_ranges:
+                file.seek(start)
+                file.write(data[start:start + length])
+                digest = system_util.new_content_hash()
+                digest.update(FILE_DATA[start:start + length])
+                partial.completed_ranges[start] = (length, digest.hexdigest())
+        partial.save()
+        return partial
+
+    def assert_downloaded(self, downloader, part_count=11):
+        self.assertEqual(part_count, downloader.part_count)
+        self.assertEqual(0, downloader.failed_parts)
+        with open(self.path, 'rb') as file:
+            self.assertEqual(FILE_DATA, file.read())
+        self.assertEqual(['video.mp4'], os.listdir(self.directory.name))
+
+    def test_download_preallocated(self):
+        downloader = self.download()
+        self.assert_downloaded(downloader)
+
+    def test_download_preallocated_adaptive_range_size(self):
+        self.settings.multi_part_adaptive_range_size = True
+        downloader = self.download()
+        sizes = [length for _, length in downloader.ranges]
+        self.assertEqual(1024, sizes[0])
+        self.assertGreater(max(sizes), 1024)
+        self.assert_downloaded(downloader, part_count=len(sizes))
+
+    def test_download_temp_file_parts(self):
+        self.settings.multi_part_preallocate = False
+        downloader = self.download()
+        self.assert_downloaded(downloader)
+
+    @patch('DownloaderForReddit.core.multipart_downloader.MultipartDownloader.preallocate')
+    def test_preallocation_failure_falls_back_to_temp_file_parts(self, preallocate):
+        preallocate.return_value = False
+        downloader = self.download()
+        self.assert_downloaded(downloader)
+
+    def test_completed_temp_file_parts_not_downloaded_again(self):
+        with open(f'{self.path}.part1', 'wb') as file:
+            file.write(FILE_DATA[1024:2048])
+        downloader = self.download()
+        self.assert_downloaded(downloader)
+        self.assertEqual(10, len(RangeHandler.requested_ranges))
+        self.assertNotIn(1024, RangeHandler.requested_ranges)
+
+    def test_failed_range_retried_in_session(self):
+        RangeHandler.failing_ranges = {2048: 3}
+        downloader = self.download()
+        self.assert_downloaded(downloader)
+        self.assertEqual(4, RangeHandler.requested_ranges.count(2048))
+        self.assertEqual(1, RangeHandler.requested_ranges.count(1024))
+
+    def test_only_missing_ranges_downloaded(self):
+        partial = self.get_partial([(1024, 1024), (4096, 2048)])
+        downloader = self.download(partial)
+        partial.finish()
+        self.assert_downloaded(downloader, part_count=8)
+        self.assertEqual([0, 2048, 3072, 6144, 7168, 8192, 9216, 10240], sorted(RangeHandler.requested_ranges))
+        self.assertEqual(system_util.hash_file(self.path).hexdigest(), downloader.content_hash.hexdigest())
+
+    def test_corrupt_range_downloaded_again(self):
+        partial = self.get_partial([(1024, 1024)], data=bytes(len(FILE_DATA)))
+        downloader = self.download(partial)
+        partial.finish()
+        self.assert_downloaded(downloader, part_count=10)
+        self.assertEqual(1, RangeHandler.requested_ranges.count(1024))
+
+    def test_missing_ranges_saved_for_next_attempt(self):
+        RangeHandler.failing_ranges = {2048: 100}
+        partial = self.get_partial([])
+        downloader = self.download(partial)
+        self.assertEqual(1, downloader.failed_parts)
+        self.assertEqual(1024, downloader.missing_bytes)
+        loaded = PartialDownload.load(self.path, self.url)
+        self.assertEqual(10, len(loaded.completed_ranges))
+        self.assertNotIn(2048, loaded.completed_ranges)
+
+        RangeHandler.failing_ranges = {}
+        RangeHandler.requested_ranges = []
+        downloader = self.download(loaded)
+        loaded.finish()
+        self.assertEqual([2048], RangeHandler.requested_ranges)
+        self.assert_downloaded(downloader, part_count=1)
@@ -0,0 +1,88 @@
+import time
+from unittest import TestCase
+from unittest.mock import MagicMock
+from threading import Event, Lock
+
+from DownloaderForReddit.core.multipart_scheduler import MultipartScheduler
+from DownloaderForReddit.utils import injector
+
+
+class TestMultipartScheduler(TestCase):
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.multi_part_max_in_flight = 3
+        self.settings.multi_part_thread_count = 2
+        injector.settings_manager = self.settings
+        self.stop_run = Event()
+        self.scheduler = MultipartScheduler(self.stop_run)
+        self.lock = Lock()
+        self.order = []
+        self.active = {}
+        self.max_active = {}
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+
+    def make_range(self, name, part, delay=0.01):
+        def download_range():
+            with self.lock:
+                self.order.append((name, part))
+                self.active[name] = self.active.get(name, 0) + 1
+                self.active['total'] = self.active.get('total', 0) + 1
+                for key in (name, 'total'):
+                    self.max_active[key] = max(self.max_active.get(key, 0), self.active[key])
+            time.sleep(delay)
+            with self.lock:
+                self.active[name] -= 1
+                self.active['total'] -= 1
+        return download_range
+
+    def test_in_flight_ranges_limited(self):
+        jobs = [self.scheduler.submit([self.make_range(name, x) for x in range(6)]) for name in ('a', 'b', 'c')]
+        for job in jobs:
+            job.wait()
+        self.assertEqual(18, len(self.order))
+        self.assertLessEqual(self.max_active['total'], 3)
+        for name in ('a', 'b', 'c'):
+            self.assertLessEqual(self.max_active[name], 2)
+
+    def test_ranges_from_files_interleaved(self):
+        self.settings.multi_part_max_in_flight = 1
+        self.scheduler = MultipartScheduler(self.stop_run)
+        first = self.scheduler.submit([self.make_range('a', x, delay=0) for x in range(3)])
+        second = self.scheduler.submit([self.make_range('b', x, delay=0) for x in range(3)])
+        first.wait()
+        second.wait()
+        names = [name for name, _ in self.order]
+        self.assertLess(names.index('b'), len(names) - 3)
+
+    def test_stop_cancels_pending_ranges(self):
+        job = self.scheduler.submit([self.make_range('a', x, delay=0.2) for x in range(20)])
+        time.sleep(0.05)
+        self.stop_run.set()
+        self.assertTrue(job.finished.wait(2))
+        self.assertLess(len(self.order), 20)
+
+    def test_shutdown_stops_workers(self):
+        self.scheduler.submit([self.make_range('a', 0)]).wait()
+        self.assertEqual(3, len(self.scheduler.workers))
+        self.scheduler.shutdown()
+        self.assertFalse(any(worker.is_alive() for worker in self.scheduler.workers))
+
+    def test_empty_job_finished(self):
+        job = self.scheduler.submit([])
+        self.assertTrue(job.finished.wait(2))
+
+    def test_ranges_generated_lazily(self):
+        generated = []
+
+        def generate():
+            for x in range(4):
+                generated.append(len(self.order))
+                yield self.make_range('a', x, delay=0)
+
+        self.settings.multi_part_max_in_flight = 1
+        self.scheduler = MultipartScheduler(self.stop_run)
+        self.scheduler.submit(generate()).wait()
+        self.assertEqual([0, 1, 2, 3], generated)
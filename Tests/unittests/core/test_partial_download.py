@@ -0,0 +1,407 @@
+import os
+import time
+import hashlib
+import tempfile
+import logging
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from threading import Thread, Timer, Event
+from queue import Queue
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from DownloaderForReddit.core.cancellation import CancellationToken
+from DownloaderForReddit.core.downloader import Downloader
+from DownloaderForReddit.core.errors import Error
+from DownloaderForReddit.core.partial_download import PartialDownload
+from DownloaderForReddit.database.database_handler import DatabaseHandler
+from DownloaderForReddit.database.models import Content, Post
+from DownloaderForReddit.utils import injector
+from Tests.mockobjects.mock_objects import get_post
+
+
+logging.disable(logging.CRITICAL)
+
+# the header of an mp4 file, so that the downloaded file passes verification
+MP4_HEADER = b'\x00\x00\x00\x18ftypmp42'
+FILE_DATA = MP4_HEADER + os.urandom(256 * 1024 - len(MP4_HEADER))
+FILE_HASH = hashlib.blake2b(FILE_DATA, digest_size=20).hexdigest()
+ETAG = '"abc123"'
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+
+    requests = []
+    send_length = True
+    accept_ranges = True
+    # if set, a full response stops after half of the file until the event is set
+    stall = None
+
+    def do_GET(self):
+        RangeHandler.requests.append(dict(self.headers))
+        range_header = self.headers.get('Range')
+        if self.headers.get('If-None-Match') == ETAG and range_header is None:
+            self.send_response(304)
+            self.send_header('ETag', ETAG)
+            self.end_headers()
+        elif range_header is not None and self.headers.get('If-Range', ETAG) == ETAG:
+            start, end = range_header.split('=')[1].split('-')
+            start = int(start)
+            end = int(end) if end else len(FILE_DATA) - 1
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(FILE_DATA)}')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('ETag', ETAG)
+            self.end_headers()
+            self.wfile.write(FILE_DATA[start:end + 1])
+        else:
+            self.send_response(200)
+            if self.send_length:
+                self.send_header('Content-Length', str(len(FILE_DATA)))
+            if self.accept_ranges:
+                self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', ETAG)
+            self.end_headers()
+            if self.stall is not None:
+                self.wfile.write(FILE_DATA[:len(FILE_DATA) // 2])
+                self.wfile.flush()
+                self.stall.wait(5)
+                self.close_connection = True
+                return
+            self.wfile.write(FILE_DATA)
+
+    def log_message(self, *args):
+        pass
+
+
+@patch('DownloaderForReddit.core.downloader.Message')
+class TestPartialDownload(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), RangeHandler)
+        cls.server_thread = Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/video.mp4'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.download_thread_count = 2
+        self.settings.multi_part_thread_count = 2
+        self.settings.multi_part_max_in_flight = 4
+        self.settings.use_receive_buffer = True
+        self.settings.download_buffer_size = 64 * 1024
+        self.settings.limit_download_bandwidth = False
+        self.settings.sync_downloaded_files = False
+        self.settings.pause_on_low_disk_space = False
+        self.settings.use_multi_part_downloader = False
+        self.settings.multi_part_threshold = 64 * 1024
+        self.settings.multi_part_chunk_size = 32 * 1024
+        self.settings.multi_part_preallocate = True
+        self.settings.multi_part_adaptive_range_size = False
+        self.settings.multi_part_max_chunk_size = 64 * 1024
+        self.settings.multi_part_min_chunk_size = 16 * 1024
+        self.settings.multi_part_target_range_seconds = 4
+        self.settings.match_file_modified_to_post_date = False
+        self.settings.host_limits = {}
+        self.settings.host_limit_defaults = {'max_connections': 8, 'requests_per_second': 100}
+        injector.settings_manager = self.settings
+        injector.connection_pool = None
+        injector.directory_index = None
+        injector.database_handler = DatabaseHandler(in_memory=True)
+        self.directory = tempfile.TemporaryDirectory()
+        RangeHandler.requests = []
+        RangeHandler.send_length = True
+        RangeHandler.accept_ranges = True
+        RangeHandler.stall = None
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_content(self, download_title=None):
+        with injector.database_handler.get_scoped_session() as session:
+            post = session.query(Post).first() or get_post(session=session)
+            content = Content(title='Test Content', extension='mp4', url=self.url, user=post.author,
+                              subreddit=post.subreddit, post=post, directory_path=self.directory.name,
+                              download_title=download_title)
+            session.add(content)
+            session.commit()
+            return content.id, content.get_full_file_path()
+
+    def download(self, content_id, stop_run=None):
+        downloader = Downloader(Queue(), 1, stop_run or CancellationToken())
+        downloader.download(content_id)
+        with injector.database_handler.get_scoped_session() as session:
+            return session.query(Content).get(content_id)
+
+    def write_partial(self, path, byte_count, validator=ETAG):
+        partial = PartialDownload(path, self.url, size=len(FILE_DATA), validator=validator)
+        with partial.open() as file:
+            file.write(FILE_DATA[:byte_count])
+            partial.add(FILE_DATA[:byte_count])
+        partial.save()
+
+    def test_download_removes_partial_files(self, message):
+        content_id, _ = self.create_content()
+        content = self.download(content_id)
+        self.assertTrue(content.downloaded)
+        path = content.get_full_file_path()
+        with open(path, 'rb') as file:
+            self.assertEqual(FILE_DATA, file.read())
+        self.assertFalse(os.path.exists(path + PartialDownload.PART_SUFFIX))
+        self.assertFalse(PartialDownload.exists(path))
+
+    def test_resume_partial_download(self, message):
+        content_id, path = self.create_content(download_title='Test Content')
+        self.write_partial(path, 100000)
+        content = self.download(content_id)
+        self.assertTrue(content.downloaded)
+        self.assertEqual('Test Content', content.download_title)
+        self.assertEqual('bytes=100000-', RangeHandler.requests[0]['Range'])
+        with open(path, 'rb') as file:
+            self.assertEqual(FILE_DATA, file.read())
+        self.assertFalse(PartialDownload.exists(path))
+
+    def test_changed_file_restarts_download(self, message):
+        content_id, path = self.create_content(download_title='Test Content')
+        self.write_partial(path, 100000, validator='"old"')
+        content = self.download(content_id)
+        self.assertTrue(content.downloaded)
+        with open(content.get_full_file_path(), 'rb') as file:
+            self.assertEqual(FILE_DATA, file.read())
+
+    def test_partial_download_for_other_url_discarded(self, message):
+        path = os.path.join(self.directory.name, 'file.mp4')
+        self.write_partial(path, 1000)
+        self.assertIsNone(PartialDownload.load(path, 'https://example.com/other.mp4'))
+        self.assertFalse(os.path.exists(path + PartialDownload.PART_SUFFIX))
+
+    def test_new_content_does_not_use_partial_download_path(self, message):
+        _, path = self.create_content(download_title='Test Content')
+        self.write_partial(path, 1000)
+        content_id, _ = self.create_content()
+        content = self.download(content_id)
+        self.assertEqual('Test Content(1)', content.download_title)
+
+    def test_weak_etag_not_used_as_validator(self, message):
+        headers = {'ETag': 'W/"abc"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+        self.assertEqual('Wed, 21 Oct 2015 07:28:00 GMT', PartialDownload.get_validator(headers))
+
+    def test_resumed_download_hashes_whole_file(self, message):
+        content_id, path = self.create_content(download_title='Test Content')
+        self.write_partial(path, 100000)
+        content = self.download(content_id)
+        self.assertEqual(FILE_HASH, content.content_hash)
+
+    def test_duplicate_content_linked(self, message):
+        first_id, _ = self.create_content()
+        first = self.download(first_id)
+        second_id, _ = self.create_content()
+        second = self.download(second_id)
+        self.assertEqual(FILE_HASH, first.content_hash)
+        self.assertEqual(FILE_HASH, second.content_hash)
+        self.assertNotEqual(first.get_full_file_path(), second.get_full_file_path())
+        self.assertTrue(os.path.samefile(first.get_full_file_path(), second.get_full_file_path()))
+
+    def test_duplicate_content_keeps_original_modify_time(self, message):
+        self.settings.match_file_modified_to_post_date = True
+        first = self.download(self.create_content()[0])
+        first_modified = os.path.getmtime(first.get_full_file_path())
+        second_id, _ = self.create_content()
+        with injector.database_handler.get_scoped_session() as session:
+            # the same file from another url is downloaded in full instead of being found not modified
+            session.query(Content).get(second_id).url = f'{self.url}?copy'
+            session.query(Post).first().date_posted = datetime(2015, 6, 1)
+            session.commit()
+        second = self.download(second_id)
+        self.assertTrue(os.path.samefile(first.get_full_file_path(), second.get_full_file_path()))
+        self.assertEqual(first_modified, os.path.getmtime(first.get_full_file_path()))
+
+    def test_duplicate_content_not_linked_when_disabled(self, message):
+        self.settings.link_duplicate_content = False
+        first = self.download(self.create_content()[0])
+        second = self.download(self.create_content()[0])
+        self.assertFalse(os.path.samefile(first.get_full_file_path(), second.get_full_file_path()))
+
+    def test_multi_part_download_reuses_first_response(self, message):
+        self.settings.use_multi_part_downloader = True
+        content = self.download(self.create_content()[0])
+        self.assertTrue(content.downloaded)
+        with open(content.get_full_file_path(), 'rb') as file:
+            self.assertEqual(FILE_DATA, file.read())
+        ranges = [request.get('Range') for request in RangeHandler.requests]
+        # the first range is read from the response to the initial request, so the remaining 7 ranges are requested
+        self.assertEqual(8, len(ranges))
+        self.assertIsNone(ranges[0])
+        self.assertNotIn('bytes=0-32767', ranges)
+        self.assertEqual(FILE_HASH, content.content_hash)
+
+    def test_multi_part_download_resumes_missing_ranges(self, message):
+        self.settings.use_multi_part_downloader = True
+        content_id, path = self.create_content(download_title='Test Content')
+        chunk_size = self.settings.multi_part_chunk_size
+        partial = PartialDownload(path, self.url, size=len(FILE_DATA), validator=ETAG, bytes_received=chunk_size,
+                                  multi_part=True)
+        with open(partial.part_path, 'wb') as file:
+            file.truncate(len(FILE_DATA))
+            file.write(FILE_DATA[:chunk_size * 2])
+        digest = hashlib.blake2b(FILE_DATA[chunk_size:chunk_size * 2], digest_size=20).hexdigest()
+        partial.completed_ranges[chunk_size] = (chunk_size, digest)
+        partial.save()
+        content = self.download(content_id)
+        self.assertTrue(content.downloaded)
+        with open(path, 'rb') as file:
+            self.assertEqual(FILE_DATA, file.read())
+        ranges = [request.get('Range') for request in RangeHandler.requests]
+        # the resume request finds the range after the received bytes complete, so only the last 6 ranges are requested
+        self.assertEqual(7, len(ranges))
+        self.assertEqual(f'bytes={chunk_size}-', ranges[0])
+        self.assertNotIn(f'bytes={chunk_size}-{chunk_size * 2 - 1}', ranges)
+        self.assertEqual(FILE_HASH, content.content_hash)
+        self.assertFalse(PartialDownload.exists(path))
+
+    def test_multi_part_not_used_without_accept_ranges(self, message):
+        self.settings.use_multi_part_downloader = True
+        RangeHandler.accept_ranges = False
+        content = self.download(self.create_content()[0])
+        self.assertTrue(content.downloaded)
+        self.assertEqual(1, len(RangeHandler.requests))
+
+    def test_download_without_content_length(self, message):
+        self.settings.use_multi_part_downloader = True
+        RangeHandler.send_length = False
+        content = self.download(self.create_content()[0])
+        self.assertTrue(content.downloaded)
+        with open(content.get_full_file_path(), 'rb') as file:
+            self.assertEqual(FILE_DATA, file.read())
+
+    def test_download_records_validators(self, message):
+        content = self.download(self.create_content()[0])
+        self.assertEqual(ETAG, content.etag)
+        self.assertEqual(len(FILE_DATA), content.file_size)
+        self.assertNotIn('If-None-Match', RangeHandler.requests[0])
+
+    def test_not_modified_content_from_same_url_linked(self, message):
+        first = self.download(self.create_content()[0])
+        second = self.download(self.create_content()[0])
+        self.assertTrue(second.downloaded)
+        self.assertEqual(ETAG, RangeHandler.requests[1].get('If-None-Match'))
+        self.assertEqual(FILE_HASH, second.content_hash)
+        self.assertEqual(ETAG, second.etag)
+        self.assertTrue(os.path.samefile(first.get_full_file_path(), second.get_full_file_path()))
+
+    def test_not_modified_content_copied_through_temp_file(self, message):
+        self.settings.link_duplicate_content = False
+        first = self.download(self.create_content()[0])
+        batcher = injector.get_file_sync_batcher()
+        with patch.object(batcher, 'finalise', wraps=batcher.finalise) as finalise:
+            second = self.download(self.create_content()[0])
+        path = second.get_full_file_path()
+        finalise.assert_called_once_with(path + PartialDownload.PART_SUFFIX, path)
+        self.assertEqual(ETAG, RangeHandler.requests[1].get('If-None-Match'))
+        self.assertFalse(os.path.samefile(first.get_full_file_path(), path))
+        self.assertFalse(os.path.exists(path + PartialDownload.PART_SUFFIX))
+        with open(path, 'rb') as file:
+            self.assertEqual(FILE_DATA, file.read())
+
+    def test_not_modified_content_re_fetched(self, message):
+        content_id, _ = self.create_content()
+        path = self.download(content_id).get_full_file_path()
+        content = self.download(content_id)
+        self.assertTrue(content.downloaded)
+        self.assertEqual(path, content.get_full_file_path())
+        self.assertEqual(2, len(RangeHandler.requests))
+
+    def test_changed_file_not_used_as_validator_source(self, message):
+        first = self.download(self.create_content()[0])
+        with open(first.get_full_file_path(), 'ab') as file:
+            file.write(b'changed')
+        second = self.download(self.create_content()[0])
+        self.assertNotIn('If-None-Match', RangeHandler.requests[1])
+        self.assertFalse(os.path.samefile(first.get_full_file_path(), second.get_full_file_path()))
+
+    @patch('DownloaderForReddit.core.disk_space.Message')
+    def test_download_paused_while_disk_space_low(self, disk_message, message):
+        self.settings.pause_on_low_disk_space = True
+        self.settings.minimum_free_disk_space = 2 ** 62
+        injector.disk_space_monitor = None
+        injector.get_disk_space_monitor().POLL_INTERVAL = 0.05
+        requests_while_paused = []
+
+        def free_space():
+            requests_while_paused.append(len(RangeHandler.requests))
+            self.settings.minimum_free_disk_space = 0
+
+        timer = Timer(0.3, free_space)
+        timer.start()
+        start = time.perf_counter()
+        content = self.download(self.create_content()[0])
+        self.assertGreater(time.perf_counter() - start, 0.3)
+        self.assertEqual([0], requests_while_paused)
+        self.assertTrue(content.downloaded)
+        self.assertIsNone(content.download_error)
+
+    @patch('DownloaderForReddit.core.disk_space.Message')
+    def test_download_that_does_not_fit_failed_for_retry(self, disk_message, message):
+        self.settings.pause_on_low_disk_space = True
+        self.settings.minimum_free_disk_space = 1024
+        self.settings.max_retry_attempts = 3
+        self.settings.retry_base_delay = 100
+        self.settings.retry_max_delay = 1000
+        injector.retry_scheduler = None
+        injector.disk_space_monitor = None
+        self.addCleanup(setattr, injector, 'disk_space_monitor', None)
+        monitor = injector.get_disk_space_monitor()
+        monitor.POLL_INTERVAL = 0.05
+        monitor.OVERSIZED_WAIT = 0.2
+        disk_usage = MagicMock(free=1024 + len(FILE_DATA) // 2)
+        with patch('DownloaderForReddit.core.disk_space.shutil.disk_usage', return_value=disk_usage):
+            content = self.download(self.create_content()[0])
+        self.assertEqual(1, len(RangeHandler.requests))
+        self.assertFalse(content.downloaded)
+        self.assertEqual(Error.INSUFFICIENT_DISK_SPACE, content.download_error)
+        self.assertIsNotNone(content.next_retry_at)
+        disk_message.send_warning.assert_called_once()
+
+    def test_download_deferred_while_circuit_open(self, message):
+        self.settings.use_circuit_breaker = True
+        self.settings.circuit_breaker_failure_threshold = 1
+        self.settings.circuit_breaker_cooldown = 60
+        injector.circuit_breaker = None
+        self.addCleanup(setattr, injector, 'circuit_breaker', None)
+        injector.get_circuit_breaker().admit(self.url).record_failure()
+        content = self.download(self.create_content()[0])
+        self.assertEqual([], RangeHandler.requests)
+        self.assertFalse(content.downloaded)
+        self.assertIsNone(content.download_error)
+        self.assertEqual(0, content.retry_attempts)
+        self.assertGreater(content.next_retry_at, datetime.now() + timedelta(seconds=50))
+
+    def test_stopped_download_interrupted_and_resumed(self, message):
+        self.settings.max_retry_attempts = 3
+        self.settings.retry_base_delay = 100
+        self.settings.retry_max_delay = 1000
+        injector.retry_scheduler = None
+        content_id, path = self.create_content(download_title='Test Content')
+        RangeHandler.stall = Event()
+        self.addCleanup(RangeHandler.stall.set)
+        stop_run = CancellationToken()
+        Timer(0.3, stop_run.set).start()
+        start = time.perf_counter()
+        content = self.download(content_id, stop_run)
+        self.assertLess(time.perf_counter() - start, 1.5)
+        self.assertFalse(content.downloaded)
+        self.assertEqual(Error.DOWNLOAD_STOPPED, content.download_error)
+        self.assertEqual(len(FILE_DATA) // 2, PartialDownload.load(path, self.url).bytes_received)
+
+        RangeHandler.stall.set()
+        RangeHandler.stall = None
+        content = self.download(content_id)
+        self.assertTrue(content.downloaded)
+        self.assertEqual(f'bytes={len(FILE_DATA) // 2}-', RangeHandler.requests[-1]['Range'])
+        with open(path, 'rb') as file:
+            self.assertEqual(FILE_DATA, file.read())
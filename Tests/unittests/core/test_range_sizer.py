@@ -0,0 +1,77 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from DownloaderForReddit.core.range_sizer import RangeSizer
+from DownloaderForReddit.utils import injector
+
+
+MB = 1024 * 1024
+
+
+class TestRangeSizer(TestCase):
+
+    url = 'https://v.redd.it/abc/DASH_720.mp4'
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.multi_part_chunk_size = MB
+        self.settings.multi_part_max_chunk_size = 64 * MB
+        self.settings.multi_part_min_chunk_size = MB // 4
+        self.settings.multi_part_target_range_seconds = 4
+        self.settings.host_limits = {}
+        injector.settings_manager = self.settings
+        injector.host_limiter = None
+        self.sizer = RangeSizer()
+
+    def test_first_range_uses_chunk_size(self):
+        self.assertEqual(MB, self.sizer.get_range_size(self.url))
+
+    def test_fast_host_grows_toward_target(self):
+        sizes = []
+        for _ in range(10):
+            size = self.sizer.get_range_size(self.url)
+            sizes.append(size)
+            # 4 MB/s with no latency: a 4 second range is 16 MB
+            self.sizer.record(self.url, size, 0, size / (4 * MB))
+        self.assertEqual([MB, 2 * MB, 4 * MB, 8 * MB, 16 * MB], sizes[:5])
+        self.assertEqual(16 * MB, sizes[-1])
+
+    def test_size_limited_to_max(self):
+        self.settings.multi_part_max_chunk_size = 4 * MB
+        for _ in range(10):
+            size = self.sizer.get_range_size(self.url)
+            self.sizer.record(self.url, size, 0, 0.01)
+        self.assertEqual(4 * MB, self.sizer.get_range_size(self.url))
+
+    def test_slow_host_shrinks_to_min_size(self):
+        self.sizer.hosts['v.redd.it'] = self.sizer.get_history('v.redd.it')
+        self.sizer.hosts['v.redd.it'].size = 32 * MB
+        for _ in range(10):
+            size = self.sizer.get_range_size(self.url)
+            self.sizer.record(self.url, size, 2, size / (100 * 1024))
+        self.assertEqual(MB // 4, self.sizer.get_range_size(self.url))
+
+    def test_slow_host_shrinks_below_chunk_size(self):
+        sizes = []
+        for _ in range(3):
+            size = self.sizer.get_range_size(self.url)
+            sizes.append(size)
+            # 100 KB/s with 1 second latency: 3 seconds of transfer is 300 KB
+            self.sizer.record(self.url, size, 1, size / (100 * 1024))
+        self.assertEqual([MB, MB // 2, 300 * 1024], sizes)
+
+    def test_min_size_not_above_chunk_size(self):
+        self.settings.multi_part_min_chunk_size = 4 * MB
+        self.assertEqual(MB, self.sizer.min_size)
+
+    def test_history_kept_per_host_across_sessions(self):
+        for _ in range(3):
+            size = self.sizer.get_range_size(self.url)
+            self.sizer.record(self.url, size, 0, size / (4 * MB))
+        self.sizer.reset_stats()
+        self.assertEqual({}, self.sizer.get_stats())
+        self.assertEqual(8 * MB, self.sizer.get_range_size(self.url))
+        self.assertEqual(MB, self.sizer.get_range_size('https://i.imgur.com/abc.mp4'))
+        stats = self.sizer.get_stats()['v.redd.it']
+        self.assertEqual(1, stats['ranges'])
+        self.assertEqual(8 * MB, stats['max_size'])
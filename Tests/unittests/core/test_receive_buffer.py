@@ -0,0 +1,96 @@
+import os
+import gzip
+from unittest import TestCase
+from unittest.mock import MagicMock
+from threading import Thread
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import requests
+
+from DownloaderForReddit.core.connection_pool import ConnectionPool
+from DownloaderForReddit.core.receive_buffer import ReceiveBuffer
+from DownloaderForReddit.utils import injector
+
+
+FILE_DATA = os.urandom(100 * 1024 + 7)
+
+
+class FileHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = FILE_DATA
+        self.send_response(200)
+        if self.path == '/encoded':
+            body = gzip.compress(FILE_DATA)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.path == '/truncated':
+            body = body[:1000]
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestReceiveBuffer(TestCase):
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.match_connection_pool_to_thread_count = False
+        self.settings.connection_pool_size = 4
+        self.settings.use_http2 = False
+        self.settings.use_receive_buffer = True
+        self.settings.download_buffer_size = 16 * 1024
+        injector.settings_manager = self.settings
+        self.server = HTTPServer(('127.0.0.1', 0), FileHandler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self.pool = ConnectionPool()
+        self.receive_buffer = ReceiveBuffer()
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def read(self, path='/file'):
+        chunks = []
+        with self.pool.get(self.url + path, stream=True, timeout=10) as response:
+            for chunk in self.receive_buffer.iter_response(response):
+                chunks.append((type(chunk), bytes(chunk)))
+        return chunks
+
+    def test_response_read_into_thread_buffer(self):
+        chunks = self.read()
+        self.assertEqual(FILE_DATA, b''.join(chunk for _, chunk in chunks))
+        self.assertEqual({memoryview}, {chunk_type for chunk_type, _ in chunks})
+        self.assertEqual(16 * 1024, max(len(chunk) for _, chunk in chunks))
+
+    def test_buffer_reused_per_thread(self):
+        buffer = self.receive_buffer.get_buffer()
+        self.assertIs(buffer, self.receive_buffer.get_buffer())
+        other = []
+        thread = Thread(target=lambda: other.append(self.receive_buffer.get_buffer()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(buffer, other[0])
+        self.settings.download_buffer_size = 32 * 1024
+        self.assertEqual(32 * 1024, len(self.receive_buffer.get_buffer()))
+
+    def test_connection_reused_after_read(self):
+        for _ in range(3):
+            self.read()
+        self.assertEqual(1, self.pool.get_stats()['new_connections'])
+
+    def test_encoded_response_decoded_by_iter_content(self):
+        chunks = self.read('/encoded')
+        self.assertEqual(FILE_DATA, b''.join(chunk for _, chunk in chunks))
+        self.assertEqual({bytes}, {chunk_type for chunk_type, _ in chunks})
+
+    def test_truncated_response_raises_request_exception(self):
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            self.read('/truncated')
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from DownloaderForReddit.core.errors import Error
+from DownloaderForReddit.core.retry_scheduler import RetryScheduler
+from DownloaderForReddit.database.database_handler import DatabaseHandler
+from DownloaderForReddit.database.models import Content
+from DownloaderForReddit.utils import injector
+from Tests.mockobjects.mock_objects import get_post
+
+
+class TestRetryScheduler(TestCase):
+
+    def setUp(self):
+        self.settings = MagicMock()
+        self.settings.retry_base_delay = 100
+        self.settings.retry_max_delay = 1000
+        self.settings.max_retry_attempts = 3
+        injector.settings_manager = self.settings
+        injector.retry_scheduler = None
+        self.scheduler = RetryScheduler()
+        self.now = datetime(2020, 1, 1)
+
+    def get_delay(self, error, attempts):
+        next_retry_at = self.scheduler.get_next_retry_at(error, attempts, now=self.now)
+        return None if next_retry_at is None else (next_retry_at - self.now).total_seconds()
+
+    def test_delay_doubles_with_jitter(self):
+        for attempts, full_delay in [(1, 100), (2, 200), (3, 400)]:
+            for _ in range(20):
+                delay = self.get_delay(Error.CONNECTION_ERROR, attempts)
+                self.assertGreaterEqual(delay, full_delay / 2)
+                self.assertLessEqual(delay, full_delay)
+
+    def test_error_delay_factor(self):
+        delay = self.get_delay(Error.UNSUCCESSFUL_RESPONSE, 1)
+        self.assertGreaterEqual(delay, 100)
+        self.assertLessEqual(delay, 200)
+
+    def test_delay_capped_at_max_delay(self):
+        self.settings.max_retry_attempts = 0
+        delay = self.get_delay(Error.CONNECTION_ERROR, 10)
+        self.assertGreaterEqual(delay, 500)
+        self.assertLessEqual(delay, 1000)
+
+    def test_permanent_errors_not_retried(self):
+        self.assertIsNone(self.get_delay(Error.DOES_NOT_EXIST, 1))
+        self.assertIsNone(self.get_delay(Error.UNSUPPORTED_DOMAIN, 1))
+
+    def test_not_retried_after_max_attempts(self):
+        self.assertIsNotNone(self.get_delay(Error.CONNECTION_ERROR, 3))
+        self.assertIsNone(self.get_delay(Error.CONNECTION_ERROR, 4))
+
+    def test_stopped_download_retried_immediately(self):
+        self.assertEqual(0, self.get_delay(Error.DOWNLOAD_STOPPED, 10))
+
+    def test_rate_limit_waits_for_imgur_reset(self):
+        reset_time = self.now + timedelta(hours=2)
+        with patch('DownloaderForReddit.core.retry_scheduler.imgur_utils.credit_reset_time', reset_time.timestamp()):
+            delay = self.get_delay(Error.RATE_LIMIT_ERROR, 1)
+        self.assertGreaterEqual(delay, 7200)
+        self.assertLessEqual(delay, 7300)
+
+    def test_due_items_found(self):
+        injector.database_handler = DatabaseHandler(in_memory=True)
+        with injector.database_handler.get_scoped_session() as session:
+            post = get_post(session=session)
+            for title, next_retry_at in [('due', self.now - timedelta(minutes=1)),
+                                         ('waiting', self.now + timedelta(minutes=1)), ('never', None)]:
+                session.add(Content(title=title, url=title, user=post.author, subreddit=post.subreddit, post=post,
+                                    next_retry_at=next_retry_at))
+            session.commit()
+            due = RetryScheduler.due(session.query(Content), Content.next_retry_at, now=self.now)
+            self.assertEqual(['due'], [content.title for content in due])
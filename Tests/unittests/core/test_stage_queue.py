@@ -0,0 +1,62 @@
+import time
+from threading import Thread, Event
+from unittest import TestCase
+
+from DownloaderForReddit.core.stage_queue import StageQueue
+
+
+class TestStageQueue(TestCase):
+
+    def setUp(self):
+        self.stop_run = Event()
+        self.queue = StageQueue('test', high_watermark=4, low_watermark=2, stop_run=self.stop_run)
+
+    def start_producer(self, count):
+        thread = Thread(target=lambda: [self.queue.put(x) for x in range(count)], daemon=True)
+        thread.start()
+        return thread
+
+    def test_items_returned_in_order(self):
+        for x in range(3):
+            self.queue.put(x)
+        self.assertEqual([0, 1, 2], [self.queue.get() for _ in range(3)])
+
+    def test_producer_blocked_at_high_watermark(self):
+        producer = self.start_producer(6)
+        time.sleep(0.2)
+        self.assertEqual(4, self.queue.qsize())
+        self.assertTrue(producer.is_alive())
+
+    def test_producer_resumed_at_low_watermark(self):
+        producer = self.start_producer(6)
+        time.sleep(0.2)
+        self.queue.get()
+        time.sleep(0.2)
+        # one item taken is not enough to bring the queue down to the low watermark
+        self.assertEqual(3, self.queue.qsize())
+        self.queue.get()
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(4, self.queue.qsize())
+        self.assertEqual(1, self.queue.get_stats()['blocked_count'])
+
+    def test_control_items_not_blocked(self):
+        for x in range(4):
+            self.queue.put(x)
+        self.queue.put('HOLD')
+        self.queue.put(None)
+        self.assertEqual(4, self.queue.qsize())
+        self.assertEqual([0, 1, 2, 3, 'HOLD', None], [self.queue.get() for _ in range(6)])
+
+    def test_stop_releases_blocked_producer(self):
+        producer = self.start_producer(6)
+        time.sleep(0.2)
+        self.stop_run.set()
+        producer.join(2)
+        self.assertFalse(producer.is_alive())
+
+    def test_unbounded_queue(self):
+        queue = StageQueue('test')
+        for x in range(1000):
+            queue.put(x)
+        self.assertEqual(1000, queue.qsize())
@@ -102,7 +102,8 @@ class TestSubmissionHandler(TestCase):
         self.handler.extract_link(url, extra_arg='extra')
 
         assign.assert_called_with(url)
-        extractor_class.assert_called_with(self.post, url=url, submission=self.submission, extra_arg='extra')
+        extractor_class.assert_called_with(self.post, url=url, submission=self.submission,
+                                           cancel_token=self.handler.stop_run, extra_arg='extra')
         finish.assert_called_with(extractor, text_link_extraction=False)
 
     @patch(f'{PATH}.handle_unsupported_domain')
@@ -151,6 +152,8 @@ class TestSubmissionHandler(TestCase):
 
     def test_finish_extractor_successful(self):
         extractor = MagicMock()
+        extractor.deferred_retry_after = None
+        extractor.stopped = False
         extractor.failed_extraction = False
         content = MagicMock()
         content.id = 482
@@ -161,10 +164,12 @@ class TestSubmissionHandler(TestCase):
         extractor.extract_content.assert_called()
         self.post.set_extracted.assert_called()
         self.post.set_extraction_failed.assert_not_called()
-        self.mock_queue.put.assert_called_with(482)
+        self.mock_queue.put_content.assert_called_with(content)
 
     def test_finish_extractor_unsuccessful(self):
         extractor = MagicMock()
+        extractor.deferred_retry_after = None
+        extractor.stopped = False
         extractor.failed_extraction = True
         extractor.extraction_error = Error.FAILED_TO_LOCATE
         extractor.failed_extraction_message = 'Extraction failed'
@@ -174,10 +179,34 @@ class TestSubmissionHandler(TestCase):
         extractor.extract_content.assert_called()
         self.post.set_extracted.assert_not_called()
         self.post.set_extraction_failed.assert_called_with(Error.FAILED_TO_LOCATE, extractor.failed_extraction_message)
-        self.mock_queue.put.assert_not_called()
+        self.mock_queue.put_content.assert_not_called()
+
+    def test_finish_extractor_stopped(self):
+        extractor = MagicMock()
+        extractor.deferred_retry_after = None
+        extractor.stopped = True
+        extractor.failed_extraction = True
+        extractor.extracted_content = []
+
+        self.handler.finish_extractor(extractor)
+
+        self.post.set_extracted.assert_not_called()
+        self.post.set_extraction_failed.assert_not_called()
+
+    def test_finish_extractor_deferred(self):
+        extractor = MagicMock()
+        extractor.deferred_retry_after = 120
+        extractor.failed_extraction = False
+        extractor.extracted_content = []
+
+        self.handler.finish_extractor(extractor)
+
+        self.post.set_extraction_deferred.assert_called_with(120)
+        self.post.set_extracted.assert_not_called()
+        self.post.set_extraction_failed.assert_not_called()
 
     def test_finish_extractor_null_extractor_value(self):
         self.handler.finish_extractor(None)
         self.post.set_extracted.assert_not_called()
         self.post.set_extraction_failed.assert_not_called()
-        self.mock_queue.put.assert_not_called()
+        self.mock_queue.put_content.assert_not_called()
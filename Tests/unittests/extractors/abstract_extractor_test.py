@@ -10,6 +10,9 @@ class ExtractorTest(TestCase):
     @classmethod
     def setUpClass(cls):
         cls.settings = MagicMock()
+        cls.settings.host_limits = {}
+        cls.settings.host_limit_defaults = {'max_connections': 8, 'requests_per_second': 100}
+        cls.settings.use_http2 = False
         injector.settings_manager = cls.settings
 
     def setUp(self):
@@ -1,6 +1,9 @@
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
 
+from DownloaderForReddit.core.cancellation import CancellationToken, Cancelled
+from DownloaderForReddit.core.circuit_breaker import CircuitOpen
+from DownloaderForReddit.core.errors import Error
 from DownloaderForReddit.extractors.base_extractor import BaseExtractor
 from DownloaderForReddit.utils import injector
 
@@ -12,6 +15,11 @@ class TestDownloadRunner(TestCase):
     @classmethod
     def setUpClass(cls):
         cls.settings = MagicMock()
+        cls.settings.host_limits = {}
+        cls.settings.host_limit_defaults = {'max_connections': 8, 'requests_per_second': 100}
+        cls.settings.use_http2 = False
+        cls.settings.circuit_breaker_failure_threshold = 5
+        cls.settings.circuit_breaker_cooldown = 60
         injector.settings_manager = cls.settings
 
     @patch('requests.get')
@@ -117,3 +125,61 @@ class TestDownloadRunner(TestCase):
         get.assert_called_with(url, timeout=10)
         self.assertIsNone(response_text)
         handle_failed.assert_called()
+
+    @patch('requests.get')
+    def test_stopped_wait_for_host_slot_not_requested(self, get):
+        token = CancellationToken()
+        token.cancel()
+        base_extractor = BaseExtractor(MagicMock(), cancel_token=token)
+        base_extractor.host_limiter = MagicMock()
+        base_extractor.host_limiter.limit.return_value.__enter__.return_value = False
+        connection_pool = MagicMock()
+        injector.connection_pool = connection_pool
+
+        with self.assertRaises(Cancelled):
+            base_extractor.get_json('https://gfycat.com/api')
+
+        base_extractor.host_limiter.limit.assert_called_with('https://gfycat.com/api', token)
+        connection_pool.request.assert_not_called()
+        get.assert_not_called()
+        injector.connection_pool = None
+
+    def test_request_made_through_connection_pool_with_token(self):
+        token = CancellationToken()
+        connection_pool = MagicMock()
+        injector.connection_pool = connection_pool
+        base_extractor = BaseExtractor(MagicMock(), cancel_token=token)
+
+        response = base_extractor.get_response('https://v.redd.it/audio', method='head')
+
+        connection_pool.request.assert_called_with('HEAD', 'https://v.redd.it/audio', token, timeout=10)
+        self.assertEqual(connection_pool.request.return_value, response)
+        injector.connection_pool = None
+
+    @patch('DownloaderForReddit.extractors.base_extractor.Message')
+    def test_circuit_open_defers_extraction(self, message):
+        base_extractor = BaseExtractor(MagicMock())
+        base_extractor.circuit_breaker = MagicMock()
+        base_extractor.circuit_breaker.guard.side_effect = CircuitOpen('gfycat.com', 120)
+
+        try:
+            base_extractor.get_json('https://gfycat.com/api')
+        except Exception:
+            pass
+        base_extractor.handle_failed_extract(error=Error.FAILED_TO_LOCATE, message='Failed to locate content')
+
+        self.assertEqual(120, base_extractor.deferred_retry_after)
+        self.assertFalse(base_extractor.failed_extraction)
+        message.send_extraction_error.assert_not_called()
+
+    @patch('DownloaderForReddit.extractors.base_extractor.Message')
+    def test_failure_while_handling_other_error_not_deferred(self, message):
+        base_extractor = BaseExtractor(MagicMock())
+        try:
+            raise CircuitOpen('gfycat.com', 120)
+        except CircuitOpen:
+            base_extractor.handle_failed_extract(error=Error.FAILED_TO_LOCATE, message='Failed to locate content')
+
+        self.assertIsNone(base_extractor.deferred_retry_after)
+        self.assertTrue(base_extractor.failed_extraction)
+        self.assertEqual(Error.FAILED_TO_LOCATE, base_extractor.extraction_error)
@@ -67,7 +67,7 @@ class TestImgurExtractor(ExtractorTest):
         ie = ImgurExtractor(post)
         ie.extract_album()
 
-        img_mock.assert_called_with('Bi63r')
+        img_mock.assert_called_with('Bi63r', cancel_token=None)
         self.check_output_multiple(ie, self.url_extract_dict['ALBUM'], post)
 
     @patch(f'{UTILS}.get_single_image')
@@ -82,7 +82,7 @@ class TestImgurExtractor(ExtractorTest):
         ie = ImgurExtractor(post)
         ie.extract_single()
 
-        img_mock.assert_called_with('fb2yRj0')
+        img_mock.assert_called_with('fb2yRj0', cancel_token=None)
         self.check_output(ie, url, post)
 
     def test_extract_direct(self, filter_content, make_title, make_dir_path):
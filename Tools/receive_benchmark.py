@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+"""
+Compares the two ways that download responses can be read: iter_content, which allocates a new chunk for every read,
+and the receive buffer, which reads into a buffer that each thread reuses.  A local HTTP server is started in its own
+process so that only the downloading side is measured, and each mode downloads the same files with the same number of
+threads through the shared connection pool, writing the data to the null device.
+
+For each mode the wall time, throughput and the CPU time used by the downloading process are reported, followed by a
+second run with tracemalloc enabled that reports the memory allocated while reading the responses.
+
+    python Tools/receive_benchmark.py --threads 32 --downloads 20 --size 16
+"""
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from types import SimpleNamespace
+from multiprocessing import Process, Queue
+from threading import Thread, Barrier
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DownloaderForReddit.core.connection_pool import ConnectionPool
+from DownloaderForReddit.core.receive_buffer import ReceiveBuffer
+from DownloaderForReddit.utils import injector
+
+
+MB = 1024 * 1024
+
+
+def serve(size, port_queue):
+    data = memoryview(os.urandom(size))
+
+    class FileHandler(BaseHTTPRequestHandler):
+
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            for start in range(0, size, MB):
+                self.wfile.write(data[start:start + MB])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FileHandler)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def download(pool, receive_buffer, url, count, use_receive_buffer):
+    with open(os.devnull, 'wb') as file:
+        for _ in range(count):
+            with pool.get(url, stream=True, timeout=30) as response:
+                if use_receive_buffer:
+                    chunks = receive_buffer.iter_response(response)
+                else:
+                    chunks = response.iter_content(injector.settings_manager.download_buffer_size)
+                for chunk in chunks:
+                    file.write(chunk)
+
+
+def run(url, args, use_receive_buffer, trace=False):
+    """Downloads the files with every thread and returns the wall time, CPU time and peak traced memory."""
+    pool = ConnectionPool()
+    receive_buffer = ReceiveBuffer()
+    barrier = Barrier(args.threads + 1)
+
+    def worker():
+        barrier.wait()
+        download(pool, receive_buffer, url, args.downloads, use_receive_buffer)
+
+    threads = [Thread(target=worker) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    if trace:
+        tracemalloc.start()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    pool.close()
+    return wall, cpu, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the download receive paths against a local HTTP server')
+    parser.add_argument('--threads', type=int, default=32, help='number of download threads')
+    parser.add_argument('--downloads', type=int, default=10, help='number of files downloaded by each thread')
+    parser.add_argument('--size', type=int, default=16, help='size of each file in MiB')
+    parser.add_argument('--buffer-size', type=int, default=1024, help='chunk and buffer size in KiB')
+    args = parser.parse_args()
+
+    injector.settings_manager = SimpleNamespace(
+        match_connection_pool_to_thread_count=False,
+        connection_pool_size=args.threads,
+        use_http2=False,
+        use_receive_buffer=True,
+        download_buffer_size=args.buffer_size * 1024,
+    )
+    port_queue = Queue()
+    server = Process(target=serve, args=(args.size * MB, port_queue), daemon=True)
+    server.start()
+    url = f'http://127.0.0.1:{port_queue.get()}/file'
+    total = args.threads * args.downloads * args.size
+
+    print(f'{args.threads} threads, {args.downloads} downloads of {args.size} MiB each, '
+          f'{args.buffer_size} KiB chunks\n')
+    print(f'{"mode":<16}{"wall (s)":>10}{"MiB/s":>10}{"cpu (s)":>10}{"cpu/GiB":>10}{"peak alloc (MiB)":>18}')
+    try:
+        for name, use_receive_buffer in (('iter_content', False), ('receive_buffer', True)):
+            wall, cpu, _ = run(url, args, use_receive_buffer)
+            _, _, peak = run(url, args, use_receive_buffer, trace=True)
+            print(f'{name:<16}{wall:>10.2f}{total / wall:>10.0f}{cpu:>10.2f}{cpu / (total / 1024):>10.2f}'
+                  f'{peak / MB:>18.1f}')
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
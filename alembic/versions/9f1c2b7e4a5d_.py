@@ -0,0 +1,27 @@
+"""empty message
+
+Revision ID: 9f1c2b7e4a5d
+Revises: 6dabad0d34fb
+Create Date: 2026-10-18 14:02:11.512207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f1c2b7e4a5d'
+down_revision = '6dabad0d34fb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('content', sa.Column('content_hash', sa.String(), nullable=True))
+    op.create_index('ix_content_content_hash', 'content', ['content_hash'])
+
+
+def downgrade():
+    op.drop_index('ix_content_content_hash', 'content')
+    with op.batch_alter_table('content') as batch:
+        batch.drop_column('content_hash')
@@ -0,0 +1,36 @@
+"""empty message
+
+Revision ID: a7d2e4f9c1b6
+Revises: f3b8d1c6a2e9
+Create Date: 2026-10-18 23:05:19.274106
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d2e4f9c1b6'
+down_revision = 'f3b8d1c6a2e9'
+branch_labels = None
+depends_on = None
+
+ERRORS = ['UNSUCCESSFUL_RESPONSE', 'UNSUPPORTED_DOMAIN', 'DOES_NOT_EXIST', 'FAILED_TO_LOCATE', 'FORBIDDEN',
+          'TEXT_LINK_FAILURE', 'FAILED_TO_EXTRACT', 'FAILED_SELF_POST', 'DUPLICATE_CONTENT', 'FAILED_FILTER',
+          'MULTIPART_FAILURE', 'UNKNOWN_ERROR', 'CONNECTION_ERROR', 'DOWNLOAD_STOPPED', 'TEXT_FAILURE',
+          'UNRECOGNIZED_EXTENSION', 'RATE_LIMIT_ERROR', 'CREDIT_ERROR', 'INTEGRITY_FAILURE']
+
+
+def upgrade():
+    # sqlite can not alter a check constraint, so the table is recreated with the new error in the download error's
+    # constraint
+    with op.batch_alter_table('content', recreate='always', reflect_args=[
+            sa.Column('download_error', sa.Enum(*ERRORS, 'INSUFFICIENT_DISK_SPACE', name='error'), nullable=True)]):
+        pass
+
+
+def downgrade():
+    op.execute("UPDATE content SET download_error = 'UNKNOWN_ERROR' WHERE download_error = 'INSUFFICIENT_DISK_SPACE'")
+    with op.batch_alter_table('content', recreate='always', reflect_args=[
+            sa.Column('download_error', sa.Enum(*ERRORS, name='error'), nullable=True)]):
+        pass
@@ -0,0 +1,35 @@
+"""empty message
+
+Revision ID: c4e8a1d0f3b6
+Revises: 9f1c2b7e4a5d
+Create Date: 2026-10-18 15:37:48.204913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a1d0f3b6'
+down_revision = '9f1c2b7e4a5d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'image_hash',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('content_id', sa.Integer(), nullable=True),
+        sa.Column('value', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['content_id'], ['content.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_image_hash_content_id', 'image_hash', ['content_id'], unique=True)
+    op.create_index('ix_image_hash_value', 'image_hash', ['value'])
+
+
+def downgrade():
+    op.drop_index('ix_image_hash_value', 'image_hash')
+    op.drop_index('ix_image_hash_content_id', 'image_hash')
+    op.drop_table('image_hash')
@@ -0,0 +1,29 @@
+"""empty message
+
+Revision ID: d7a3f5b2c9e1
+Revises: c4e8a1d0f3b6
+Create Date: 2026-10-18 16:41:37.208153
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a3f5b2c9e1'
+down_revision = 'c4e8a1d0f3b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('content', sa.Column('etag', sa.String(), nullable=True))
+    op.add_column('content', sa.Column('last_modified', sa.String(), nullable=True))
+    op.add_column('content', sa.Column('file_size', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('content') as batch:
+        batch.drop_column('file_size')
+        batch.drop_column('last_modified')
+        batch.drop_column('etag')
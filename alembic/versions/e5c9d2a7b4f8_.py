@@ -0,0 +1,39 @@
+"""empty message
+
+Revision ID: e5c9d2a7b4f8
+Revises: d7a3f5b2c9e1
+Create Date: 2026-10-18 19:12:05.631842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c9d2a7b4f8'
+down_revision = 'd7a3f5b2c9e1'
+branch_labels = None
+depends_on = None
+
+NON_DOWNLOADABLE = "('UNSUPPORTED_DOMAIN', 'DOES_NOT_EXIST', 'FAILED_TO_LOCATE', 'FORBIDDEN', 'DUPLICATE_CONTENT')"
+
+
+def upgrade():
+    op.add_column('post', sa.Column('next_retry_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_post_next_retry_at', 'post', ['next_retry_at'])
+    op.add_column('content', sa.Column('next_retry_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_content_next_retry_at', 'content', ['next_retry_at'])
+    # items that would have been retried before retries were scheduled are made due straight away
+    op.execute(f"UPDATE post SET next_retry_at = '2000-01-01 00:00:00.000000' WHERE extracted = 0 "
+               f"AND retry_attempts <= 3 AND extraction_error NOT IN {NON_DOWNLOADABLE}")
+    op.execute(f"UPDATE content SET next_retry_at = '2000-01-01 00:00:00.000000' WHERE downloaded = 0 "
+               f"AND retry_attempts <= 3 AND download_error NOT IN {NON_DOWNLOADABLE}")
+
+
+def downgrade():
+    op.drop_index('ix_content_next_retry_at', 'content')
+    with op.batch_alter_table('content') as batch:
+        batch.drop_column('next_retry_at')
+    op.drop_index('ix_post_next_retry_at', 'post')
+    with op.batch_alter_table('post') as batch:
+        batch.drop_column('next_retry_at')
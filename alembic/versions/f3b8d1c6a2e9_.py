@@ -0,0 +1,39 @@
+"""empty message
+
+Revision ID: f3b8d1c6a2e9
+Revises: e5c9d2a7b4f8
+Create Date: 2026-10-18 21:37:44.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d1c6a2e9'
+down_revision = 'e5c9d2a7b4f8'
+branch_labels = None
+depends_on = None
+
+ERRORS = ['UNSUCCESSFUL_RESPONSE', 'UNSUPPORTED_DOMAIN', 'DOES_NOT_EXIST', 'FAILED_TO_LOCATE', 'FORBIDDEN',
+          'TEXT_LINK_FAILURE', 'FAILED_TO_EXTRACT', 'FAILED_SELF_POST', 'DUPLICATE_CONTENT', 'FAILED_FILTER',
+          'MULTIPART_FAILURE', 'UNKNOWN_ERROR', 'CONNECTION_ERROR', 'DOWNLOAD_STOPPED', 'TEXT_FAILURE',
+          'UNRECOGNIZED_EXTENSION', 'RATE_LIMIT_ERROR', 'CREDIT_ERROR']
+
+
+def upgrade():
+    op.add_column('content', sa.Column('expected_size', sa.Integer(), nullable=True))
+    op.add_column('content', sa.Column('file_signature', sa.String(), nullable=True))
+    # sqlite can not alter a check constraint, so the table is recreated with the new error in the download error's
+    # constraint
+    with op.batch_alter_table('content', recreate='always', reflect_args=[
+            sa.Column('download_error', sa.Enum(*ERRORS, 'INTEGRITY_FAILURE', name='error'), nullable=True)]):
+        pass
+
+
+def downgrade():
+    op.execute("UPDATE content SET download_error = 'UNKNOWN_ERROR' WHERE download_error = 'INTEGRITY_FAILURE'")
+    with op.batch_alter_table('content', recreate='always', reflect_args=[
+            sa.Column('download_error', sa.Enum(*ERRORS, name='error'), nullable=True)]) as batch:
+        batch.drop_column('file_signature')
+        batch.drop_column('expected_size')
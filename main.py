@@ -26,6 +26,7 @@ along with Downloader for Reddit.  If not, see <http://www.gnu.org/licenses/>.
 
 import ctypes
 import sys
+import multiprocessing
 from PyQt5 import QtWidgets, QtCore
 import logging
 
@@ -93,4 +94,6 @@ def main():
 
 
 if __name__ == '__main__':
+    # required for the image hash process pool to work in the frozen windows build
+    multiprocessing.freeze_support()
     main()